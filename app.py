@@ -1,151 +1,389 @@
 # app.py
+import base64
+import csv
+import io
+import json
 import os
+import re
 import sqlite3
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from flask import Flask, request, jsonify, g, has_app_context
 from flask_cors import CORS
 
+import arquivo
+import db
+import esquema
+import eventos
+import grade
+import instrumentacao
+import manutencao
+import nucleo
+import recorrencias
+import relatorios
+import reservas
+from escritor import Escritor, EscritorIndisponivel
+from nucleo import data_eh_passada, formatar_telefone, normalizar_data
+
 app = Flask(__name__)
 CORS(app)
 
 # Caminho ABSOLUTO para o SQLite (evita "arquivo não encontrado" em produção)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_NAME = os.path.join(BASE_DIR, "barbearia.db")
-
-# ---------- Utils ----------
-def formatar_telefone(numero: str) -> str:
-    numero = ''.join(filter(str.isdigit, numero))
-    if len(numero) == 11:
-        return f"({numero[:2]}) {numero[2:7]}-{numero[7:]}"
-    if len(numero) == 10:
-        return f"({numero[:2]}) {numero[2:6]}-{numero[6:]}"
-    return numero or ""
-
-def normalizar_data(txt: str) -> str | None:
-    if not txt:
-        return None
-    raw = txt.strip().lower()
-    if raw == "hoje":
-        return datetime.today().strftime("%Y-%m-%d")
-    if raw in ("amanha", "amanhã"):
-        return (datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d")
-    if raw.isdigit() and len(raw) == 8:
-        for fmt in ("%d%m%Y", "%Y%m%d"):
-            try:
-                return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
-            except ValueError:
-                pass
-        return None
-    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%Y.%m.%d"):
-        try:
-            return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-    return None
+DB_NAME = nucleo.caminho_banco()
 
-def data_eh_passada(data_iso: str) -> bool:
-    try:
-        d = datetime.strptime(data_iso, "%Y-%m-%d").date()
-        return d < datetime.today().date()
-    except Exception:
-        return True
+# Instrumentação opcional: Server-Timing + histogramas em /metrics (METRICAS=1)
+METRICAS = os.environ.get("METRICAS", "0") == "1"
+
+# Pool de conexões do worker (PRAGMAs aplicados uma vez por conexão)
+pool = nucleo.abrir_pool(DB_NAME, classe=instrumentacao.PoolMedido if METRICAS else db.PoolConexoes)
+
+def liberar_conexao():
+    """Devolve ao pool a conexão do request atual, se houver (o próximo conn() pega outra)."""
+    c = g.pop("_db", None) if has_app_context() else None
+    if c is not None:
+        pool.devolver(c)
+
+# Escritor único: toda escrita das rotas passa por uma fila e sai em lotes (group commit).
+# Quem espera o lote não segura conexão do pool: as leituras não ficam sem conexão num burst
+escritor = Escritor(pool, max_lote=int(os.environ.get("ESCRITOR_MAX_LOTE", "64")),
+                    janela=float(os.environ.get("ESCRITOR_JANELA_MS", "0")) / 1000,
+                    espera=float(os.environ.get("ESCRITOR_ESPERA_S", "30")),
+                    ao_esperar=liberar_conexao)
+
+# Arquivamento em fundo: finalizados/cancelados com mais de ARQUIVO_DIAS dias vão para o
+# histórico a cada ARQUIVO_INTERVALO segundos (0 desliga), em lotes de ARQUIVO_LOTE
+arquivador = arquivo.Arquivador(escritor, dias=int(os.environ.get("ARQUIVO_DIAS", "14")),
+                                lote=int(os.environ.get("ARQUIVO_LOTE", "500")),
+                                intervalo=float(os.environ.get("ARQUIVO_INTERVALO", "3600")))
+
+# Manutenção em fundo nos intervalos sem escrita (MANUTENCAO_QUIETO_S): checkpoint do WAL,
+# incremental_vacuum/optimize e snapshots em BACKUP_DIR (padrão: backups/ ao lado do banco) pela
+# API de backup. Intervalos em segundos; 0 desliga a tarefa (MANUTENCAO_TIQUE=0 desliga a thread).
+# A conversão do auto_vacuum espera o escritor até CONVERTER_ESPERA_S (VACUUM completo)
+manutentor = manutencao.Manutencao(
+    pool, escritor,
+    tique=float(os.environ.get("MANUTENCAO_TIQUE", "1")),
+    quieto=float(os.environ.get("MANUTENCAO_QUIETO_S", "2")),
+    intervalo_vacuo=float(os.environ.get("VACUO_INTERVALO", "3600")),
+    paginas_vacuo=int(os.environ.get("VACUO_PAGINAS", "256")),
+    intervalo_otimizar=float(os.environ.get("OTIMIZAR_INTERVALO", "3600")),
+    pasta_backup=os.environ.get("BACKUP_DIR"),
+    intervalo_backup=float(os.environ.get("BACKUP_INTERVALO", "86400")),
+    paginas_backup=int(os.environ.get("BACKUP_PAGINAS", "256")),
+    pausa_backup=float(os.environ.get("BACKUP_PAUSA_MS", "5")) / 1000,
+    manter_backups=int(os.environ.get("BACKUP_MANTER", "7")),
+    espera_converter=float(os.environ.get("CONVERTER_ESPERA_S", "3600")))
+
+# Grade semanal pré-calculada (GRADE_HORARIOS aponta para um JSON opcional)
+GRADE = grade.carregar_grade(os.environ.get("GRADE_HORARIOS"))
+GRADE_MIN = tuple(tuple(reservas.minutos(h) for h in dia) for dia in GRADE)  # p/ bisect
+MAX_DIAS_SLOTS = 62
+MAX_DIAS_AGENDA = 62
+
+# Dias bloqueados + recorrências (expandidas um mês por vez) em memória;
+# invalidação cross-process via PRAGMA data_version (pega também as escritas do CLI)
+calendario = nucleo.Calendario(DB_NAME, intervalo=float(os.environ.get("BLOQUEIOS_CACHE_TTL", "0.5")))
+cache_bloqueios = calendario.bloqueios
+cache_recorrencias = calendario.recorrencias
+HORIZONTE_RECORRENCIA = 365  # dias checados contra conflitos ao criar uma regra
+
+# Pub/sub das mudanças da agenda (SSE em /agendamentos/stream).
+# Sob waitress cada stream ocupa uma thread: manter SSE_MAX_ASSINANTES < --threads.
+barramento = eventos.Barramento(max_assinantes=int(os.environ.get("SSE_MAX_ASSINANTES", "16")))
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", "15"))
 
 def conn():
-    c = sqlite3.connect(DB_NAME, timeout=10, check_same_thread=False)
-    c.row_factory = sqlite3.Row
-    # melhora concorrência e evita "database is locked"
-    c.execute("PRAGMA foreign_keys = ON")
-    c.execute("PRAGMA journal_mode=WAL")
+    """Conexão do request atual: emprestada do pool e devolvida no teardown."""
+    c = g.get("_db")
+    if c is None:
+        c = g._db = pool.obter()
     return c
 
+def escrever(sql: str, params=()):
+    """Um statement pelo escritor (group commit): (rowcount, lastrowid, linhas do RETURNING)."""
+    def executar(c):
+        cur = c.execute(sql, params)
+        linhas = cur.fetchall()
+        return cur.rowcount, cur.lastrowid, linhas
+    return escritor.executar(executar)
+
+@app.teardown_appcontext
+def devolver_conexao(exc):
+    liberar_conexao()
+
+@app.before_request
+def zerar_espera_lock():
+    db.espera_lock_thread()
+    escritor.tempos_thread()
+
+@app.before_request
+def iniciar_arquivador():
+    arquivador.garantir()
+    manutentor.garantir()
+
+@app.after_request
+def informar_espera_lock(resp):
+    # só aparece quando o request esperou o lock de escrita (usado pelo bench.py); nas
+    # escritas o BEGIN IMMEDIATE roda na thread do escritor e a espera volta com o item
+    espera = db.espera_lock_thread() + escritor.tempos_thread()["lock"]
+    if espera:
+        resp.headers["X-DB-Lock-Wait"] = f"{espera * 1000:.1f}"
+    return resp
+
+if METRICAS:
+    instrumentacao.instalar(app, escritor)
+
+@app.errorhandler(db.PoolEsgotado)
+def pool_esgotado(exc):
+    return jsonify(error="Servidor ocupado, tente novamente."), 503
+
+@app.errorhandler(EscritorIndisponivel)
+def escritor_indisponivel(exc):
+    return jsonify(error="Servidor ocupado, tente novamente."), 503
+
 def criar_tabelas():
-    c = conn(); cur = c.cursor()
-    # Tabela principal (com coluna 'servico')
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS agendamentos (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      nome_cliente TEXT NOT NULL,
-      telefone TEXT NOT NULL,
-      data TEXT NOT NULL,
-      hora TEXT NOT NULL,
-      servico TEXT,
-      status TEXT DEFAULT 'agendado',
-      criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    # Migração: adiciona 'servico' se faltar
-    cur.execute("PRAGMA table_info(agendamentos)")
-    cols = {r["name"] for r in cur.fetchall()}
-    if "servico" not in cols:
-        cur.execute("ALTER TABLE agendamentos ADD COLUMN servico TEXT")
-
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_ag_data ON agendamentos(data)")
-    # evita dois 'agendado' no MESMO slot (data+hora)
-    cur.execute("""
-    CREATE UNIQUE INDEX IF NOT EXISTS ux_ag_slot_agendado
-      ON agendamentos(data, hora) WHERE status='agendado'
-    """)
-
-    # Bloqueios de DIA
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS bloqueios (
-      dia TEXT PRIMARY KEY,
-      motivo TEXT,
-      criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_blk_dia ON bloqueios(dia)")
-    c.commit(); c.close()
-
-def data_bloqueada(data_iso: str):
-    c = conn(); cur = c.cursor()
-    cur.execute("SELECT motivo FROM bloqueios WHERE dia = ?", (data_iso,))
-    row = cur.fetchone(); c.close()
-    return (True, row["motivo"] if row else None) if row else (False, None)
+    with pool.conexao() as c:
+        esquema.migrar(c)
+
+# dias/horários fechados (mesmas regras e caches do CLI)
+data_bloqueada = calendario.data_bloqueada
+dias_bloqueados = calendario.dias_bloqueados
+ocupados_recorrentes = calendario.ocupados_recorrentes
+livre_de_recorrencias = calendario.livre_de_recorrencias
+
+# ---------- GET condicional (ETag / Last-Modified) ----------
+def validadores(geracoes: tuple[str, ...], dia: str | None = None):
+    """
+    (etag, last_modified) a partir de `geracoes`/`versoes_dia`: uma leitura por PK,
+    sem tocar em `agendamentos`.
+    """
+    marcas = ",".join("?" * len(geracoes))
+    cur = conn().execute(f"""
+        SELECT nome, versao, alterado_em FROM geracoes WHERE nome IN ({marcas})
+        UNION ALL
+        SELECT '@dia', versao, alterado_em FROM versoes_dia WHERE data = ?""", (*geracoes, dia))
+    versoes = {}; ultimo = None
+    for nome, versao, alterado_em in cur:
+        versoes[nome] = versao
+        if alterado_em and (ultimo is None or alterado_em > ultimo):
+            ultimo = alterado_em
+    partes = [f"{n[0]}{versoes.get(n, 0)}" for n in geracoes]
+    if dia:
+        partes.append(f"{dia}.{versoes.get('@dia', 0)}")
+    last_modified = datetime.strptime(ultimo, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc) if ultimo else None
+    return "-".join(partes), last_modified
+
+def nao_modificado(etag: str):
+    """Resposta 304 se o cliente já tem essa versão, senão None."""
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+    return None
+
+def com_validadores(resp, etag: str, last_modified):
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = "no-cache"  # pode guardar, mas sempre revalida
+    return resp
+
+# ---------- Validação de entrada (rotas unitárias e lotes) ----------
+def profissionais_ativos() -> list[int]:
+    return [r[0] for r in conn().execute("SELECT id FROM profissionais WHERE ativo = 1 ORDER BY id")]
+
+def ler_profissional(body: dict, padrao=None):
+    """(id, None) — `padrao` se ausente —, ou (None, (mensagem, status)) se não for um profissional ativo."""
+    valor = body.get("profissional_id")
+    if valor is None:
+        return padrao, None
+    if not isinstance(valor, int) or valor not in profissionais_ativos():
+        return None, ("Profissional inválido ou inativo.", 400)
+    return valor, None
+
+def ler_campos(txt: str | None):
+    """(colunas, None) de `fields=a,b` (ausente = todas), ou (None, (mensagem, status))."""
+    if not txt:
+        return reservas.COLUNAS, None
+    campos = tuple(f.strip() for f in txt.split(",") if f.strip())
+    if not campos or any(f not in reservas.COLUNAS for f in campos):
+        return None, (f"fields aceita: {', '.join(reservas.COLUNAS)}.", 400)
+    return campos, None
+
+def ler_hora(txt: str) -> str | None:
+    """"9:00" -> "09:00"; None se vazio ou inválido."""
+    try:
+        return grade.normalizar_hora(txt) if (txt or "").strip() else None
+    except ValueError:
+        return None
+
+def ler_servico(txt: str):
+    """(nome, duracao_min): nome canônico do catálogo; fora do catálogo vale a duração padrão."""
+    nome = (txt or "").strip() or None
+    return reservas.servico_do_catalogo(conn(), nome) or (nome, reservas.DURACAO_PADRAO)
+
+def ler_reserva(body: dict):
+    """(dados, None) prontos para reservas.reservar, ou (None, (mensagem, status))."""
+    servico, duracao = ler_servico(body.get("servico"))
+    dados = dict(nome=(body.get("nome") or "").strip(),
+                 telefone=formatar_telefone(body.get("telefone") or ""),
+                 data=normalizar_data(body.get("data") or ""),
+                 hora=ler_hora(body.get("hora")),
+                 servico=servico, duracao_min=duracao)
+    if not (dados["nome"] and dados["telefone"] and dados["data"] and dados["hora"]):
+        return None, ("Campos obrigatórios: nome, telefone, data, hora (HH:MM).", 400)
+    # sem profissional: o INSERT escolhe qualquer um livre no horário
+    dados["profissional_id"], erro = ler_profissional(body)
+    if erro:
+        return None, erro
+    if data_eh_passada(dados["data"]):
+        return None, ("Não é permitido agendar em data passada.", 400)
+    bloqueada, motivo = data_bloqueada(dados["data"])
+    if bloqueada:
+        return None, (f"Data bloqueada ({dados['data']}). Motivo: {motivo or '—'}", 409)
+    return dados, None
+
+def ler_alteracao(body: dict):
+    """(campos, nova_data, None) para reservas.atualizar, ou (None, None, (mensagem, status))."""
+    alvo_data = normalizar_data(body.get("data") or "")
+    alvo_hora = ler_hora(body.get("hora"))
+    alvo_status = (body.get("status") or "").strip()
+    if body.get("hora") and not alvo_hora:
+        return None, None, ("Horário inválido (use HH:MM).", 400)
+
+    # validações de data/hora/dia bloqueado (a sobreposição fica com reservas.atualizar)
+    if body.get("data"):
+        if not alvo_data:
+            return None, None, ("Data inválida.", 400)
+        if data_eh_passada(alvo_data):
+            return None, None, ("Não é permitido alterar para data passada.", 400)
+        blk, mot = data_bloqueada(alvo_data)
+        if blk:
+            return None, None, (f"Não é permitido alterar para data bloqueada ({alvo_data}). Motivo: {mot or '—'}", 409)
+
+    if body.get("status") and alvo_status not in reservas.STATUS_VALIDOS:
+        return None, None, ("Status inválido.", 400)
+    profissional, erro = ler_profissional(body)
+    if erro:
+        return None, None, erro
+
+    # monta update dinâmico (campo vazio mantém o valor atual)
+    campos = {}
+    if "nome" in body:
+        campos["nome_cliente"] = (body["nome"] or "").strip()
+    if "telefone" in body:
+        campos["telefone"] = formatar_telefone(body["telefone"] or "")
+    if "servico" in body:
+        campos["servico"], campos["duracao_min"] = ler_servico(body["servico"])
+    if alvo_data:
+        campos["data"] = alvo_data
+    if alvo_hora:
+        campos["hora"] = alvo_hora
+    if alvo_status:
+        campos["status"] = alvo_status
+    if profissional is not None:
+        campos["profissional_id"] = profissional
+    return campos, alvo_data, None
+
+def ler_slot(body: dict):
+    """((data, hora, profissional_id), None) ou (None, (mensagem, status))."""
+    data_iso = normalizar_data(body.get("data") or "")
+    hora = ler_hora(body.get("hora"))
+    if not (data_iso and hora):
+        return None, ("Campos obrigatórios: data, hora (HH:MM).", 400)
+    if data_eh_passada(data_iso):
+        return None, ("Não é permitido bloquear horário em data passada.", 400)
+    profissional, erro = ler_profissional(body, reservas.PROFISSIONAL_PADRAO)
+    if erro:
+        return None, erro
+    if profissional in ocupados_recorrentes(data_iso, hora, reservas.DURACAO_PADRAO):
+        return None, ("Horário reservado por recorrência.", 409)
+    return (data_iso, hora, profissional), None
+
+# mensagens das exceções do motor de reservas, por tipo de operação
+ERROS_RESERVA = {
+    "reservar": {
+        reservas.DiaBloqueado: ("Data bloqueada.", 409),
+        reservas.ReservadoPorRecorrencia: ("Horário reservado por agendamento recorrente.", 409),
+        reservas.SlotOcupado: ("Já existe item nesse horário (agendado/cancelado/finalizado/bloqueado).", 409),
+    },
+    "atualizar": {
+        reservas.NaoEncontrado: ("Agendamento não encontrado.", 404),
+        reservas.DiaBloqueado: ("Não é permitido alterar para data bloqueada.", 409),
+        reservas.SlotOcupado: ("Conflito: já existe item nesse horário.", 409),
+    },
+    "bloquear_slot": {
+        reservas.SlotOcupado: ("Já existe item nesse horário (agendado/cancelado/finalizado/bloqueado).", 409),
+    },
+}
+
+def falha(mensagem: str, status: int) -> dict:
+    return {"ok": False, "status": status, "error": mensagem}
 
 # ---------- Rotas ----------
 @app.post("/agendamentos")
 def criar_agendamento():
     body = request.get_json(force=True, silent=True) or {}
-    nome = (body.get("nome") or "").strip()
-    fone = formatar_telefone(body.get("telefone") or "")
-    data_iso = normalizar_data(body.get("data") or "")
-    hora = (body.get("hora") or "").strip()
-    servico = (body.get("servico") or "").strip() or None
+    dados, erro = ler_reserva(body)
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
 
-    if not (nome and fone and data_iso and hora):
-        return jsonify(error="Campos obrigatórios: nome, telefone, data, hora."), 400
-    if data_eh_passada(data_iso):
-        return jsonify(error="Não é permitido agendar em data passada."), 400
-    bloqueada, motivo = data_bloqueada(data_iso)
-    if bloqueada:
-        return jsonify(error=f"Data bloqueada ({data_iso}). Motivo: {motivo or '—'}"), 409
+    # bloqueio do dia + conflito + insert num único statement (BEGIN IMMEDIATE); as ocorrências
+    # virtuais (fora de `agendamentos`) são lidas na mesma transação e o INSERT pula esses profissionais
+    try:
+        new_id, profissional = escritor.executar(reservas.reservar, **dados, recorrentes=ocupados_recorrentes)
+    except reservas.DiaBloqueado:
+        return jsonify(error=f"Data bloqueada ({dados['data']}). Motivo: {data_bloqueada(dados['data'])[1] or '—'}"), 409
+    except reservas.ReservadoPorRecorrencia:
+        return jsonify(error="Horário reservado por agendamento recorrente."), 409
+    except reservas.SlotOcupado:
+        return jsonify(error="Já existe item nesse horário (agendado/cancelado/finalizado/bloqueado)."), 409
+    novo = dict(id=new_id, **dados, status="agendado")
+    novo["profissional_id"] = profissional
+    barramento.publicar("agendamento.criado", novo, (dados["data"],))
+    return jsonify(novo), 201
+
+# ---------- Listagem paginada (keyset) ----------
+MAX_LIMITE = 500
 
+def codificar_cursor(row) -> str:
+    chave = json.dumps([row["status_ordem"], row["hora_ordem"], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(chave.encode()).decode().rstrip("=")
+
+def decodificar_cursor(txt: str):
     try:
-        c = conn(); cur = c.cursor()
-        # checa conflito com agendado/bloqueado/finalizado
-        cur.execute("""SELECT 1 FROM agendamentos
-                       WHERE data=? AND hora=? AND status IN ('agendado','bloqueado','finalizado')""",
-                    (data_iso, hora))
-        if cur.fetchone():
-            c.close()
-            return jsonify(error="Já existe item nesse horário (agendado/cancelado/finalizado/bloqueado)."), 409
-
-        cur.execute("""INSERT INTO agendamentos (nome_cliente, telefone, data, hora, servico)
-                       VALUES (?,?,?,?,?)""", (nome, fone, data_iso, hora, servico))
-        c.commit()
-        new_id = cur.lastrowid
-        c.close()
-        return jsonify(id=new_id, nome=nome, telefone=fone, data=data_iso, hora=hora,
-                       servico=servico, status="agendado"), 201
-    except sqlite3.IntegrityError:
-        return jsonify(error="Já existe agendamento neste horário para esse dia."), 409
+        ordem, hora, ag_id = json.loads(base64.urlsafe_b64decode(txt + "=" * (-len(txt) % 4)))
+        if isinstance(ordem, int) and isinstance(hora, str) and isinstance(ag_id, int):
+            return ordem, hora, ag_id
+    except (ValueError, TypeError):
+        pass
+    return None
 
 @app.get("/agendamentos")
 def listar_agendamentos():
+    """
+    Sem `limit`/`cursor` devolve a lista inteira (compatível com os painéis).
+    Com `limit` pagina por keyset sobre idx_ag_ordem e devolve `proximo` (cursor).
+    `fields=id,hora,status` projeta só as colunas pedidas.
+    """
     data_q = request.args.get("data")
     status_q = request.args.get("status")  # agendado | finalizado | cancelado | bloqueado
     params = []; where = []
+
+    campos, erro = ler_campos(request.args.get("fields"))
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
+    paginado = "limit" in request.args or "cursor" in request.args
+    if paginado:
+        try:
+            limite = int(request.args.get("limit") or 100)
+        except ValueError:
+            return jsonify(error="limit inválido."), 400
+        if not 1 <= limite <= MAX_LIMITE:
+            return jsonify(error=f"limit deve estar entre 1 e {MAX_LIMITE}."), 400
+    data_iso = None
     if data_q:
         data_iso = normalizar_data(data_q)
         if not data_iso:
@@ -153,93 +391,171 @@ def listar_agendamentos():
         where.append("data = ?"); params.append(data_iso)
     if status_q:
         where.append("status = ?"); params.append(status_q)
+    if request.args.get("profissional"):
+        try:
+            where.append("profissional_id = ?"); params.append(int(request.args["profissional"]))
+        except ValueError:
+            return jsonify(error="profissional inválido."), 400
+    if request.args.get("cursor"):
+        chave = decodificar_cursor(request.args["cursor"])
+        if chave is None:
+            return jsonify(error="cursor inválido."), 400
+        where.append("(status_ordem, hora_ordem, id) > (?, ?, ?)"); params.extend(chave)
+
+    etag, last_modified = validadores(("bloqueios", "recorrencias"), data_iso) if data_iso else validadores(("agendamentos",))
+    if (resp := nao_modificado(etag)) is not None:
+        return resp
 
-    sql = "SELECT * FROM agendamentos"
+    # status_ordem/hora_ordem = CASE status ... / time(hora), geradas e indexadas;
+    # dia já arquivado (ou lista sem data) lê também o histórico
+    tabela = arquivo.fonte(conn(), data_iso, data_iso)
+    sql = f"SELECT {', '.join(campos)}, status_ordem, hora_ordem, id AS _id FROM {tabela}"
     if where:
         sql += " WHERE " + " AND ".join(where)
-    sql += """ ORDER BY
-        CASE status WHEN 'bloqueado' THEN 0 WHEN 'agendado' THEN 1
-                    WHEN 'finalizado' THEN 2 WHEN 'cancelado' THEN 3 ELSE 4 END,
-        time(hora) ASC, id ASC"""
+    sql += " ORDER BY status_ordem, hora_ordem, id"
+    if paginado:
+        sql += " LIMIT ?"; params.append(limite + 1)
 
     c = conn(); cur = c.cursor()
     cur.execute(sql, params)
-    rows = [dict(r) for r in cur.fetchall()]
-    c.close()
+    linhas = cur.fetchall()
+    proximo = None
+    if paginado and len(linhas) > limite:
+        linhas = linhas[:limite]
+        ultima = linhas[-1]
+        proximo = codificar_cursor({"status_ordem": ultima["status_ordem"],
+                                    "hora_ordem": ultima["hora_ordem"], "id": ultima["_id"]})
+    rows = [{k: r[k] for k in campos} for r in linhas]
 
-    if data_q:
-        blk, mot = data_bloqueada(normalizar_data(data_q))
+    extra = {"proximo": proximo} if paginado else {}
+    if data_iso:
+        blk, mot = data_bloqueada(data_iso)
+        # ocorrências virtuais do dia (não paginadas: são poucas e não têm id de agendamento)
+        extra["recorrentes"] = [o._asdict() for o in cache_recorrencias.do_dia(data_iso)
+                                if o.tipo != "bloqueio_dia"]
     else:
         blk, mot = (False, None)
 
-    return jsonify(items=rows, bloqueio=(blk and {"dia": normalizar_data(data_q), "motivo": mot}) or None)
+    return com_validadores(jsonify(items=rows, bloqueio=(blk and {"dia": data_iso, "motivo": mot}) or None,
+                                   **extra),
+                           etag, last_modified)
 
 @app.patch("/agendamentos/<int:ag_id>")
 def atualizar_agendamento(ag_id):
     body = request.get_json(force=True, silent=True) or {}
+    campos, alvo_data, erro = ler_alteracao(body)
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
 
-    # Busca estado atual pra montar alvo de conflito
-    c = conn(); cur = c.cursor()
-    cur.execute("SELECT data, hora, status FROM agendamentos WHERE id=?", (ag_id,))
-    atual = cur.fetchone()
-    if not atual:
-        c.close(); return jsonify(error="Agendamento não encontrado."), 404
+    if not campos:
+        if not conn().execute("SELECT 1 FROM agendamentos WHERE id=?", (ag_id,)).fetchone():
+            return jsonify(error="Agendamento não encontrado."), 404
+        return jsonify(error="Nada para atualizar."), 400
 
-    alvo_data = normalizar_data(body.get("data") or "") or atual["data"]
-    alvo_hora = (body.get("hora") or "").strip() or atual["hora"]
-    alvo_status = (body.get("status") or "").strip() or atual["status"]
+    try:
+        atual, novo = escritor.executar(reservas.atualizar, ag_id, campos, nova_data=alvo_data,
+                                        livre=livre_de_recorrencias)
+    except reservas.NaoEncontrado:
+        return jsonify(error="Agendamento não encontrado."), 404
+    except reservas.DiaBloqueado:
+        return jsonify(error=f"Não é permitido alterar para data bloqueada ({alvo_data})."), 409
+    except reservas.SlotOcupado:
+        return jsonify(error="Conflito: já existe item nesse horário."), 409
+    barramento.publicar("agendamento.atualizado", dict(novo, data_anterior=atual["data"]),
+                        (atual["data"], novo["data"]))
+    if liberado := slot_liberado(atual, novo):
+        encaixar_espera([liberado])
+    return jsonify(ok=True)
 
-    # validações de data/hora/dia bloqueado
-    if body.get("data"):
-        if not normalizar_data(body["data"]):
-            c.close(); return jsonify(error="Data inválida."), 400
-        if data_eh_passada(alvo_data):
-            c.close(); return jsonify(error="Não é permitido alterar para data passada."), 400
-        blk, mot = data_bloqueada(alvo_data)
-        if blk:
-            c.close(); return jsonify(error=f"Não é permitido alterar para data bloqueada ({alvo_data}). Motivo: {mot or '—'}"), 409
+# -------- Lista de espera --------
+def slot_liberado(antes: dict, depois: dict):
+    """(data, hora, profissional_id) que deixou de estar ocupado com a alteração, ou None."""
+    if antes["status"] not in reservas.OCUPANTES:
+        return None
+    slot = (antes["data"], antes["hora"], antes["profissional_id"])
+    if depois["status"] not in reservas.OCUPANTES or slot != (depois["data"], depois["hora"], depois["profissional_id"]):
+        return slot
+    return None
+
+def encaixar_espera(slots):
+    """Chamar DEPOIS do commit que liberou `slots`: preenche pela lista de espera."""
+    for data_iso, hora, profissional in slots:
+        if data_eh_passada(data_iso):
+            continue
+        hora = grade.normalizar_hora(hora)  # mesmo formato da janela gravada em lista_espera
+        if conn().execute(reservas.SQL_CANDIDATO, (data_iso, hora, hora)).fetchone() is None:
+            continue  # fila vazia: nem entra na fila do escritor
+        encaixe = escritor.executar(reservas.encaixar, data_iso, hora, profissional,
+                                    livre=livre_de_recorrencias)
+        if encaixe:
+            entrada_id, novo = encaixe
+            barramento.publicar("agendamento.criado", novo, (data_iso,))
+            barramento.publicar("lista_espera.atendida", {"id": entrada_id, "agendamento_id": novo["id"],
+                                                          "data": data_iso, "hora": hora}, (data_iso,))
 
-    if body.get("status") and alvo_status not in ("agendado","finalizado","cancelado","bloqueado"):
-        c.close(); return jsonify(error="Status inválido."), 400
+@app.post("/lista-espera")
+def entrar_lista_espera():
+    """Corpo: {nome, telefone, data, hora_inicio?, hora_fim?, servico?} (sem janela = qualquer horário)."""
+    body = request.get_json(force=True, silent=True) or {}
+    nome = (body.get("nome") or "").strip()
+    telefone = formatar_telefone(body.get("telefone") or "")
+    data_iso = normalizar_data(body.get("data") or "")
+    servico = (body.get("servico") or "").strip() or None
+    if not (nome and telefone and data_iso):
+        return jsonify(error="Campos obrigatórios: nome, telefone, data."), 400
+    if data_eh_passada(data_iso):
+        return jsonify(error="Não é permitido entrar na lista de espera de data passada."), 400
+    try:
+        inicio = grade.normalizar_hora(body["hora_inicio"]) if body.get("hora_inicio") else None
+        fim = grade.normalizar_hora(body["hora_fim"]) if body.get("hora_fim") else None
+    except ValueError:
+        return jsonify(error="Horário inválido (use HH:MM)."), 400
+    if inicio and fim and fim < inicio:
+        return jsonify(error="hora_fim antes de hora_inicio."), 400
 
-    # checagem de conflito (ocupados: agendado/bloqueado/finalizado), exclui o próprio id
-    cur.execute("""SELECT 1 FROM agendamentos
-                   WHERE data=? AND hora=? AND status IN ('agendado','bloqueado','finalizado')
-                     AND id <> ?""", (alvo_data, alvo_hora, ag_id))
-    if cur.fetchone():
-        c.close(); return jsonify(error="Conflito: já existe item nesse horário."), 409
+    _, entrada_id, _ = escrever("""INSERT INTO lista_espera (nome_cliente, telefone, data, hora_inicio, hora_fim, servico)
+                                 VALUES (?,?,?,?,?,?)""", (nome, telefone, data_iso, inicio, fim, servico))
+    entrada = dict(id=entrada_id, nome=nome, telefone=telefone, data=data_iso,
+                   hora_inicio=inicio, hora_fim=fim, servico=servico, status="aguardando")
+    barramento.publicar("lista_espera.inscrito", entrada, (data_iso,))
+    return jsonify(entrada), 201
 
-    # monta update dinâmico
-    set_parts = []; params = []
-    if "nome" in body:
-        set_parts.append("nome_cliente = ?"); params.append((body["nome"] or "").strip())
-    if "telefone" in body:
-        set_parts.append("telefone = ?"); params.append(formatar_telefone(body["telefone"] or ""))
-    if "servico" in body:
-        set_parts.append("servico = ?"); params.append(((body["servico"] or "").strip() or None))
-    if "data" in body:
-        set_parts.append("data = ?"); params.append(alvo_data)
-    if "hora" in body:
-        set_parts.append("hora = ?"); params.append(alvo_hora)
-    if "status" in body:
-        set_parts.append("status = ?"); params.append(alvo_status)
-
-    if not set_parts:
-        c.close(); return jsonify(error="Nada para atualizar."), 400
-
-    params.append(ag_id)
-    cur.execute(f"UPDATE agendamentos SET {', '.join(set_parts)} WHERE id = ?", params)
-    c.commit(); c.close()
+@app.get("/lista-espera")
+def listar_lista_espera():
+    """?data=YYYY-MM-DD&status=aguardando|atendido|cancelado (padrão: aguardando), na ordem da fila."""
+    data_iso = normalizar_data(request.args.get("data") or "")
+    status = request.args.get("status") or "aguardando"
+    sql = """SELECT id, nome_cliente, telefone, data, hora_inicio, hora_fim, servico, status,
+                    agendamento_id, criado_em, atendido_em
+               FROM lista_espera WHERE status = ?"""
+    params = [status]
+    if data_iso:
+        sql += " AND data = ?"
+        params.append(data_iso)
+    sql += " ORDER BY data, id"
+    rows = [dict(r) for r in conn().execute(sql, params)]
+    return jsonify(items=rows)
+
+@app.delete("/lista-espera/<int:entrada_id>")
+def sair_lista_espera(entrada_id):
+    _, _, linhas = escrever("""UPDATE lista_espera SET status = 'cancelado'
+                               WHERE id = ? AND status = 'aguardando' RETURNING data""", (entrada_id,))
+    if not linhas:
+        return jsonify(error="Entrada não encontrada (ou já atendida)."), 404
+    row = linhas[0]
+    barramento.publicar("lista_espera.removido", {"id": entrada_id, "data": row["data"]}, (row["data"],))
     return jsonify(ok=True)
 
 # -------- Bloqueio de DIA --------
 @app.get("/bloqueios")
 def get_bloqueios():
+    etag, last_modified = validadores(("bloqueios",))
+    if (resp := nao_modificado(etag)) is not None:
+        return resp
     c = conn(); cur = c.cursor()
     cur.execute("SELECT * FROM bloqueios ORDER BY date(dia)")
     rows = [dict(r) for r in cur.fetchall()]
-    c.close()
-    return jsonify(items=rows)
+    return com_validadores(jsonify(items=rows), etag, last_modified)
 
 @app.post("/bloqueios")
 def criar_bloqueio():
@@ -249,9 +565,9 @@ def criar_bloqueio():
     if not dia:
         return jsonify(error="Dia inválido."), 400
     try:
-        c = conn(); cur = c.cursor()
-        cur.execute("INSERT INTO bloqueios (dia, motivo) VALUES (?,?)", (dia, motivo))
-        c.commit(); c.close()
+        escrever("INSERT INTO bloqueios (dia, motivo) VALUES (?,?)", (dia, motivo))
+        cache_bloqueios.registrar(dia, motivo)
+        barramento.publicar("dia.bloqueado", {"dia": dia, "motivo": motivo}, (dia,))
         return jsonify(dia=dia, motivo=motivo), 201
     except sqlite3.IntegrityError:
         return jsonify(error="Dia já bloqueado."), 409
@@ -261,60 +577,650 @@ def remover_bloqueio(dia):
     dia_iso = normalizar_data(dia)
     if not dia_iso:
         return jsonify(error="Dia inválido."), 400
-    c = conn(); cur = c.cursor()
-    cur.execute("DELETE FROM bloqueios WHERE dia = ?", (dia_iso,))
-    if cur.rowcount == 0:
-        c.close(); return jsonify(error="Bloqueio não encontrado."), 404
-    c.commit(); c.close()
+    removidos, _, _ = escrever("DELETE FROM bloqueios WHERE dia = ?", (dia_iso,))
+    if removidos == 0:
+        return jsonify(error="Bloqueio não encontrado."), 404
+    cache_bloqueios.remover(dia_iso)
+    barramento.publicar("dia.desbloqueado", {"dia": dia_iso}, (dia_iso,))
     return jsonify(ok=True)
 
 # -------- Bloqueio de HORÁRIO (slot) --------
 @app.post("/slots/bloquear")
 def bloquear_horario():
     body = request.get_json(force=True, silent=True) or {}
-    data_iso = normalizar_data(body.get("data") or "")
-    hora = (body.get("hora") or "").strip()
-    if not (data_iso and hora):
-        return jsonify(error="Campos obrigatórios: data, hora."), 400
-    if data_eh_passada(data_iso):
-        return jsonify(error="Não é permitido bloquear horário em data passada."), 400
+    slot, erro = ler_slot(body)
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
+    data_iso, hora, profissional = slot
     try:
-        c = conn(); cur = c.cursor()
-        cur.execute("""SELECT id FROM agendamentos
-                       WHERE data=? AND hora=? AND status IN ('agendado','cancelado','finalizado','bloqueado')""",
-                    (data_iso, hora))
-        if cur.fetchone():
-            c.close(); return jsonify(error="Já existe item nesse horário (agendado/cancelado/finalizado/bloqueado)."), 409
-        cur.execute("""INSERT INTO agendamentos (nome_cliente, telefone, data, hora, status)
-                       VALUES (?,?,?,?, 'bloqueado')""", ("Bloqueado", "", data_iso, hora))
-        c.commit(); c.close()
-        return jsonify(ok=True), 201
-    except sqlite3.IntegrityError:
-        return jsonify(error="Conflito no slot."), 409
+        new_id = escritor.executar(reservas.bloquear_slot, data_iso, hora, profissional)
+    except reservas.SlotOcupado:
+        return jsonify(error="Já existe item nesse horário (agendado/cancelado/finalizado/bloqueado)."), 409
+    barramento.publicar("slot.bloqueado", {"id": new_id, "data": data_iso, "hora": hora,
+                                           "profissional_id": profissional}, (data_iso,))
+    return jsonify(ok=True), 201
 
 @app.post("/slots/desbloquear")
 def desbloquear_horario():
     body = request.get_json(force=True, silent=True) or {}
     data_iso = normalizar_data(body.get("data") or "")
-    hora = (body.get("hora") or "").strip()
+    hora = ler_hora(body.get("hora"))
     if not (data_iso and hora):
-        return jsonify(error="Campos obrigatórios: data, hora."), 400
-    c = conn(); cur = c.cursor()
-    cur.execute("""DELETE FROM agendamentos WHERE data=? AND hora=? AND status='bloqueado'""",
-                (data_iso, hora))
-    if cur.rowcount == 0:
-        c.close(); return jsonify(error="Esse horário não estava bloqueado."), 404
-    c.commit(); c.close()
+        return jsonify(error="Campos obrigatórios: data, hora (HH:MM)."), 400
+    profissional, erro = ler_profissional(body, reservas.PROFISSIONAL_PADRAO)
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
+    removidos, _, _ = escrever("""DELETE FROM agendamentos
+                                   WHERE data=? AND hora=? AND profissional_id=? AND status='bloqueado'""",
+                               (data_iso, hora, profissional))
+    if removidos == 0:
+        return jsonify(error="Esse horário não estava bloqueado."), 404
+    barramento.publicar("slot.desbloqueado", {"data": data_iso, "hora": hora,
+                                              "profissional_id": profissional}, (data_iso,))
+    encaixar_espera([(data_iso, hora, profissional)])
+    return jsonify(ok=True)
+
+# -------- Lotes (uma transação / um commit por requisição) --------
+MAX_LOTE = 200
+
+def ler_lote(body: dict, chave: str):
+    itens = body.get(chave)
+    if not isinstance(itens, list) or not itens:
+        return None, (f"Informe '{chave}' (lista).", 400)
+    if len(itens) > MAX_LOTE:
+        return None, (f"Máximo de {MAX_LOTE} itens por lote.", 400)
+    return itens, None
+
+@app.post("/agendamentos/batch")
+def lote_agendamentos():
+    """
+    Corpo: {"operacoes": [{"op": "criar", nome, telefone, data, hora, servico}
+                          | {"op": "atualizar", "id": 1, status/data/hora/nome/...}]}
+    Resposta: um resultado por item, na mesma ordem (falha de um não desfaz os outros).
+    """
+    body = request.get_json(force=True, silent=True) or {}
+    ops, erro = ler_lote(body, "operacoes")
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
+
+    resultados = [None] * len(ops)
+    validas = []; posicoes = []; liberados = []
+    for i, op in enumerate(ops):
+        op = op if isinstance(op, dict) else {}
+        if op.get("op") == "criar":
+            dados, erro = ler_reserva(op)
+            item = ("reservar", dict(dados or {}, recorrentes=ocupados_recorrentes))
+        elif op.get("op") == "atualizar":
+            campos, nova_data, erro = ler_alteracao(op)
+            if not isinstance(op.get("id"), int):
+                erro = ("Informe o id (inteiro).", 400)
+            elif not erro and not campos:
+                erro = ("Nada para atualizar.", 400)
+            item = ("atualizar", dict(ag_id=op.get("id"), campos=campos, nova_data=nova_data,
+                                      livre=livre_de_recorrencias))
+        else:
+            erro = ("Operação deve ser 'criar' ou 'atualizar'.", 400)
+        if erro:
+            resultados[i] = falha(*erro)
+        else:
+            validas.append(item); posicoes.append(i)
+
+    saidas = escritor.executar(reservas.executar_lote, validas) if validas else []
+    for i, (tipo, kw), saida in zip(posicoes, validas, saidas):
+        if isinstance(saida, Exception):
+            resultados[i] = falha(*ERROS_RESERVA[tipo][type(saida)])
+        elif tipo == "reservar":
+            novo_id, profissional = saida
+            novo = dict(kw, id=novo_id, status="agendado", profissional_id=profissional)
+            del novo["recorrentes"]
+            barramento.publicar("agendamento.criado", novo, (kw["data"],))
+            resultados[i] = {"ok": True, "id": novo_id, "profissional_id": profissional}
+        else:
+            atual, novo = saida
+            barramento.publicar("agendamento.atualizado", dict(novo, data_anterior=atual["data"]),
+                                (atual["data"], novo["data"]))
+            resultados[i] = {"ok": True, "id": novo["id"]}
+            if liberado := slot_liberado(atual, novo):
+                liberados.append(liberado)
+
+    encaixar_espera(liberados)
+    ok = sum(1 for r in resultados if r["ok"])
+    return jsonify(resultados=resultados, ok=ok, falhas=len(resultados) - ok)
+
+@app.post("/slots/bloquear/batch")
+def lote_bloquear_horarios():
+    """Corpo: {"slots": [{"data": ..., "hora": ...}, ...]} — ex.: bloquear uma tarde inteira."""
+    body = request.get_json(force=True, silent=True) or {}
+    itens, erro = ler_lote(body, "slots")
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
+
+    resultados = [None] * len(itens)
+    validos = []; posicoes = []
+    for i, item in enumerate(itens):
+        slot, erro = ler_slot(item if isinstance(item, dict) else {})
+        if erro:
+            resultados[i] = falha(*erro)
+        else:
+            validos.append(slot); posicoes.append(i)
+
+    saidas = escritor.executar(reservas.bloquear_slots, validos) if validos else []
+    for i, (data_iso, hora, profissional), saida in zip(posicoes, validos, saidas):
+        if isinstance(saida, Exception):
+            resultados[i] = falha(*ERROS_RESERVA["bloquear_slot"][type(saida)])
+        else:
+            barramento.publicar("slot.bloqueado", {"id": saida, "data": data_iso, "hora": hora,
+                                                   "profissional_id": profissional}, (data_iso,))
+            resultados[i] = {"ok": True, "id": saida}
+
+    ok = sum(1 for r in resultados if r["ok"])
+    return jsonify(resultados=resultados, ok=ok, falhas=len(resultados) - ok)
+
+# -------- Disponibilidade (grade no servidor) --------
+@app.get("/grade")
+def get_grade():
+    return jsonify({dia: list(h) for dia, h in zip(grade.DIAS_SEMANA, GRADE) if h})
+
+@app.get("/slots/disponiveis")
+def slots_disponiveis():
+    """
+    Horários livres/ocupados de um dia (?data=) ou intervalo (?inicio=&fim=).
+    Livre = pelo menos um profissional ativo (ou o de ?profissional=) com o intervalo
+    [hora, hora + duração de ?servico=) vago; `vagas` diz quantas cadeiras sobram.
+    Só devolve horários — nada de nome/telefone de cliente.
+    """
+    inicio = normalizar_data(request.args.get("inicio") or request.args.get("data") or "")
+    fim = normalizar_data(request.args.get("fim") or "") or inicio
+    if not inicio:
+        return jsonify(error="Informe data ou inicio/fim."), 400
+    d0, d1 = date.fromisoformat(inicio), date.fromisoformat(fim)
+    if d1 < d0:
+        return jsonify(error="Fim antes do início."), 400
+    if (d1 - d0).days >= MAX_DIAS_SLOTS:
+        return jsonify(error=f"Intervalo máximo: {MAX_DIAS_SLOTS} dias."), 400
+    ativos = profissionais_ativos()
+    filtro = ""; params = [inicio, fim]
+    if request.args.get("profissional"):
+        try:
+            profissional = int(request.args["profissional"])
+        except ValueError:
+            return jsonify(error="profissional inválido."), 400
+        if profissional not in ativos:
+            return jsonify(error="Profissional inválido ou inativo."), 400
+        ativos = [profissional]
+        filtro = " AND a.profissional_id = ?"; params.append(profissional)
+    duracao = reservas.DURACAO_PADRAO
+    if request.args.get("servico"):
+        servico = reservas.servico_do_catalogo(conn(), request.args["servico"])
+        if servico is None:
+            return jsonify(error="Serviço desconhecido."), 400
+        duracao = servico[1]
+
+    # uma ida ao banco, qualquer que seja o nº de profissionais: intervalos ocupados
+    # (idx_ag_data) + dias bloqueados (PK de bloqueios)
+    cur = conn().execute(f"""
+        SELECT a.data, a.profissional_id, a.inicio_min, a.fim_min, NULL AS motivo, 0 AS dia_bloqueado
+          FROM agendamentos a JOIN profissionais p ON p.id = a.profissional_id AND p.ativo = 1
+         WHERE a.data BETWEEN ? AND ? AND a.status IN ('agendado','bloqueado','finalizado'){filtro}
+        UNION ALL
+        SELECT dia, NULL, NULL, NULL, motivo, 1 FROM bloqueios WHERE dia BETWEEN ? AND ?""",
+        (*params, inicio, fim))
+    cadeiras = len(ativos)
+    # ocorrências virtuais das recorrências entram como se fossem linhas da consulta
+    virtuais = [(iso, o.profissional_id, reservas.minutos(o.hora) if o.hora else None,
+                 reservas.minutos(o.hora) + o.duracao_min if o.hora else None,
+                 o.motivo, o.tipo == "bloqueio_dia")
+                for iso, ocs in cache_recorrencias.intervalo_datas(inicio, fim).items() for o in ocs
+                if o.tipo == "bloqueio_dia" or o.profissional_id in ativos]
+    # horário h da grade fica ocupado p/ o profissional se [h, h+duracao) cruza [ini, fim)
+    ocupados = defaultdict(lambda: defaultdict(set)); bloqueados = {}
+    for data_iso, profissional, ini, fim_min, motivo, dia_bloqueado in (*cur, *virtuais):
+        if dia_bloqueado:
+            bloqueados.setdefault(data_iso, motivo)
+            continue
+        wd = date.fromisoformat(data_iso).weekday()
+        grade_min = GRADE_MIN[wd]
+        for i in range(bisect_right(grade_min, ini - duracao), bisect_left(grade_min, fim_min)):
+            ocupados[data_iso][GRADE[wd][i]].add(profissional)
+
+    hoje = date.today()
+    dias = {}
+    d = d0
+    while d <= d1:
+        iso = d.isoformat()
+        occ = {h: len(ps) for h, ps in ocupados.get(iso, {}).items()}
+        dia = {"livres": [], "ocupados": sorted(h for h, n in occ.items() if n >= cadeiras)}
+        if iso in bloqueados:
+            dia["bloqueio"] = {"motivo": bloqueados[iso]}
+        elif d >= hoje:
+            vagas = {h: cadeiras - occ.get(h, 0) for h in GRADE[d.weekday()]}
+            dia["livres"] = [h for h, n in vagas.items() if n > 0]
+            dia["vagas"] = {h: vagas[h] for h in dia["livres"]}
+        dias[iso] = dia
+        d += timedelta(days=1)
+    return jsonify(dias=dias)
+
+# -------- Agenda da semana/mês (um range scan, agrupado por dia) --------
+@app.get("/agenda")
+def agenda():
+    """
+    Calendário de ?inicio= a ?fim= (padrão: 7 dias): por dia, agendamentos, bloqueios de
+    horário, bloqueio do dia e ocorrências recorrentes. Uma consulta por idx_ag_data +
+    uma pela PK de bloqueios (+ o histórico, se o intervalo foi arquivado), agrupadas
+    numa passada só (as linhas já vêm em ordem de dia).
+    `fields=` projeta as colunas dos itens; `formato=colunas` devolve cada coluna como
+    um array (itens de todos os dias juntos, fatiados por `inicio_dia`) para a grade.
+    """
+    inicio = normalizar_data(request.args.get("inicio") or "")
+    if not inicio:
+        return jsonify(error="Informe inicio (e opcionalmente fim)."), 400
+    d0 = date.fromisoformat(inicio)
+    fim = normalizar_data(request.args.get("fim") or "") or (d0 + timedelta(days=6)).isoformat()
+    d1 = date.fromisoformat(fim)
+    if d1 < d0:
+        return jsonify(error="Fim antes do início."), 400
+    if (d1 - d0).days >= MAX_DIAS_AGENDA:
+        return jsonify(error=f"Intervalo máximo: {MAX_DIAS_AGENDA} dias."), 400
+    colunar = request.args.get("formato") == "colunas"
+    if request.args.get("formato") not in (None, "", "colunas"):
+        return jsonify(error="formato aceita: colunas."), 400
+    campos, erro = ler_campos(request.args.get("fields"))
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
+    filtro = ""; params = [inicio, fim]
+    if request.args.get("profissional"):
+        try:
+            params.append(int(request.args["profissional"]))
+        except ValueError:
+            return jsonify(error="profissional inválido."), 400
+        filtro = " AND profissional_id = ?"
+
+    etag, last_modified = validadores(("agendamentos", "bloqueios", "recorrencias"))
+    if (resp := nao_modificado(etag)) is not None:
+        return resp
+
+    c = conn()
+    # data primeiro (range em idx_ag_data); dentro do dia, ordem de horário
+    cur = c.execute(f"""
+        SELECT data, status = 'bloqueado', {', '.join(campos)} FROM {arquivo.fonte(c, inicio, fim)}
+         WHERE data BETWEEN ? AND ?{filtro}
+         ORDER BY data, hora_ordem, id""", params)
+    bloqueados = dict(c.execute("SELECT dia, motivo FROM bloqueios WHERE dia BETWEEN ? AND ?", (inicio, fim)))
+    virtuais = cache_recorrencias.intervalo_datas(inicio, fim)
+    for iso, ocs in virtuais.items():
+        for o in ocs:
+            if o.tipo == "bloqueio_dia":
+                bloqueados.setdefault(iso, o.motivo)
+    recorrentes = {iso: [o for o in ocs if o.tipo != "bloqueio_dia"] for iso, ocs in virtuais.items()}
+    datas = [(d0 + timedelta(days=i)).isoformat() for i in range((d1 - d0).days + 1)]
+
+    if colunar:
+        colunas = {k: [] for k in campos}
+        indice = {iso: i for i, iso in enumerate(datas)}
+        inicio_dia = []; n = 0  # itens do dia i = colunas[...][inicio_dia[i]:inicio_dia[i + 1]]
+        for data_iso, _, *valores in cur:
+            while len(inicio_dia) <= indice[data_iso]:  # dias sem item ficam com fatia vazia
+                inicio_dia.append(n)
+            for k, v in zip(campos, valores):
+                colunas[k].append(v)
+            n += 1
+        inicio_dia.extend([n] * (len(datas) + 1 - len(inicio_dia)))
+        rec = {k: [] for k in recorrencias.Ocorrencia._fields}
+        for iso in datas:
+            for o in recorrentes.get(iso, ()):
+                for k, v in zip(rec, o):
+                    rec[k].append(v)
+        return com_validadores(jsonify(inicio=inicio, fim=fim, dias=datas, inicio_dia=inicio_dia,
+                                       colunas=colunas, bloqueados=bloqueados, recorrentes=rec),
+                               etag, last_modified)
+
+    dias = {iso: {"bloqueio": {"motivo": bloqueados[iso]} if iso in bloqueados else None,
+                  "agendamentos": [], "bloqueios_horario": [],
+                  "recorrentes": [o._asdict() for o in recorrentes.get(iso, ())]}
+            for iso in datas}
+    for data_iso, slot_bloqueado, *valores in cur:
+        dias[data_iso]["bloqueios_horario" if slot_bloqueado else "agendamentos"].append(dict(zip(campos, valores)))
+    return com_validadores(jsonify(inicio=inicio, fim=fim, dias=dias), etag, last_modified)
+
+# -------- Recorrências (regra gravada uma vez, ocorrências virtuais) --------
+def ler_recorrencia(body: dict):
+    """(linha p/ INSERT, regra, None) ou (None, None, (mensagem, status))."""
+    tipo = body.get("tipo") or "agendamento"
+    if tipo not in recorrencias.TIPOS:
+        return None, None, (f"tipo deve ser: {', '.join(recorrencias.TIPOS)}.", 400)
+    inicio = normalizar_data(body.get("inicio") or body.get("data") or "")
+    if not inicio:
+        return None, None, ("Informe inicio (primeira data da recorrência).", 400)
+    try:
+        regra = recorrencias.Regra(body.get("regra"), date.fromisoformat(inicio))
+    except recorrencias.RegraInvalida as e:
+        return None, None, (f"Regra inválida: {e}", 400)
+    linha = dict(tipo=tipo, regra=body["regra"].strip().upper(), inicio=inicio, hora=None,
+                 duracao_min=reservas.DURACAO_PADRAO, profissional_id=None, nome_cliente=None,
+                 telefone=None, servico=None, motivo=(body.get("motivo") or "").strip() or None)
+    if tipo == "bloqueio_dia":
+        return linha, regra, None
+    linha["hora"] = ler_hora(body.get("hora"))
+    if not linha["hora"]:
+        return None, None, ("Informe hora (HH:MM).", 400)
+    linha["profissional_id"], erro = ler_profissional(body, reservas.PROFISSIONAL_PADRAO)
+    if erro:
+        return None, None, erro
+    if tipo == "agendamento":
+        linha["nome_cliente"] = (body.get("nome") or "").strip()
+        linha["telefone"] = formatar_telefone(body.get("telefone") or "")
+        if not (linha["nome_cliente"] and linha["telefone"]):
+            return None, None, ("Campos obrigatórios: nome, telefone.", 400)
+        linha["servico"], linha["duracao_min"] = ler_servico(body.get("servico"))
+    elif "duracao_min" in body:
+        linha["duracao_min"] = ler_duracao(body["duracao_min"])
+        if linha["duracao_min"] is None:
+            return None, None, ("duracao_min deve estar entre 5 e 600.", 400)
+    return linha, regra, None
+
+def conflitos_recorrencia(c, linha: dict, regra) -> list[str]:
+    """Datas (até HORIZONTE_RECORRENCIA dias) em que a regra cruzaria um item real ou outra recorrência."""
+    d0 = max(date.fromisoformat(linha["inicio"]), date.today())
+    datas = {d.isoformat() for d in regra.expandir(d0, d0 + timedelta(days=HORIZONTE_RECORRENCIA))}
+    if not datas:
+        return []
+    ini = reservas.minutos(linha["hora"]); fim_min = ini + linha["duracao_min"]
+    conflitos = {r[0] for r in c.execute("""
+        SELECT data FROM agendamentos
+         WHERE profissional_id = ? AND data BETWEEN ? AND ?
+           AND status IN ('agendado','bloqueado','finalizado') AND inicio_min < ? AND fim_min > ?""",
+        (linha["profissional_id"], min(datas), max(datas), fim_min, ini)) if r[0] in datas}
+    for iso, ocs in cache_recorrencias.intervalo_datas(min(datas), max(datas)).items():
+        if iso in datas and any(o.tipo != "bloqueio_dia" and o.profissional_id == linha["profissional_id"]
+                                and reservas.minutos(o.hora) < fim_min
+                                and ini < reservas.minutos(o.hora) + o.duracao_min for o in ocs):
+            conflitos.add(iso)
+    return sorted(conflitos)
+
+@app.get("/recorrencias")
+def listar_recorrencias():
+    etag, last_modified = validadores(("recorrencias",))
+    if (resp := nao_modificado(etag)) is not None:
+        return resp
+    c = conn()
+    excecoes = defaultdict(list)
+    for rec_id, dia in c.execute("SELECT recorrencia_id, data FROM recorrencias_excecoes ORDER BY data"):
+        excecoes[rec_id].append(dia)
+    rows = [dict(r, excecoes=excecoes.get(r["id"], [])) for r in
+            c.execute("SELECT * FROM recorrencias ORDER BY id")]
+    return com_validadores(jsonify(items=rows), etag, last_modified)
+
+@app.post("/recorrencias")
+def criar_recorrencia():
+    """
+    Corpo: {tipo: agendamento|bloqueio_slot|bloqueio_dia, regra: "FREQ=WEEKLY;INTERVAL=2",
+            inicio, hora?, nome?, telefone?, servico?, profissional_id?, duracao_min?, motivo?}
+    """
+    body = request.get_json(force=True, silent=True) or {}
+    linha, regra, erro = ler_recorrencia(body)
+    if erro:
+        return jsonify(error=erro[0]), erro[1]
+
+    def inserir(c):
+        # checagem e INSERT na mesma transação do escritor: nenhuma reserva entra no meio
+        if linha["tipo"] != "bloqueio_dia" and (conflitos := conflitos_recorrencia(c, linha, regra)):
+            return None, conflitos
+        return c.execute(f"""INSERT INTO recorrencias ({', '.join(linha)})
+                             VALUES ({', '.join('?' * len(linha))})""", tuple(linha.values())).lastrowid, []
+    rec_id, conflitos = escritor.executar(inserir)
+    if conflitos:
+        return jsonify(error="Conflito com agendamentos existentes.", datas=conflitos[:20]), 409
+    cache_recorrencias.invalidar()
+    nova = dict(id=rec_id, **linha)
+    barramento.publicar("recorrencia.criada", nova)
+    return jsonify(nova), 201
+
+@app.delete("/recorrencias/<int:rec_id>")
+def remover_recorrencia(rec_id):
+    """Encerra a regra; agendamentos já materializados continuam."""
+    removidos, _, _ = escrever("DELETE FROM recorrencias WHERE id = ?", (rec_id,))
+    if removidos == 0:
+        return jsonify(error="Recorrência não encontrada."), 404
+    cache_recorrencias.invalidar()
+    barramento.publicar("recorrencia.removida", {"id": rec_id})
+    return jsonify(ok=True)
+
+@app.get("/recorrencias/ocorrencias")
+def listar_ocorrencias():
+    """?inicio=&fim= (máx. MAX_DIAS_SLOTS dias): ocorrências virtuais expandidas só nesse intervalo."""
+    inicio = normalizar_data(request.args.get("inicio") or request.args.get("data") or "")
+    fim = normalizar_data(request.args.get("fim") or "") or inicio
+    if not inicio:
+        return jsonify(error="Informe data ou inicio/fim."), 400
+    if fim < inicio:
+        return jsonify(error="Fim antes do início."), 400
+    if (date.fromisoformat(fim) - date.fromisoformat(inicio)).days >= MAX_DIAS_SLOTS:
+        return jsonify(error=f"Intervalo máximo: {MAX_DIAS_SLOTS} dias."), 400
+    dias = cache_recorrencias.intervalo_datas(inicio, fim)
+    return jsonify(items=[o._asdict() for iso in sorted(dias) for o in dias[iso]])
+
+def ocorrencia(rec_id: int, data_iso: str):
+    return next((o for o in cache_recorrencias.do_dia(data_iso) if o.recorrencia_id == rec_id), None)
+
+@app.post("/recorrencias/<int:rec_id>/excecoes")
+def pular_ocorrencia(rec_id):
+    """Corpo: {data}: cancela só essa ocorrência (ex.: cliente fixo avisou que falta)."""
+    body = request.get_json(force=True, silent=True) or {}
+    data_iso = normalizar_data(body.get("data") or "")
+    if not data_iso:
+        return jsonify(error="Data inválida."), 400
+    if ocorrencia(rec_id, data_iso) is None:
+        return jsonify(error="Ocorrência não encontrada."), 404
+    escrever("INSERT OR IGNORE INTO recorrencias_excecoes (recorrencia_id, data) VALUES (?, ?)",
+             (rec_id, data_iso))
+    cache_recorrencias.invalidar()
+    barramento.publicar("recorrencia.excecao", {"id": rec_id, "data": data_iso}, (data_iso,))
+    return jsonify(ok=True)
+
+@app.post("/recorrencias/<int:rec_id>/ocorrencias/<data>")
+def materializar_ocorrencia(rec_id, data):
+    """Vira agendamento real (p/ finalizar, remarcar...): exceção + reserva numa transação."""
+    data_iso = normalizar_data(data)
+    if not data_iso:
+        return jsonify(error="Data inválida."), 400
+    oc = ocorrencia(rec_id, data_iso)
+    if oc is None:
+        return jsonify(error="Ocorrência não encontrada."), 404
+    if oc.tipo != "agendamento":
+        return jsonify(error="Só recorrências de agendamento viram agendamento."), 400
+    dados = dict(nome=oc.nome_cliente, telefone=oc.telefone, hora=oc.hora, servico=oc.servico,
+                 profissional_id=oc.profissional_id, duracao_min=oc.duracao_min)
+    try:
+        new_id, _ = escritor.executar(reservas.materializar, rec_id, data_iso, **dados)
+    except reservas.NaoEncontrado:
+        return jsonify(error="Ocorrência já materializada ou pulada."), 409
+    except reservas.DiaBloqueado:
+        return jsonify(error=f"Data bloqueada ({data_iso})."), 409
+    except reservas.SlotOcupado:
+        return jsonify(error="Já existe item nesse horário."), 409
+    cache_recorrencias.invalidar()
+    novo = dict(id=new_id, data=data_iso, **dados, status="agendado", recorrencia_id=rec_id)
+    barramento.publicar("agendamento.criado", novo, (data_iso,))
+    return jsonify(novo), 201
+
+# -------- Clientes --------
+MAX_BUSCA = 50
+
+def consulta_busca(q: str):
+    """(tabela FTS, expressão MATCH) para `q`, ou None se não der para buscar."""
+    digitos = "".join(filter(str.isdigit, q))
+    if len(digitos) >= 3 and not any(ch.isalpha() for ch in q):
+        return "busca_telefone", f'"{digitos}"'  # trigramas: acha o pedaço em qualquer posição
+    termos = re.findall(r"\w+", q)
+    if not termos:
+        return None
+    # cada palavra vira prefixo ("joa silv" -> "joa"* AND "silv"*); acento some no tokenizer
+    return "busca_nome", " ".join(f'"{t}"*' for t in termos)
+
+@app.get("/clientes/busca")
+def buscar_clientes():
+    """
+    ?q= pedaço do nome (prefixo, sem acento: "joa" acha "João") ou do telefone (3+ dígitos).
+    Um item por cliente (`clientes`; sem cadastro, por telefone), com o próximo horário
+    agendado e a última visita.
+    """
+    consulta = consulta_busca(request.args.get("q") or "")
+    if consulta is None:
+        return jsonify(error="Informe q (nome ou 3+ dígitos do telefone)."), 400
+    try:
+        limite = min(int(request.args.get("limit") or 20), MAX_BUSCA)
+    except ValueError:
+        return jsonify(error="limit inválido."), 400
+    tabela, expressao = consulta
+    rows = conn().execute(f"""
+        WITH clientes AS (
+          SELECT max(a.cliente_id) AS cliente_id, max(a.id) AS ultimo_id, count(*) AS agendamentos,
+                 min(CASE WHEN a.status = 'agendado' AND a.data >= :hoje
+                          THEN a.data || ' ' || a.hora END) AS proximo,
+                 max(CASE WHEN a.status = 'finalizado' THEN a.data END) AS ultima_visita
+            FROM (SELECT a.id, a.cliente_id, a.telefone_digitos, a.status, a.data, a.hora
+                    FROM {tabela} b JOIN agendamentos a ON a.id = b.rowid
+                   WHERE {tabela} MATCH :q
+                  UNION ALL  -- o índice FTS cobre também o histórico (mesmo rowid)
+                  SELECT h.id, h.cliente_id, h.telefone_digitos, h.status, h.data, h.hora
+                    FROM {tabela} b JOIN agendamentos_historico h ON h.id = b.rowid
+                   WHERE {tabela} MATCH :q) a
+           WHERE a.status <> 'bloqueado'
+           GROUP BY coalesce('c' || a.cliente_id, 't' || a.telefone_digitos))
+        SELECT c.cliente_id, coalesce(u.nome_cliente, h.nome_cliente) AS nome,
+               coalesce(u.telefone, h.telefone) AS telefone,
+               coalesce(u.telefone_digitos, h.telefone_digitos) AS telefone_digitos, c.agendamentos,
+               c.proximo, c.ultima_visita
+          FROM clientes c LEFT JOIN agendamentos u ON u.id = c.ultimo_id
+               LEFT JOIN agendamentos_historico h ON h.id = c.ultimo_id
+         ORDER BY c.proximo IS NULL, c.proximo, c.ultimo_id DESC
+         LIMIT :limite""", {"q": expressao, "hoje": date.today().isoformat(), "limite": limite})
+    itens = []
+    for r in rows:
+        item = dict(r)
+        if item["proximo"]:
+            data_prox, hora_prox = item["proximo"].split(" ", 1)
+            item["proximo"] = {"data": data_prox, "hora": hora_prox}
+        itens.append(item)
+    return jsonify(items=itens)
+
+@app.get("/clientes/<int:cliente_id>/historico")
+def historico_cliente(cliente_id):
+    """Agendamentos do cliente, mais recentes primeiro (?limit=, ?antes=YYYY-MM-DD p/ paginar)."""
+    c = conn()
+    cliente = c.execute("SELECT id, nome, telefone_e164, criado_em, atualizado_em FROM clientes WHERE id = ?",
+                        (cliente_id,)).fetchone()
+    if cliente is None:
+        return jsonify(error="Cliente não encontrado."), 404
+    try:
+        limite = int(request.args.get("limit") or 100)
+    except ValueError:
+        return jsonify(error="limit inválido."), 400
+    if not 1 <= limite <= MAX_LIMITE:
+        return jsonify(error=f"limit deve estar entre 1 e {MAX_LIMITE}."), 400
+    antes = normalizar_data(request.args.get("antes") or "") or "9999-12-31"
+    # seek em idx_ag_cliente (cliente_id, data) de trás para frente (e em idx_hist_cliente)
+    rows = [dict(r) for r in c.execute(f"""
+        SELECT {reservas.SQL_COLUNAS} FROM {arquivo.fonte(c, None, antes)}
+         WHERE cliente_id = ? AND data < ?
+         ORDER BY data DESC, hora DESC LIMIT ?""", (cliente_id, antes, limite))]
+    return jsonify(cliente=dict(cliente), items=rows)
+
+# -------- Serviços --------
+@app.get("/servicos")
+def listar_servicos():
+    rows = [dict(r) for r in conn().execute("SELECT id, nome, duracao_min, ativo FROM servicos ORDER BY nome")]
+    return jsonify(items=rows)
+
+def ler_duracao(valor):
+    if not isinstance(valor, int) or not 5 <= valor <= 600:
+        return None
+    return valor
+
+@app.post("/servicos")
+def criar_servico():
+    body = request.get_json(force=True, silent=True) or {}
+    nome = (body.get("nome") or "").strip()
+    duracao = ler_duracao(body.get("duracao_min"))
+    if not (nome and duracao):
+        return jsonify(error="Informe nome e duracao_min (5 a 600 minutos)."), 400
+    try:
+        _, servico_id, _ = escrever("INSERT INTO servicos (nome, duracao_min) VALUES (?, ?)", (nome, duracao))
+    except sqlite3.IntegrityError:
+        return jsonify(error="Serviço já existe."), 409
+    return jsonify(id=servico_id, nome=nome, duracao_min=duracao, ativo=1), 201
+
+@app.patch("/servicos/<int:servico_id>")
+def atualizar_servico(servico_id):
+    """{nome?, duracao_min?, ativo?}: vale para os próximos agendamentos (os existentes mantêm a duração)."""
+    body = request.get_json(force=True, silent=True) or {}
+    campos = {}
+    if (body.get("nome") or "").strip():
+        campos["nome"] = body["nome"].strip()
+    if "duracao_min" in body:
+        campos["duracao_min"] = ler_duracao(body["duracao_min"])
+        if campos["duracao_min"] is None:
+            return jsonify(error="duracao_min deve estar entre 5 e 600."), 400
+    if "ativo" in body:
+        campos["ativo"] = 1 if body["ativo"] else 0
+    if not campos:
+        return jsonify(error="Nada para atualizar."), 400
+    sets = ", ".join(f"{k} = ?" for k in campos)
+    try:
+        alterados, _, _ = escrever(f"UPDATE servicos SET {sets} WHERE id = ?", (*campos.values(), servico_id))
+    except sqlite3.IntegrityError:
+        return jsonify(error="Serviço já existe."), 409
+    if alterados == 0:
+        return jsonify(error="Serviço não encontrado."), 404
+    return jsonify(ok=True)
+
+# -------- Profissionais --------
+@app.get("/profissionais")
+def listar_profissionais():
+    rows = [dict(r) for r in conn().execute("SELECT id, nome, ativo FROM profissionais ORDER BY id")]
+    return jsonify(items=rows)
+
+@app.post("/profissionais")
+def criar_profissional():
+    body = request.get_json(force=True, silent=True) or {}
+    nome = (body.get("nome") or "").strip()
+    if not nome:
+        return jsonify(error="Informe o nome."), 400
+    _, prof_id, _ = escrever("INSERT INTO profissionais (nome) VALUES (?)", (nome,))
+    return jsonify(id=prof_id, nome=nome, ativo=1), 201
+
+@app.patch("/profissionais/<int:prof_id>")
+def atualizar_profissional(prof_id):
+    """{nome?, ativo?}: inativo some da disponibilidade, mas mantém o histórico."""
+    body = request.get_json(force=True, silent=True) or {}
+    campos = {}
+    if (body.get("nome") or "").strip():
+        campos["nome"] = body["nome"].strip()
+    if "ativo" in body:
+        campos["ativo"] = 1 if body["ativo"] else 0
+    if not campos:
+        return jsonify(error="Nada para atualizar."), 400
+    sets = ", ".join(f"{k} = ?" for k in campos)
+    alterados, _, _ = escrever(f"UPDATE profissionais SET {sets} WHERE id = ?", (*campos.values(), prof_id))
+    if alterados == 0:
+        return jsonify(error="Profissional não encontrado."), 404
     return jsonify(ok=True)
 
 # -------- Remoções para Histórico --------
 @app.delete("/agendamentos/<int:ag_id>")
 def deletar_agendamento(ag_id):
-    c = conn(); cur = c.cursor()
-    cur.execute("DELETE FROM agendamentos WHERE id=? AND status IN ('finalizado','cancelado')", (ag_id,))
-    if cur.rowcount == 0:
-        c.close(); return jsonify(error="Só é permitido remover finalizados/cancelados."), 400
-    c.commit(); c.close()
+    def remover(c):
+        for tabela in ("agendamentos", "agendamentos_historico"):
+            linhas = c.execute(f"DELETE FROM {tabela} WHERE id=? AND status IN ('finalizado','cancelado') "
+                               f"RETURNING data", (ag_id,)).fetchall()
+            if linhas:
+                return linhas
+        return []
+    linhas = escritor.executar(remover)
+    if not linhas:
+        return jsonify(error="Só é permitido remover finalizados/cancelados."), 400
+    row = linhas[0]
+    barramento.publicar("agendamento.removido", {"id": ag_id, "data": row["data"]}, (row["data"],))
     return jsonify(ok=True)
 
 @app.delete("/agendamentos")
@@ -322,11 +1228,164 @@ def deletar_agendamentos():
     status = request.args.get("status")
     if status != "cancelado":
         return jsonify(error="Para limpeza em massa, use ?status=cancelado"), 400
-    c = conn(); cur = c.cursor()
-    cur.execute("DELETE FROM agendamentos WHERE status='cancelado'")
-    c.commit(); c.close()
+    def remover(c):
+        for tabela in ("agendamentos", "agendamentos_historico"):
+            c.execute(f"DELETE FROM {tabela} WHERE status='cancelado'")
+    escritor.executar(remover)
+    barramento.publicar("agendamentos.removidos", {"status": "cancelado"})
     return jsonify(ok=True, removidos=True)
 
+# -------- Relatórios --------
+MAX_DIAS_RELATORIO = 1830
+
+@app.get("/relatorios")
+def get_relatorios():
+    """?inicio=&fim=&agrupar=dia|dia_semana|hora|servico — servido por daily_stats."""
+    inicio = normalizar_data(request.args.get("inicio") or "")
+    fim = normalizar_data(request.args.get("fim") or "")
+    agrupar = request.args.get("agrupar") or "dia"
+    if not (inicio and fim):
+        return jsonify(error="Informe inicio e fim."), 400
+    if agrupar not in relatorios.AGRUPAMENTOS:
+        return jsonify(error=f"agrupar aceita: {', '.join(relatorios.AGRUPAMENTOS)}."), 400
+    d0, d1 = date.fromisoformat(inicio), date.fromisoformat(fim)
+    if d1 < d0:
+        return jsonify(error="Fim antes do início."), 400
+    if (d1 - d0).days >= MAX_DIAS_RELATORIO:
+        return jsonify(error=f"Intervalo máximo: {MAX_DIAS_RELATORIO} dias."), 400
+    itens = relatorios.agregar(conn(), inicio, fim, agrupar, GRADE, dias_bloqueados(inicio, fim),
+                               cadeiras=len(profissionais_ativos()) or 1)
+    return jsonify(inicio=inicio, fim=fim, agrupar=agrupar, itens=itens)
+
+# -------- Exportação (streaming) --------
+EXPORT_LOTE = 500
+
+@app.get("/agendamentos/export")
+def exportar_agendamentos():
+    """
+    Histórico completo em NDJSON (padrão) ou CSV, linha a linha.
+    ?format=ndjson|csv &from=/&to= (ou inicio/fim) &status=
+    A memória fica constante: o cursor é lido em blocos de EXPORT_LOTE linhas.
+    """
+    formato = (request.args.get("format") or "ndjson").lower()
+    if formato not in ("ndjson", "csv"):
+        return jsonify(error="format deve ser ndjson ou csv."), 400
+    params = []; where = []; limites = {}
+    for nomes, op in ((("from", "inicio"), ">="), (("to", "fim"), "<=")):
+        txt = next((request.args[n] for n in nomes if request.args.get(n)), None)
+        if txt:
+            data_iso = normalizar_data(txt)
+            if not data_iso:
+                return jsonify(error="Data inválida."), 400
+            where.append(f"data {op} ?"); params.append(data_iso); limites[op] = data_iso
+    if request.args.get("status"):
+        where.append("status = ?"); params.append(request.args["status"])
+
+    # ORDER BY data, id sai direto de idx_ag_data (rowid já ordenado dentro do dia)
+    sql = f"SELECT {reservas.SQL_COLUNAS} FROM {arquivo.fonte(conn(), limites.get('>='), limites.get('<='))}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY data, id"
+
+    def gerar():
+        # conexão própria: o contexto do request já terminou quando o corpo é lido
+        with pool.conexao() as c:
+            cur = c.execute(sql, params)
+            if formato == "csv":
+                buf = io.StringIO(); w = csv.writer(buf)
+                w.writerow(reservas.COLUNAS)
+            while True:
+                linhas = cur.fetchmany(EXPORT_LOTE)
+                if not linhas:
+                    break
+                if formato == "csv":
+                    w.writerows(tuple(r) for r in linhas)
+                    yield buf.getvalue()
+                    buf.seek(0); buf.truncate()
+                else:
+                    yield "".join(json.dumps(dict(r), ensure_ascii=False) + "\n" for r in linhas)
+            if formato == "csv" and buf.tell():
+                yield buf.getvalue()  # só o cabeçalho, se não houve linhas
+
+    mimetype = "text/csv" if formato == "csv" else "application/x-ndjson"
+    resp = app.response_class(gerar(), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="agendamentos.{formato}"'
+    return resp
+
+# -------- Tempo real (SSE) --------
+@app.get("/agendamentos/stream")
+def stream_agendamentos():
+    """
+    Deltas da agenda em text/event-stream (?data= filtra por dia).
+    Não segura conexão do pool: o gerador só lê da fila do barramento.
+    """
+    dia = None
+    if request.args.get("data"):
+        dia = normalizar_data(request.args["data"])
+        if not dia:
+            return jsonify(error="Data inválida."), 400
+    ultimo_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    a, pendentes = barramento.assinar(dia, ultimo_id)
+    if a is None:
+        return jsonify(error="Muitas conexões de tempo real abertas, tente novamente."), 503
+    resp = app.response_class(eventos.fluxo(barramento, a, pendentes, SSE_HEARTBEAT),
+                              mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # desliga buffer de proxy (nginx/Render)
+    return resp
+
+# -------- Admin --------
+@app.get("/admin/pool")
+def metricas_pool():
+    return jsonify(**pool.metricas(), lock=db.metricas_lock(), escritor=escritor.metricas())
+
+@app.get("/metrics")
+def metricas_prometheus():
+    return app.response_class(instrumentacao.exportar(pool, METRICAS, escritor),
+                              mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/eventos")
+def metricas_eventos():
+    return jsonify(barramento.metricas())
+
+@app.get("/admin/arquivo")
+def status_arquivo():
+    c = conn()
+    tabelas = {t: c.execute(f"SELECT count(*), min(data), max(data) FROM {t}").fetchone()
+               for t in ("agendamentos", "agendamentos_historico")}
+    return jsonify(**arquivador.metricas(),
+                   **{nome: {"linhas": n, "de": d0, "ate": d1}
+                      for nome, (n, d0, d1) in zip(("quente", "historico"), tabelas.values())})
+
+@app.post("/admin/arquivo")
+def executar_arquivo():
+    """Roda um ciclo de arquivamento agora (além do agendado)."""
+    return jsonify(arquivados=arquivador.executar())
+
+@app.get("/admin/manutencao")
+def status_manutencao():
+    c = conn()
+    banco = {p: c.execute(f"PRAGMA {p}").fetchone()[0]
+             for p in ("page_size", "page_count", "freelist_count", "auto_vacuum", "journal_mode")}
+    wal = DB_NAME + "-wal"
+    banco["wal_bytes"] = os.path.getsize(wal) if os.path.exists(wal) else 0
+    backups = [{"arquivo": os.path.basename(b), "bytes": os.path.getsize(b)} for b in manutentor.backups()]
+    return jsonify(**manutentor.metricas(), banco=banco, backups=backups)
+
+@app.post("/admin/manutencao/<tarefa>")
+def executar_manutencao(tarefa):
+    """
+    Roda uma tarefa agora (checkpoint, vacuo, otimizar, backup, converter), além das agendadas.
+    As longas (converter) rodam em fundo: 202 na hora, andamento em GET /admin/manutencao.
+    """
+    if tarefa not in manutencao.TAREFAS:
+        return jsonify(error=f"Tarefa inválida. Use: {', '.join(manutencao.TAREFAS)}."), 404
+    if tarefa in manutencao.TAREFAS_LONGAS:
+        if not manutentor.iniciar(tarefa):
+            return jsonify(error="Essa tarefa já está em andamento."), 409
+        return jsonify(tarefa=tarefa, em_andamento=True), 202
+    return jsonify(tarefa=tarefa, resultado=manutentor.executar(tarefa))
+
 @app.get("/")
 def root():
     return "API Barbearia OK (serviço habilitado)"
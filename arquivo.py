@@ -0,0 +1,116 @@
+# arquivo.py
+"""
+Arquivamento: finalizados/cancelados de datas passadas saem de `agendamentos`
+(a tabela quente fica com a agenda das próximas semanas e os dias recentes) e
+vão para `agendamentos_historico`, em lotes.
+
+- cada lote é UM item do escritor (group commit): DELETE ... RETURNING e INSERT
+  na mesma transação; entre um lote e outro passam as escritas das rotas;
+- o id é preservado (AUTOINCREMENT em agendamentos: nunca reaproveitado);
+- daily_stats e a busca de clientes não mudam: o trigger de DELETE em
+  agendamentos desconta e o de INSERT no histórico devolve (ver esquema.py);
+- leituras só pagam o UNION ALL (view `agendamentos_todos`) quando o intervalo
+  pedido tem linha arquivada: `fonte()` decide com uma descida em idx_hist_data.
+"""
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+from reservas import COLUNAS, SQL_COLUNAS
+
+ARQUIVAVEIS = ("finalizado", "cancelado")
+
+# os `lote` itens mais antigos, já removidos da tabela quente (triggers de DELETE disparam)
+SQL_RETIRAR = f"""
+    DELETE FROM agendamentos
+     WHERE id IN (SELECT id FROM agendamentos
+                   WHERE data < ? AND status IN ('finalizado','cancelado')
+                   ORDER BY data LIMIT ?)
+    RETURNING {SQL_COLUNAS}"""
+SQL_GUARDAR = (f"INSERT INTO agendamentos_historico ({SQL_COLUNAS}) "
+               f"VALUES ({', '.join('?' * len(COLUNAS))})")
+
+
+def arquivar_lote(c, corte: str, lote: int) -> int:
+    """Move até `lote` itens arquiváveis com data < `corte` (sem transação própria: roda no escritor)."""
+    linhas = c.execute(SQL_RETIRAR, (corte, lote)).fetchall()
+    c.executemany(SQL_GUARDAR, [tuple(r) for r in linhas])
+    return len(linhas)
+
+
+def fonte(c, inicio: str | None = None, fim: str | None = None) -> str:
+    """Tabela/view para ler [inicio, fim] (None = sem limite): o histórico só entra se tiver linha lá."""
+    row = c.execute("SELECT 1 FROM agendamentos_historico WHERE data BETWEEN ? AND ? LIMIT 1",
+                    (inicio or "", fim or "9999-12-31")).fetchone()
+    return "agendamentos_todos" if row else "agendamentos"
+
+
+class Arquivador:
+    """Thread de fundo que roda um ciclo de arquivamento a cada `intervalo` segundos (0 = desligado)."""
+
+    def __init__(self, escritor, dias: int = 14, lote: int = 500, intervalo: float = 3600.0):
+        self.escritor = escritor
+        self.dias = dias          # dias passados que continuam na tabela quente
+        self.lote = lote
+        self.intervalo = intervalo
+        self._mutex = threading.Lock()
+        self._ciclo = threading.Lock()  # um ciclo por vez (thread ou POST /admin/arquivo)
+        self._thread = None
+        self._pid = None
+        self._stats = {"ciclos": 0, "lotes": 0, "arquivados": 0, "falhas": 0,
+                       "ultimo_ciclo": None, "ultimo_corte": None, "ultimo_erro": None, "tempo": 0.0}
+
+    def garantir(self):
+        # sobe no primeiro request (e de novo após fork: a thread não é herdada)
+        if self.intervalo <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._mutex:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._laco, name="arquivador", daemon=True)
+                self._thread.start()
+
+    def _laco(self):
+        while True:
+            try:
+                self.executar()
+            except Exception:
+                pass  # já contado em executar(); tenta de novo no próximo ciclo
+            time.sleep(self.intervalo)
+
+    def executar(self) -> int:
+        """Um ciclo: lotes até não sobrar nada arquivável antes do corte. Devolve quantos moveu."""
+        corte = (date.today() - timedelta(days=self.dias)).isoformat()
+        movidos = lotes = 0
+        inicio = time.perf_counter()
+        with self._ciclo:
+            try:
+                while True:
+                    n = self.escritor.executar(arquivar_lote, corte, self.lote)
+                    movidos += n; lotes += 1
+                    if n < self.lote:
+                        break
+            except Exception as e:
+                with self._mutex:
+                    self._stats["falhas"] += 1
+                    self._stats["ultimo_erro"] = repr(e)
+                raise
+            finally:
+                with self._mutex:
+                    self._stats["ciclos"] += 1
+                    self._stats["lotes"] += lotes
+                    self._stats["arquivados"] += movidos
+                    self._stats["ultimo_ciclo"] = time.strftime("%Y-%m-%d %H:%M:%S")
+                    self._stats["ultimo_corte"] = corte
+                    self._stats["tempo"] += time.perf_counter() - inicio
+        return movidos
+
+    def metricas(self) -> dict:
+        with self._mutex:
+            s = dict(self._stats)
+        ativo = self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+        return {"ativo": ativo, "dias_quentes": self.dias, "lote": self.lote, "intervalo_s": self.intervalo,
+                "ciclos": s["ciclos"], "lotes": s["lotes"], "arquivados": s["arquivados"],
+                "falhas": s["falhas"], "ultimo_ciclo": s["ultimo_ciclo"], "ultimo_corte": s["ultimo_corte"],
+                "ultimo_erro": s["ultimo_erro"], "tempo_ms": round(s["tempo"] * 1000, 2)}
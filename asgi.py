@@ -0,0 +1,206 @@
+# asgi.py
+"""
+Modo ASGI: as mesmas rotas do app.py servidas por um servidor ASGI
+
+    uvicorn asgi:aplicacao --host 0.0.0.0 --port $PORT
+
+Cada request é um handler async que não segura thread enquanto espera:
+
+- leituras (GET/HEAD/OPTIONS) rodam a rota Flask num pool de `ASGI_LEITORES` threads;
+- escritas (POST/PATCH/PUT/DELETE) rodam em `ASGI_ESCRITAS` threads cujo acesso ao
+  banco passa pela fila do escritor único (app.escritor, group commit): dentro do
+  processo ninguém disputa o lock de escrita do SQLite e um burst vira poucos commits;
+- `/agendamentos/stream` (SSE) é atendido direto no event loop: milhares de
+  painéis ociosos custam um asyncio.Event cada, não uma thread.
+
+As rotas continuam escritas uma vez só (app.py); aqui fica só o transporte.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as web
+import eventos
+
+# Threads de leitura: uma conexão do pool para cada, e uma sobrando para as escritas
+# (o escritor tem conexão própria, fora do pool)
+LEITORES = int(os.environ.get("ASGI_LEITORES", str(max(1, web.pool.tamanho - 1))))
+# Threads de escrita só validam e esperam o lote: quanto mais, maiores os lotes. A conexão
+# do pool fica com elas só na validação; é devolvida antes de esperar o escritor
+# (app.liberar_conexao), então podem ser mais que as conexões do pool
+ESCRITAS = int(os.environ.get("ASGI_ESCRITAS", "16"))
+METODOS_LEITURA = ("GET", "HEAD", "OPTIONS")
+ROTA_STREAM = "/agendamentos/stream"
+BLOCO_RESPOSTA = 64 * 1024  # bytes por ida ao executor ao repassar corpos em streaming
+
+leitores = ThreadPoolExecutor(max_workers=LEITORES, thread_name_prefix="asgi-leitor")
+escritas = ThreadPoolExecutor(max_workers=ESCRITAS, thread_name_prefix="asgi-escrita")
+
+
+def _environ(scope: dict, corpo: bytes) -> dict:
+    """Environ WSGI (PEP 3333) equivalente ao scope HTTP do ASGI."""
+    servidor = scope.get("server") or ("localhost", 80)
+    cliente = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": cliente[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(corpo),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for nome, valor in scope.get("headers", ()):
+        nome = nome.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nome in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[nome] = valor
+            continue
+        chave = f"HTTP_{nome}"
+        environ[chave] = f"{environ[chave]},{valor}" if chave in environ else valor
+    environ["CONTENT_LENGTH"] = str(len(corpo))  # corpo já lido inteiro (vale também p/ chunked)
+    return environ
+
+
+def _chamar_wsgi(environ: dict):
+    """Roda a rota Flask (na thread do executor): (status, headers, iterador do corpo)."""
+    inicio = {}
+
+    def start_response(status, headers, exc_info=None):
+        inicio["status"], inicio["headers"] = status, headers
+
+    corpo = web.app.wsgi_app(environ, start_response)
+    return int(inicio["status"].split(" ", 1)[0]), inicio["headers"], corpo
+
+
+def _proximo_bloco(it) -> bytes | None:
+    """Junta pedaços do corpo até BLOCO_RESPOSTA; None no fim."""
+    partes, tamanho = [], 0
+    for parte in it:
+        partes.append(parte)
+        tamanho += len(parte)
+        if tamanho >= BLOCO_RESPOSTA:
+            break
+    else:
+        if not partes:
+            return None
+    return b"".join(partes)
+
+
+async def _ler_corpo(receive) -> bytes:
+    partes = []
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            break
+        partes.append(msg.get("body", b""))
+        if not msg.get("more_body"):
+            break
+    return b"".join(partes)
+
+
+async def _responder_json(send, status: int, corpo: bytes):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": corpo})
+
+
+async def stream(scope, receive, send):
+    """SSE no event loop: mesma validação e formato da rota Flask."""
+    args = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", ())}
+    dia = None
+    if args.get("data"):
+        dia = web.normalizar_data(args["data"][0])
+        if not dia:
+            return await _responder_json(send, 400, '{"error":"Data inválida."}'.encode())
+    ultimo_id = headers.get("last-event-id") or (args.get("lastEventId") or [None])[0]
+    a, pendentes = web.barramento.assinar(dia, ultimo_id, classe=eventos.AssinaturaAsync)
+    if a is None:
+        return await _responder_json(
+            send, 503, '{"error":"Muitas conexões de tempo real abertas, tente novamente."}'.encode())
+
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream; charset=utf-8"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+        (b"access-control-allow-origin", b"*"),
+    ]})
+    desconectou = asyncio.ensure_future(receive())  # http.disconnect quando o painel fecha
+    corpo = eventos.fluxo_async(web.barramento, a, pendentes, web.SSE_HEARTBEAT)
+    try:
+        while not desconectou.done():
+            proximo = asyncio.ensure_future(corpo.__anext__())
+            await asyncio.wait({proximo, desconectou}, return_when=asyncio.FIRST_COMPLETED)
+            if not proximo.done():
+                proximo.cancel()
+                await asyncio.gather(proximo, return_exceptions=True)
+                break
+            try:
+                pedaco = proximo.result()
+            except StopAsyncIteration:
+                break
+            await send({"type": "http.response.body", "body": pedaco.encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass  # cliente sumiu no meio do envio
+    finally:
+        desconectou.cancel()
+        await corpo.aclose()
+
+
+async def http(scope, receive, send):
+    if scope["path"] == ROTA_STREAM and scope["method"] == "GET":
+        return await stream(scope, receive, send)
+    environ = _environ(scope, await _ler_corpo(receive))
+    executor = leitores if scope["method"] in METODOS_LEITURA else escritas
+    loop = asyncio.get_running_loop()
+    status, headers, corpo = await loop.run_in_executor(executor, _chamar_wsgi, environ)
+    try:
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        it = iter(corpo)
+        while (bloco := await loop.run_in_executor(executor, _proximo_bloco, it)) is not None:
+            await send({"type": "http.response.body", "body": bloco, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(corpo, "close"):
+            # fecha o iterável (ex.: gerador do export); o teardown do Flask, que devolve a
+            # conexão ao pool, já rodou quando wsgi_app retornou em _chamar_wsgi
+            await loop.run_in_executor(executor, corpo.close)
+
+
+async def lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            # termina as escritas já enfileiradas sem travar o event loop
+            await asyncio.to_thread(escritas.shutdown, wait=True)
+            leitores.shutdown(wait=False, cancel_futures=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def aplicacao(scope, receive, send):
+    if scope["type"] == "http":
+        return await http(scope, receive, send)
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "websocket":
+        # sem rotas websocket: recusa o handshake (o servidor responde 403)
+        if (await receive())["type"] == "websocket.connect":
+            await send({"type": "websocket.close"})
+    # outros tipos de scope: ignorados
@@ -1,120 +1,82 @@
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 
-VERSAO = "1.6-bloqueios"
+import esquema
+import grade
+import nucleo
+import reservas
+from db import transacao
+from nucleo import data_eh_passada, formatar_telefone, normalizar_data
+
+VERSAO = "1.7-nucleo"
 
 print(f"=== Barbearia Teodoro's CLI – versão {VERSAO} ===")
 
-# --------- Utils ---------
-def formatar_telefone(numero: str) -> str:
-    numero = ''.join(filter(str.isdigit, numero))
-    if len(numero) == 11:
-        return f"({numero[:2]}) {numero[2:7]}-{numero[7:]}"
-    elif len(numero) == 10:
-        return f"({numero[:2]}) {numero[2:6]}-{numero[6:]}"
-    return numero
-
-def normalizar_data(txt: str) -> str | None:
-    """
-    Converte várias entradas para ISO (AAAA-MM-DD).
-    Aceita:
-      - YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY, YYYY/MM/DD, YYYY.MM.DD
-      - 'hoje', 'amanha'/'amanhã'
-      - 8 dígitos: DDMMYYYY ou YYYYMMDD
-    """
-    if not txt:
-        return None
-    raw = txt.strip().lower()
-
-    if raw in ("hoje",):
-        return datetime.today().strftime("%Y-%m-%d")
-    if raw in ("amanha", "amanhã"):
-        return (datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d")
-
-    if raw.isdigit() and len(raw) == 8:
-        for fmt in ("%d%m%Y", "%Y%m%d"):
-            try:
-                return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
-            except ValueError:
-                pass
-        return None
+# Mesmo banco, schema, conexão (WAL + busy_timeout, BEGIN IMMEDIATE nas escritas) e regras
+# da API: dá para usar o CLI no barbearia.db de produção com a API no ar.
+CAMINHO = nucleo.caminho_banco()
+pool = nucleo.abrir_pool(CAMINHO, tamanho=1)
+calendario = nucleo.Calendario(CAMINHO)
+
+# --------- Consultas (texto fixo: preparadas uma vez e reaproveitadas pela conexão) ---------
+# listagens leem também o histórico arquivado (ver arquivo.py); mudanças de status só na tabela quente
+SQL_TODOS = f"SELECT {reservas.SQL_COLUNAS} FROM agendamentos_todos ORDER BY data, hora_ordem, id"
+SQL_POR_STATUS = (f"SELECT {reservas.SQL_COLUNAS} FROM agendamentos_todos WHERE status = ? "
+                  f"ORDER BY data, hora_ordem, id")
+SQL_DO_DIA = (f"SELECT {reservas.SQL_COLUNAS} FROM agendamentos_todos WHERE data = ? "
+              f"ORDER BY status_ordem, hora_ordem, id")
+SQL_UM = f"SELECT {reservas.SQL_COLUNAS} FROM agendamentos WHERE id = ?"
+SQL_BLOQUEIOS = "SELECT dia, motivo, criado_em FROM bloqueios ORDER BY dia"
 
-    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%Y.%m.%d"):
-        try:
-            return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
-        except ValueError:
-            continue
-    return None
+# --------- Setup ---------
+def criar_tabelas():
+    with pool.conexao() as c:
+        esquema.migrar(c)
 
-def data_eh_passada(data_iso: str) -> bool:
-    """True se data for anterior a hoje."""
-    try:
-        d = datetime.strptime(data_iso, "%Y-%m-%d").date()
-        return d < datetime.today().date()
-    except Exception:
-        return True
+def consultar(sql: str, params=()) -> list:
+    with pool.conexao() as c:
+        return c.execute(sql, params).fetchall()
 
-def conectar():
-    return sqlite3.connect("barbearia.db")
+def ler_hora(txt: str) -> str | None:
+    try:
+        return grade.normalizar_hora(txt) if txt else None
+    except ValueError:
+        return None
 
-# --------- Setup ---------
-def criar_tabelas():
-    conn = conectar()
-    cursor = conn.cursor()
-
-    # Agendamentos
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS agendamentos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nome_cliente TEXT NOT NULL,
-        telefone TEXT NOT NULL,
-        data TEXT NOT NULL,
-        status TEXT DEFAULT 'agendado',
-        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ag_data ON agendamentos(data)")
-    cursor.execute("""
-    CREATE UNIQUE INDEX IF NOT EXISTS ux_ag_data_fone_agendado
-           ON agendamentos(data, telefone)
-        WHERE status = 'agendado'
-    """)
-
-    # Bloqueios de data (um por dia)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS bloqueios (
-        dia TEXT PRIMARY KEY,
-        motivo TEXT,
-        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_blk_dia ON bloqueios(dia)")
-
-    conn.commit()
-    conn.close()
+def imprimir(ag, com_data: bool = True):
+    print(f"ID: {ag['id']}")
+    print(f"Cliente: {ag['nome_cliente']}")
+    print(f"Telefone: {ag['telefone']}")
+    if com_data:
+        print(f"Data: {ag['data']}")
+    print(f"Hora: {ag['hora'] or '—'}")
+    if ag["servico"]:
+        print(f"Serviço: {ag['servico']}")
+    print(f"Status: {ag['status']}")
+    print(f"Criado em: {ag['criado_em']}")
+    print("-" * 30)
 
 # --------- Bloqueios helpers ---------
 def data_bloqueada(data_iso: str) -> tuple[bool, str | None]:
-    """Retorna (True, motivo) se a data estiver bloqueada, senão (False, None)."""
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("SELECT motivo FROM bloqueios WHERE dia = ?", (data_iso,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return True, row[0] or ""
-    return False, None
+    """Retorna (True, motivo) se a data estiver bloqueada (avulso ou recorrente), senão (False, None)."""
+    return calendario.data_bloqueada(data_iso)
 
 # --------- Casos de uso: Agendamentos ---------
 def inserir_agendamento():
     nome = input("Nome completo do cliente: ").strip()
     telefone = input("Telefone (somente números): ").strip()
     data_txt = input("Data (ex.: 2025-08-15, 15/08/2025, hoje, amanha, 15082025): ").strip()
+    hora_txt = input("Hora (HH:MM): ").strip()
+    servico_txt = input("Serviço (opcional): ").strip()
 
     data_iso = normalizar_data(data_txt)
     if not data_iso:
         print(f"❌ Data inválida: '{data_txt}'.\n")
         return
+    hora = ler_hora(hora_txt)
+    if not hora:
+        print(f"❌ Hora inválida: '{hora_txt}' (use HH:MM).\n")
+        return
 
     if data_eh_passada(data_iso):
         print(f"⛔ Não é permitido agendar em data passada ({data_iso}).\n")
@@ -125,37 +87,26 @@ def inserir_agendamento():
         print(f"⛔ Data {data_iso} está BLOQUEADA. Motivo: {motivo or 'sem motivo informado'}.\n")
         return
 
-    telefone_formatado = formatar_telefone(telefone)
-
-    conn = conectar()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-        INSERT INTO agendamentos (nome_cliente, telefone, data)
-        VALUES (?, ?, ?)
-        """, (nome, telefone_formatado, data_iso))
-        conn.commit()
-        print("✅ Agendamento inserido com sucesso!\n")
-    except sqlite3.IntegrityError:
-        print("⚠️ Já existe um agendamento 'agendado' para esse telefone nessa data.")
-        print("   Cancele o existente ou escolha outra data.\n")
-    finally:
-        conn.close()
+    with pool.conexao() as c:
+        servico, duracao = (reservas.servico_do_catalogo(c, servico_txt or None)
+                            or (servico_txt or None, reservas.DURACAO_PADRAO))
+        try:
+            # mesmo motor da API: bloqueio do dia + conflito + insert num único statement
+            _, profissional = reservas.reservar(
+                c, nome, formatar_telefone(telefone), data_iso, hora, servico, duracao_min=duracao,
+                recorrentes=calendario.ocupados_recorrentes)
+            print(f"✅ Agendamento inserido com sucesso! (profissional {profissional})\n")
+        except reservas.DiaBloqueado:
+            print(f"⛔ Data {data_iso} está BLOQUEADA.\n")
+        except reservas.SlotOcupado:
+            print("⚠️ Já existe item nesse horário (agendado/finalizado/bloqueado).")
+            print("   Escolha outro horário ou data.\n")
 
 def listar_agendamentos(filtro_status: str | None = None):
-    conn = conectar()
-    cursor = conn.cursor()
-
     if filtro_status:
-        cursor.execute(
-            "SELECT * FROM agendamentos WHERE status = ? ORDER BY date(data) ASC, id ASC",
-            (filtro_status,),
-        )
+        agendamentos = consultar(SQL_POR_STATUS, (filtro_status,))
     else:
-        cursor.execute("SELECT * FROM agendamentos ORDER BY date(data) ASC, id ASC")
-
-    agendamentos = cursor.fetchall()
-    conn.close()
+        agendamentos = consultar(SQL_TODOS)
 
     if not agendamentos:
         print("❌ Nenhum agendamento encontrado.\n")
@@ -163,156 +114,69 @@ def listar_agendamentos(filtro_status: str | None = None):
 
     print("📅 Lista de Agendamentos:\n")
     for agendamento in agendamentos:
-        id_, nome, telefone, data, status, criado_em = agendamento
-        print(f"ID: {id_}")
-        print(f"Cliente: {nome}")
-        print(f"Telefone: {telefone}")
-        print(f"Data: {data}")
-        print(f"Status: {status}")
-        print(f"Criado em: {criado_em}")
-        print("-" * 30)
+        imprimir(agendamento)
 
     return agendamentos
 
+def listar_dia(data_iso: str, titulo: str, vazio: str):
+    bloqueada, motivo = data_bloqueada(data_iso)
+    if bloqueada:
+        print(f"🚫 ATENÇÃO: {titulo} está BLOQUEADA. Motivo: {motivo or 'sem motivo informado'}")
+
+    rows = consultar(SQL_DO_DIA, (data_iso,))
+    print(f"\n📆 {titulo} — Total: {len(rows)}\n")
+    if not rows:
+        print(f"⛔ {vazio}\n")
+        return
+
+    for row in rows:
+        imprimir(row, com_data=False)
+
 def listar_por_data():
     data_txt = input("Data para buscar (AAAA-MM-DD, DD/MM/AAAA, hoje, amanha): ").strip()
     data_iso = normalizar_data(data_txt)
     if not data_iso:
         print(f"❌ Data inválida: '{data_txt}'.\n")
         return
-
-    bloqueada, motivo = data_bloqueada(data_iso)
-    if bloqueada:
-        print(f"🚫 ATENÇÃO: {data_iso} está BLOQUEADA. Motivo: {motivo or 'sem motivo informado'}")
-
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM agendamentos
-         WHERE data = ?
-         ORDER BY
-            CASE status
-                WHEN 'agendado' THEN 1
-                WHEN 'finalizado' THEN 2
-                WHEN 'cancelado' THEN 3
-                ELSE 4
-            END, id
-    """, (data_iso,))
-    rows = cursor.fetchall()
-
-    cursor.execute("SELECT COUNT(*) FROM agendamentos WHERE data = ?", (data_iso,))
-    total = cursor.fetchone()[0]
-    conn.close()
-
-    print(f"\n📆 Agendamentos em {data_iso} — Total: {total}\n")
-    if not rows:
-        print("⛔ Nenhum agendamento nessa data.\n")
-        return
-
-    for id_, nome, telefone, data, status, criado_em in rows:
-        print(f"ID: {id_}")
-        print(f"Cliente: {nome}")
-        print(f"Telefone: {telefone}")
-        print(f"Status: {status}")
-        print(f"Criado em: {criado_em}")
-        print("-" * 30)
+    listar_dia(data_iso, f"Agendamentos em {data_iso}", "Nenhum agendamento nessa data.")
 
 def listar_hoje():
     data_iso = datetime.today().strftime("%Y-%m-%d")
-    bloqueada, motivo = data_bloqueada(data_iso)
-    if bloqueada:
-        print(f"🚫 ATENÇÃO: Hoje ({data_iso}) está BLOQUEADA. Motivo: {motivo or 'sem motivo informado'}")
-
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM agendamentos
-         WHERE data = ?
-         ORDER BY
-            CASE status
-                WHEN 'agendado' THEN 1
-                WHEN 'finalizado' THEN 2
-                WHEN 'cancelado' THEN 3
-                ELSE 4
-            END, id
-    """, (data_iso,))
-    rows = cursor.fetchall()
-
-    cursor.execute("SELECT COUNT(*) FROM agendamentos WHERE data = ?", (data_iso,))
-    total = cursor.fetchone()[0]
-    conn.close()
-
-    print(f"\n📆 Hoje ({data_iso}) — Total: {total}\n")
-    if not rows:
-        print("⛔ Nenhum agendamento hoje.\n")
-        return
-
-    for id_, nome, telefone, data, status, criado_em in rows:
-        print(f"ID: {id_}")
-        print(f"Cliente: {nome}")
-        print(f"Telefone: {telefone}")
-        print(f"Status: {status}")
-        print(f"Criado em: {criado_em}")
-        print("-" * 30)
+    listar_dia(data_iso, f"Hoje ({data_iso})", "Nenhum agendamento hoje.")
 
-def cancelar_agendamento():
-    print("\n🔎 Mostrando apenas 'agendado' para cancelar:\n")
+def mudar_status(novo_status: str, verbo: str, sucesso: str):
+    print(f"\n🔎 Mostrando apenas 'agendado' para {verbo}:\n")
     agendados = listar_agendamentos(filtro_status="agendado")
     if not agendados:
         return
 
     try:
-        id_cancelar = int(input("ID para cancelar: ").strip())
+        ag_id = int(input(f"ID para {verbo}: ").strip())
     except ValueError:
         print("❌ ID inválido.\n")
         return
 
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("SELECT status FROM agendamentos WHERE id = ?", (id_cancelar,))
-    row = cursor.fetchone()
+    with pool.conexao() as c:
+        # checagem e UPDATE na mesma transação: a API não muda o status no meio
+        with transacao(c):
+            row = c.execute("SELECT status FROM agendamentos WHERE id = ?", (ag_id,)).fetchone()
+            if not row:
+                print("⚠️ ID não encontrado.\n")
+                return
+            if row["status"] != "agendado":
+                print(f"⚠️ Só é possível {verbo} itens com status 'agendado'.\n")
+                return
+            reservas.atualizar(c, ag_id, {"status": novo_status})
+    print(sucesso)
 
-    if not row:
-        print("⚠️ ID não encontrado.\n")
-    elif row[0] != "agendado":
-        print("⚠️ Só é possível cancelar itens com status 'agendado'.\n")
-    else:
-        cursor.execute("UPDATE agendamentos SET status = 'cancelado' WHERE id = ?", (id_cancelar,))
-        conn.commit()
-        print("❌ Agendamento cancelado com sucesso!\n")
-
-    conn.close()
+def cancelar_agendamento():
+    mudar_status("cancelado", "cancelar", "❌ Agendamento cancelado com sucesso!\n")
 
 def finalizar_agendamento():
-    print("\n🔎 Mostrando apenas 'agendado' para finalizar:\n")
-    agendados = listar_agendamentos(filtro_status="agendado")
-    if not agendados:
-        return
-
-    try:
-        id_finalizar = int(input("ID para finalizar: ").strip())
-    except ValueError:
-        print("❌ ID inválido.\n")
-        return
-
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("SELECT status FROM agendamentos WHERE id = ?", (id_finalizar,))
-    row = cursor.fetchone()
-
-    if not row:
-        print("⚠️ ID não encontrado.\n")
-    elif row[0] != "agendado":
-        print("⚠️ Só é possível finalizar itens com status 'agendado'.\n")
-    else:
-        cursor.execute("UPDATE agendamentos SET status = 'finalizado' WHERE id = ?", (id_finalizar,))
-        conn.commit()
-        print("✅ Agendamento finalizado com sucesso!\n")
-
-    conn.close()
+    mudar_status("finalizado", "finalizar", "✅ Agendamento finalizado com sucesso!\n")
 
 def editar_agendamento():
-    print("\n✏️ Editar agendamento (nome, telefone e/ou data)")
+    print("\n✏️ Editar agendamento (nome, telefone, data e/ou hora)")
     listar_agendamentos()
     try:
         id_editar = int(input("ID para editar: ").strip())
@@ -320,78 +184,74 @@ def editar_agendamento():
         print("❌ ID inválido.\n")
         return
 
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nome_cliente, telefone, data, status FROM agendamentos WHERE id = ?", (id_editar,))
-    row = cursor.fetchone()
-
-    if not row:
+    rows = consultar(SQL_UM, (id_editar,))
+    if not rows:
         print("⚠️ ID não encontrado.\n")
-        conn.close()
         return
 
-    id_, nome_atual, fone_atual, data_atual, status_atual = row
+    atual = rows[0]
     print("\nValores atuais (deixe em branco para manter):")
-    print(f"Nome atual: {nome_atual}")
-    print(f"Telefone atual: {fone_atual}")
-    print(f"Data atual: {data_atual}")
-    print(f"Status atual: {status_atual} (não editável aqui)")
+    print(f"Nome atual: {atual['nome_cliente']}")
+    print(f"Telefone atual: {atual['telefone']}")
+    print(f"Data atual: {atual['data']}")
+    print(f"Hora atual: {atual['hora'] or '—'}")
+    print(f"Status atual: {atual['status']} (não editável aqui)")
 
     novo_nome = input("Novo nome: ").strip()
     novo_fone = input("Novo telefone (somente números): ").strip()
     nova_data = input("Nova data (AAAA-MM-DD, DD/MM/AAAA, hoje, amanha) [enter p/ manter]: ").strip()
+    nova_hora = input("Nova hora (HH:MM) [enter p/ manter]: ").strip()
 
-    if novo_nome == "":
-        novo_nome = nome_atual
-
-    if novo_fone == "":
-        fone_formatado = fone_atual
-    else:
-        fone_formatado = formatar_telefone(novo_fone)
+    campos = {}
+    if novo_nome:
+        campos["nome_cliente"] = novo_nome
+    if novo_fone:
+        campos["telefone"] = formatar_telefone(novo_fone)
 
-    if nova_data == "":
-        nova_data_iso = data_atual
-    else:
+    nova_data_iso = None
+    if nova_data:
         nova_data_iso = normalizar_data(nova_data)
         if not nova_data_iso:
             print(f"❌ Data inválida: '{nova_data}'. Alteração cancelada.\n")
-            conn.close()
             return
         if data_eh_passada(nova_data_iso):
             print(f"⛔ Não é permitido alterar para data passada ({nova_data_iso}).\n")
-            conn.close()
             return
         bloqueada, motivo = data_bloqueada(nova_data_iso)
         if bloqueada:
             print(f"⛔ Não é permitido alterar para data BLOQUEADA ({nova_data_iso}). Motivo: {motivo or 'sem motivo'}.\n")
-            conn.close()
             return
+        campos["data"] = nova_data_iso
+    if nova_hora:
+        hora = ler_hora(nova_hora)
+        if not hora:
+            print(f"❌ Hora inválida: '{nova_hora}'. Alteração cancelada.\n")
+            return
+        campos["hora"] = hora
+    elif nova_data_iso and not atual["hora"]:
+        print("❌ Agendamento sem hora: informe a hora junto com a nova data.\n")
+        return
 
-    try:
-        cursor.execute("""
-            UPDATE agendamentos
-               SET nome_cliente = ?, telefone = ?, data = ?
-             WHERE id = ?
-        """, (novo_nome, fone_formatado, nova_data_iso, id_))
-        conn.commit()
-        print("🛠️ Agendamento atualizado com sucesso!\n")
-    except sqlite3.IntegrityError:
-        print("⚠️ Já existe um agendamento 'agendado' para esse telefone nessa data.")
-        print("   Cancele o existente ou escolha outra data.\n")
-    finally:
-        conn.close()
+    if not campos:
+        print("ℹ️ Nada para alterar.\n")
+        return
+
+    with pool.conexao() as c:
+        try:
+            reservas.atualizar(c, id_editar, campos, nova_data_iso,
+                               livre=calendario.livre_de_recorrencias)
+            print("🛠️ Agendamento atualizado com sucesso!\n")
+        except reservas.NaoEncontrado:
+            print("⚠️ ID não encontrado.\n")
+        except reservas.DiaBloqueado:
+            print(f"⛔ Não é permitido alterar para data BLOQUEADA ({nova_data_iso}).\n")
+        except reservas.SlotOcupado:
+            print("⚠️ Conflito: já existe item nesse horário.")
+            print("   Escolha outro horário ou data.\n")
 
 # --------- Casos de uso: Bloqueios ---------
 def listar_bloqueios():
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT dia, motivo, criado_em
-          FROM bloqueios
-         ORDER BY date(dia) ASC
-    """)
-    rows = cursor.fetchall()
-    conn.close()
+    rows = consultar(SQL_BLOQUEIOS)
 
     print("\n🚫 Datas bloqueadas:\n")
     if not rows:
@@ -410,16 +270,13 @@ def bloquear_data():
         return
     motivo = input("Motivo do bloqueio (opcional): ").strip()
 
-    conn = conectar()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO bloqueios (dia, motivo) VALUES (?, ?)", (data_iso, motivo or None))
-        conn.commit()
-        print(f"✅ Dia {data_iso} bloqueado com sucesso!\n")
-    except sqlite3.IntegrityError:
-        print("⚠️ Essa data já está bloqueada.\n")
-    finally:
-        conn.close()
+    with pool.conexao() as c:
+        try:
+            with transacao(c):
+                c.execute("INSERT INTO bloqueios (dia, motivo) VALUES (?, ?)", (data_iso, motivo or None))
+            print(f"✅ Dia {data_iso} bloqueado com sucesso!\n")
+        except sqlite3.IntegrityError:
+            print("⚠️ Essa data já está bloqueada.\n")
 
 def desbloquear_data():
     data_txt = input("Dia para desbloquear (AAAA-MM-DD, DD/MM/AAAA, hoje, amanha): ").strip()
@@ -428,15 +285,13 @@ def desbloquear_data():
         print(f"❌ Data inválida: '{data_txt}'.\n")
         return
 
-    conn = conectar()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM bloqueios WHERE dia = ?", (data_iso,))
-    if cursor.rowcount > 0:
-        conn.commit()
+    with pool.conexao() as c:
+        with transacao(c):
+            removidos = c.execute("DELETE FROM bloqueios WHERE dia = ?", (data_iso,)).rowcount
+    if removidos > 0:
         print(f"✅ Dia {data_iso} desbloqueado!\n")
     else:
         print("ℹ️ Essa data não estava bloqueada.\n")
-    conn.close()
 
 # --------- UI (menu) ---------
 def menu():
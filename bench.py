@@ -0,0 +1,509 @@
+# bench.py
+"""
+Benchmark de carga da API (waitress local + workload misto).
+
+    python bench.py seed --db bench.db --meses 6 --clientes 3000
+    python bench.py run  --db bench.db --duracao 30 --clientes-http 16 --saida bench_baseline.json
+    python bench.py run  --db bench.db --comparar bench_baseline.json
+
+    python bench.py datas --fuzz 50000
+
+`seed` cria um banco com meses de histórico (finalizados/cancelados), agenda
+futura parcialmente ocupada e alguns dias bloqueados. `run` copia esse banco
+para um arquivo temporário (toda rodada parte do mesmo estado), sobe
+`waitress-serve app:app` apontando para a cópia e dispara o workload:
+
+- GET  /agendamentos?data=         leitura da agenda do dia
+- GET  /slots/disponiveis?data=    horários livres
+- POST /agendamentos               rajadas de reserva nos próximos dias (há conflito de propósito)
+- PATCH /agendamentos/<id>         troca de status
+- POST /slots/bloquear             bloqueio de horário
+
+Por endpoint: vazão, p50/p95/p99, códigos de status e esperas pelo lock de
+escrita do SQLite (header X-DB-Lock-Wait). O resultado vai para um JSON que
+serve de baseline: `--comparar` aponta regressões de p95/p99 e sai com código 1.
+
+`datas` é um microbenchmark de `nucleo.normalizar_data`: confere que devolve o
+mesmo que a implementação original (strptime) em todos os formatos aceitos,
+em casos de borda e em entradas aleatórias, e mede ns/chamada de cada uma.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+NOMES = ("Ana", "Bruno", "Carlos", "Daniel", "Eduardo", "Felipe", "Gabriel", "Henrique",
+         "Igor", "João", "Lucas", "Marcos", "Nicolas", "Otávio", "Paulo", "Rafael",
+         "Sérgio", "Thiago", "Vinícius", "Wesley", "Mariana", "Juliana", "Patrícia", "Renata")
+SOBRENOMES = ("Silva", "Santos", "Oliveira", "Souza", "Pereira", "Lima", "Costa", "Ferreira",
+              "Rodrigues", "Almeida", "Nascimento", "Araújo", "Gomes", "Ribeiro", "Carvalho")
+SERVICOS = ("Corte", "Barba", "Corte + Barba", "Sobrancelha", "Pigmentação", None)
+
+# peso de cada operação no workload misto
+PESOS = {"agenda": 45, "slots": 20, "reserva": 15, "status": 15, "bloquear": 5}
+
+ROTULOS = {
+    "agenda": "GET /agendamentos",
+    "slots": "GET /slots/disponiveis",
+    "reserva": "POST /agendamentos",
+    "status": "PATCH /agendamentos/<id>",
+    "bloquear": "POST /slots/bloquear",
+}
+
+
+# ---------- seed ----------
+def _telefone(rnd: random.Random) -> str:
+    ddd = rnd.choice((11, 19, 21, 31, 41))
+    n = rnd.randrange(10 ** 8)
+    return f"({ddd}) 9{n // 10 ** 4:04d}-{n % 10 ** 4:04d}"
+
+
+def semear(caminho: str, meses: int = 6, dias_futuros: int = 30, clientes: int = 3000,
+           ocupacao: float = 0.7, semente: int = 42) -> dict:
+    """Cria (ou recria) o banco de benchmark; devolve contagens do que foi gerado."""
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+    os.environ["BARBEARIA_DB"] = caminho
+    import app  # cria schema, índices e triggers no banco novo
+    app.pool.fechar()
+
+    rnd = random.Random(semente)
+    carteira = [(f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}", _telefone(rnd))
+                for _ in range(clientes)]
+    hoje = date.today()
+    inicio = hoje - timedelta(days=30 * meses)
+    fim = hoje + timedelta(days=dias_futuros)
+
+    linhas, bloqueios = [], []
+    d = inicio
+    while d <= fim:
+        iso = d.isoformat()
+        horarios = app.GRADE[d.weekday()]
+        if horarios and rnd.random() < 0.02:
+            bloqueios.append((iso, rnd.choice(("Feriado", "Folga", "Curso"))))
+            d += timedelta(days=1)
+            continue
+        passado = d < hoje
+        for hora in horarios:
+            criado = datetime.combine(d - timedelta(days=rnd.randint(0, 14)),
+                                      datetime.min.time()).isoformat()
+            if passado:
+                if rnd.random() >= ocupacao:
+                    continue
+                status = rnd.choices(("finalizado", "cancelado", "bloqueado"), (80, 15, 5))[0]
+            else:
+                if rnd.random() >= ocupacao * 0.6:  # futuro menos cheio: sobra espaço p/ reservar
+                    continue
+                status = rnd.choices(("agendado", "bloqueado"), (90, 10))[0]
+            if status == "bloqueado":
+                linhas.append(("Bloqueado", "", iso, hora, None, status, criado))
+                continue
+            nome, tel = rnd.choice(carteira)
+            linhas.append((nome, tel, iso, hora, rnd.choice(SERVICOS), status, criado))
+            if status == "cancelado" and rnd.random() < 0.5:
+                # slot cancelado e depois reocupado por outro cliente
+                nome, tel = rnd.choice(carteira)
+                linhas.append((nome, tel, iso, hora, rnd.choice(SERVICOS), "finalizado", criado))
+        d += timedelta(days=1)
+
+    c = sqlite3.connect(caminho)
+    with c:
+        c.executemany("INSERT INTO bloqueios (dia, motivo) VALUES (?, ?)", bloqueios)
+        c.executemany("""INSERT INTO agendamentos
+                         (nome_cliente, telefone, data, hora, servico, status, criado_em)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)""", linhas)
+    c.execute("PRAGMA optimize")
+    c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    c.close()
+    return {"agendamentos": len(linhas), "bloqueios": len(bloqueios), "clientes": clientes,
+            "inicio": inicio.isoformat(), "fim": fim.isoformat()}
+
+
+# ---------- servidor ----------
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def subir_servidor(caminho: str, threads: int):
+    porta = _porta_livre()
+    env = dict(os.environ, BARBEARIA_DB=caminho)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "waitress", f"--listen=127.0.0.1:{porta}",
+         f"--threads={threads}", "app:app"],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    limite = time.monotonic() + 20
+    while time.monotonic() < limite:
+        if proc.poll() is not None:
+            raise RuntimeError("waitress não subiu:\n" + proc.stderr.read().decode(errors="replace"))
+        try:
+            h = http.client.HTTPConnection("127.0.0.1", porta, timeout=1)
+            h.request("GET", "/")
+            h.getresponse().read()
+            h.close()
+            return proc, porta
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("waitress não respondeu em 20 s.")
+
+
+# ---------- workload ----------
+class Workload:
+    """Gera requisições do mix; estado compartilhado só para escolher alvos."""
+
+    def __init__(self, caminho: str, grade_semana, pesos: dict):
+        c = sqlite3.connect(caminho)
+        hoje = date.today()
+        self.ids = [r[0] for r in c.execute(
+            "SELECT id FROM agendamentos WHERE data > ? AND status = 'agendado'", (hoje.isoformat(),))]
+        bloqueados = {r[0] for r in c.execute("SELECT dia FROM bloqueios")}
+        c.close()
+        self.grade = grade_semana
+        self.dias_leitura = [(hoje + timedelta(days=i)).isoformat() for i in range(-7, 31)]
+        self.dias_futuros = [(hoje + timedelta(days=i)) for i in range(1, 31)]
+        self.dias_futuros = [d for d in self.dias_futuros
+                             if self.grade[d.weekday()] and d.isoformat() not in bloqueados]
+        self.quentes = self.dias_futuros[:3]  # rajadas se concentram nos próximos dias
+        self.ops = list(pesos)
+        self.pesos = [pesos[k] for k in self.ops]
+
+    def _slot(self, rnd, dias):
+        d = rnd.choice(dias)
+        return d.isoformat(), rnd.choice(self.grade[d.weekday()])
+
+    def proxima(self, rnd: random.Random):
+        """(op, método, caminho, corpo)"""
+        op = rnd.choices(self.ops, self.pesos)[0]
+        if op == "agenda":
+            return op, "GET", f"/agendamentos?data={rnd.choice(self.dias_leitura)}", None
+        if op == "slots":
+            return op, "GET", f"/slots/disponiveis?data={rnd.choice(self.dias_futuros).isoformat()}", None
+        if op == "reserva":
+            data_iso, hora = self._slot(rnd, self.quentes if rnd.random() < 0.7 else self.dias_futuros)
+            corpo = {"nome": f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}",
+                     "telefone": _telefone(rnd), "data": data_iso, "hora": hora,
+                     "servico": rnd.choice(SERVICOS)}
+            return op, "POST", "/agendamentos", corpo
+        if op == "status" and self.ids:
+            corpo = {"status": rnd.choice(("finalizado", "cancelado", "agendado"))}
+            return op, "PATCH", f"/agendamentos/{rnd.choice(self.ids)}", corpo
+        data_iso, hora = self._slot(rnd, self.dias_futuros)
+        return "bloquear", "POST", "/slots/bloquear", {"data": data_iso, "hora": hora}
+
+
+def _cliente(porta, workload, semente, fim_aquecimento, fim, amostras, mutex):
+    rnd = random.Random(semente)
+    h = http.client.HTTPConnection("127.0.0.1", porta, timeout=30)
+    locais = []
+    while True:
+        agora = time.perf_counter()
+        if agora >= fim:
+            break
+        op, metodo, caminho, corpo = workload.proxima(rnd)
+        dados = json.dumps(corpo).encode() if corpo is not None else None
+        headers = {"Content-Type": "application/json"} if dados else {}
+        t0 = time.perf_counter()
+        try:
+            h.request(metodo, caminho, body=dados, headers=headers)
+            resp = h.getresponse()
+            resp.read()
+            status, espera = resp.status, resp.getheader("X-DB-Lock-Wait")
+        except (OSError, http.client.HTTPException):
+            h.close()
+            h = http.client.HTTPConnection("127.0.0.1", porta, timeout=30)
+            status, espera = 0, None
+        t1 = time.perf_counter()
+        if t0 >= fim_aquecimento:
+            locais.append((op, t1 - t0, status, float(espera) if espera else 0.0))
+    h.close()
+    with mutex:
+        amostras.extend(locais)
+
+
+def percentil(ordenados: list, p: float) -> float:
+    """Nearest-rank sobre uma lista já ordenada."""
+    if not ordenados:
+        return 0.0
+    k = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[k]
+
+
+def resumir(amostras: list, duracao: float) -> dict:
+    por_op = defaultdict(list)
+    for a in amostras:
+        por_op[a[0]].append(a)
+    endpoints = {}
+    for op, lista in sorted(por_op.items()):
+        lat = sorted(x[1] * 1000 for x in lista)
+        codigos = defaultdict(int)
+        for x in lista:
+            codigos[str(x[2])] += 1
+        esperas = [x[3] for x in lista if x[3]]
+        endpoints[ROTULOS[op]] = {
+            "requisicoes": len(lista),
+            "rps": round(len(lista) / duracao, 1),
+            "p50_ms": round(percentil(lat, 50), 2),
+            "p95_ms": round(percentil(lat, 95), 2),
+            "p99_ms": round(percentil(lat, 99), 2),
+            "max_ms": round(lat[-1], 2),
+            "media_ms": round(sum(lat) / len(lat), 2),
+            "status": dict(sorted(codigos.items())),
+            "erros": sum(n for s, n in codigos.items() if s == "0" or s.startswith("5")),
+            "esperas_lock": len(esperas),
+            "espera_lock_ms": round(sum(esperas), 1),
+        }
+    lat = sorted(x[1] * 1000 for x in amostras)
+    total = {"requisicoes": len(amostras), "rps": round(len(amostras) / duracao, 1),
+             "p50_ms": round(percentil(lat, 50), 2), "p95_ms": round(percentil(lat, 95), 2),
+             "p99_ms": round(percentil(lat, 99), 2),
+             "esperas_lock": sum(e["esperas_lock"] for e in endpoints.values())}
+    return {"total": total, "endpoints": endpoints}
+
+
+def _admin(porta) -> dict:
+    h = http.client.HTTPConnection("127.0.0.1", porta, timeout=5)
+    h.request("GET", "/admin/pool")
+    dados = json.loads(h.getresponse().read())
+    h.close()
+    return dados
+
+
+def _commit_git() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def executar(caminho: str, duracao: float = 30, aquecimento: float = 3, clientes_http: int = 16,
+             threads_servidor: int = 32, semente: int = 42, pesos: dict = PESOS) -> dict:
+    import grade
+    copia = tempfile.mktemp(prefix="bench-", suffix=".db")
+    origem, destino = sqlite3.connect(caminho), sqlite3.connect(copia)
+    origem.backup(destino)
+    origem.close()
+    destino.close()
+
+    proc, porta = subir_servidor(copia, threads_servidor)
+    try:
+        workload = Workload(copia, grade.carregar_grade(os.environ.get("GRADE_HORARIOS")), pesos)
+        antes = _admin(porta)
+        amostras, mutex = [], threading.Lock()
+        inicio = time.perf_counter()
+        fim_aquecimento, fim = inicio + aquecimento, inicio + aquecimento + duracao
+        ths = [threading.Thread(target=_cliente, args=(porta, workload, semente + i,
+                                                       fim_aquecimento, fim, amostras, mutex))
+               for i in range(clientes_http)]
+        for t in ths:
+            t.start()
+        for t in ths:
+            t.join()
+        depois = _admin(porta)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(copia + sufixo):
+                os.remove(copia + sufixo)
+
+    resultado = resumir(amostras, duracao)
+    resultado["servidor"] = {
+        "transacoes": depois["lock"]["transacoes"] - antes["lock"]["transacoes"],
+        "esperas_lock": depois["lock"]["esperas"] - antes["lock"]["esperas"],
+        "espera_lock_ms": round(depois["lock"]["tempo_espera_ms"] - antes["lock"]["tempo_espera_ms"], 1),
+        "esperas_pool": depois["esperas"] - antes["esperas"],
+        "timeouts_pool": depois["timeouts"] - antes["timeouts"],
+    }
+    resultado["meta"] = {
+        "quando": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_git(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "cpus": os.cpu_count(),
+        "duracao_s": duracao, "aquecimento_s": aquecimento, "clientes_http": clientes_http,
+        "threads_servidor": threads_servidor, "semente": semente, "pesos": pesos,
+    }
+    return resultado
+
+
+# ---------- microbenchmark: normalizar_data ----------
+FORMATOS_DATA = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%Y.%m.%d", "%d%m%Y", "%Y%m%d")
+BORDAS_DATA = ("", "   ", "hoje", " HOJE ", "amanha", "Amanhã", "AMANHÃ", "ontem",
+               "2025-8-5", "5/8/2025", "05/8/2025", "2025-02-29", "2024-02-29", "1900-02-29",
+               "2000-02-29", "31/04/2025", "00/01/2025", "2025-00-10", "2025-13-01", "32.01.2025",
+               "20251301", "31022025", "29022024", "11120240", "00000000", "0999-01-01",
+               "01/01/0999", "2025-08-15x", "2025/08-15", "15-08/2025", "2025-08- 5",
+               " 15/08/2025 ", "１５/08/2025", "٢٠٢٥-٠٨-١٥", "15082025", "20250815", "2025.08.15",
+               "2025-08-15T10:00", "15/08/25", "1/1/2025", "9999-12-31", "31/12/9999")
+
+
+def _corpus_datas(fuzz: int, semente: int) -> list[str]:
+    entradas = list(BORDAS_DATA)
+    d = date(1999, 12, 1)
+    while d <= date(2031, 1, 31):
+        entradas.extend(d.strftime(fmt) for fmt in FORMATOS_DATA)
+        d += timedelta(days=1)
+    # aleatórias: dígitos e separadores quaisquer nas formas que o caminho rápido casa
+    rnd = random.Random(semente)
+    digitos = lambda n: "".join(rnd.choice("0123456789") for _ in range(n))
+    for _ in range(fuzz):
+        seps = rnd.choice(("--", "//", "..", "-/", "./", "  "))
+        entradas.append(rnd.choice((
+            digitos(8),
+            f"{digitos(4)}{seps[0]}{digitos(2)}{seps[1]}{digitos(2)}",
+            f"{digitos(2)}{seps[0]}{digitos(2)}{seps[1]}{digitos(4)}",
+            f"{digitos(rnd.randint(1, 4))}{seps[0]}{digitos(rnd.randint(1, 2))}{seps[1]}{digitos(rnd.randint(1, 4))}",
+        )))
+    return entradas
+
+
+def _ns_por_chamada(fn, entradas: list[str], repeticoes: int = 1) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for txt in entradas:
+            fn(txt)
+    return round((time.perf_counter() - inicio) / (len(entradas) * repeticoes) * 1e9, 1)
+
+
+def microbench_datas(fuzz: int = 50000, semente: int = 42) -> dict:
+    """Equivalência + tempo de nucleo.normalizar_data contra a implementação original."""
+    import nucleo
+    entradas = _corpus_datas(fuzz, semente)
+    divergencias = []
+    for txt in entradas:
+        esperado, obtido = nucleo.normalizar_data_referencia(txt), nucleo.normalizar_data(txt)
+        if esperado != obtido:
+            divergencias.append({"entrada": txt, "esperado": esperado, "obtido": obtido})
+
+    # sem cache: cada entrada distinta uma vez (custo do parser em si), só os formatos
+    # aceitos e depois tudo (as aleatórias inválidas caem no fallback com strptime)
+    formatos = list(dict.fromkeys(entradas[len(BORDAS_DATA):len(entradas) - fuzz]))
+    distintas = list(dict.fromkeys(entradas))
+    nucleo._normalizar_literal.cache_clear()
+    frio_formatos = _ns_por_chamada(nucleo.normalizar_data, formatos)
+    nucleo._normalizar_literal.cache_clear()
+    frio = _ns_por_chamada(nucleo.normalizar_data, distintas)
+    # workload de API: poucas datas (a semana corrente) repetidas o tempo todo
+    quentes = [(date.today() + timedelta(days=i)).isoformat() for i in range(7)] * 2000 + ["hoje"] * 2000
+    return {
+        "entradas": len(entradas),
+        "divergencias": divergencias,
+        "ns_por_chamada": {
+            "referencia_formatos": _ns_por_chamada(nucleo.normalizar_data_referencia, formatos),
+            "rapida_formatos": frio_formatos,
+            "referencia_tudo": _ns_por_chamada(nucleo.normalizar_data_referencia, distintas),
+            "rapida_tudo": frio,
+            "referencia_repetidas": _ns_por_chamada(nucleo.normalizar_data_referencia, quentes),
+            "rapida_repetidas": _ns_por_chamada(nucleo.normalizar_data, quentes, repeticoes=5),
+        },
+    }
+
+
+# ---------- relatório / comparação ----------
+def imprimir(resultado: dict):
+    print(f"{'endpoint':28} {'req':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'erros':>6} {'lock':>6}")
+    linhas = list(resultado["endpoints"].items()) + [("TOTAL", resultado["total"])]
+    for nome, e in linhas:
+        print(f"{nome:28} {e['requisicoes']:>7} {e['rps']:>8} {e['p50_ms']:>8} {e['p95_ms']:>8} "
+              f"{e['p99_ms']:>8} {e.get('erros', ''):>6} {e['esperas_lock']:>6}")
+    s = resultado["servidor"]
+    print(f"servidor: {s['transacoes']} transações, {s['esperas_lock']} esperas de lock "
+          f"({s['espera_lock_ms']} ms), {s['esperas_pool']} esperas no pool, {s['timeouts_pool']} timeouts")
+
+
+def comparar(atual: dict, base: dict, tolerancia: float = 0.2, piso_ms: float = 1.0) -> list[str]:
+    """Regressões de p95/p99 acima de `tolerancia` (e de pelo menos `piso_ms`) por endpoint."""
+    regressoes = []
+    for nome, e in atual["endpoints"].items():
+        b = base.get("endpoints", {}).get(nome)
+        if not b:
+            continue
+        for campo in ("p95_ms", "p99_ms"):
+            if e[campo] > b[campo] * (1 + tolerancia) and e[campo] - b[campo] >= piso_ms:
+                regressoes.append(f"{nome} {campo}: {b[campo]} -> {e[campo]}")
+        if e["erros"] > b["erros"]:
+            regressoes.append(f"{nome} erros: {b['erros']} -> {e['erros']}")
+    return regressoes
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark de carga da API da barbearia.")
+    sub = ap.add_subparsers(dest="comando", required=True)
+
+    s = sub.add_parser("seed", help="cria o banco de benchmark")
+    s.add_argument("--db", default=os.path.join(BASE_DIR, "bench.db"))
+    s.add_argument("--meses", type=int, default=6)
+    s.add_argument("--dias-futuros", type=int, default=30)
+    s.add_argument("--clientes", type=int, default=3000)
+    s.add_argument("--ocupacao", type=float, default=0.7)
+    s.add_argument("--semente", type=int, default=42)
+
+    r = sub.add_parser("run", help="roda o workload contra um waitress local")
+    r.add_argument("--db", default=os.path.join(BASE_DIR, "bench.db"))
+    r.add_argument("--duracao", type=float, default=30)
+    r.add_argument("--aquecimento", type=float, default=3)
+    r.add_argument("--clientes-http", type=int, default=16)
+    r.add_argument("--threads-servidor", type=int, default=32)
+    r.add_argument("--semente", type=int, default=42)
+    r.add_argument("--saida", help="grava o resultado (JSON) neste arquivo")
+    r.add_argument("--comparar", help="baseline JSON para detectar regressões")
+    r.add_argument("--tolerancia", type=float, default=0.2)
+
+    m = sub.add_parser("datas", help="microbenchmark + equivalência de normalizar_data")
+    m.add_argument("--fuzz", type=int, default=50000, help="entradas aleatórias além dos formatos/bordas")
+    m.add_argument("--semente", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    if args.comando == "datas":
+        resultado = microbench_datas(args.fuzz, args.semente)
+        print(f"{resultado['entradas']} entradas, {len(resultado['divergencias'])} divergências")
+        for nome, ns in resultado["ns_por_chamada"].items():
+            print(f"{nome:22} {ns:>10} ns/chamada")
+        for d in resultado["divergencias"][:20]:
+            print("DIVERGÊNCIA:", d)
+        return 1 if resultado["divergencias"] else 0
+
+    if args.comando == "seed":
+        info = semear(args.db, args.meses, args.dias_futuros, args.clientes, args.ocupacao, args.semente)
+        print(f"{args.db}: {info['agendamentos']} agendamentos, {info['bloqueios']} dias bloqueados "
+              f"({info['inicio']} a {info['fim']}).")
+        return 0
+
+    if not os.path.exists(args.db):
+        print(f"{args.db} não existe; semeando com os padrões...")
+        semear(args.db)
+    resultado = executar(args.db, args.duracao, args.aquecimento, args.clientes_http,
+                         args.threads_servidor, args.semente)
+    imprimir(resultado)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"resultado salvo em {args.saida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+        for linha in regressoes:
+            print("REGRESSÃO:", linha)
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# cache_bloqueios.py
+"""
+Cache em memória dos dias bloqueados (tabela `bloqueios`).
+
+- Escritas feitas por este processo atualizam o cache na hora (write-through).
+- Escritas de OUTROS processos (outro worker, CLI) são detectadas assim:
+  `PRAGMA data_version` numa conexão sentinela (só lê o índice do WAL, não o
+  arquivo); se mudou, confere a linha `geracoes('bloqueios')`, que os triggers
+  incrementam, e só então recarrega a tabela inteira (poucas dezenas de linhas).
+- A checagem cross-process acontece no máximo a cada `intervalo` segundos, então
+  o caminho quente de agendamento normalmente nem chega ao SQLite.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class CacheBloqueios:
+    def __init__(self, caminho: str, intervalo: float = 0.5):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.versao = 0          # muda a cada recarga/escrita local
+        self._lock = threading.Lock()
+        self._dias = {}          # dia ISO -> motivo
+        self._geracao = None     # geracoes.versao já carregada
+        self._data_version = None
+        self._checado_em = 0.0
+        self._sentinela = None
+        self._pid = None
+
+    def _conexao(self) -> sqlite3.Connection:
+        if self._sentinela is None or self._pid != os.getpid():
+            self._sentinela = sqlite3.connect(self.caminho, timeout=10, check_same_thread=False)
+            self._pid = os.getpid()
+            self._data_version = None
+        return self._sentinela
+
+    def _sincronizar(self, forcar: bool = False):
+        agora = time.monotonic()
+        if not forcar and agora - self._checado_em < self.intervalo:
+            return
+        self._checado_em = agora
+        c = self._conexao()
+        dv = c.execute("PRAGMA data_version").fetchone()[0]
+        if dv == self._data_version and not forcar:
+            return
+        self._data_version = dv
+        row = c.execute("SELECT versao FROM geracoes WHERE nome = 'bloqueios'").fetchone()
+        geracao = row[0] if row else None
+        if geracao == self._geracao and not forcar:
+            return
+        self._dias = dict(c.execute("SELECT dia, motivo FROM bloqueios"))
+        self._geracao = geracao
+        self.versao += 1
+
+    def consultar(self, dia: str) -> tuple[bool, str | None]:
+        """(True, motivo) se o dia estiver bloqueado, senão (False, None)."""
+        with self._lock:
+            self._sincronizar()
+            if dia in self._dias:
+                return True, self._dias[dia]
+            return False, None
+
+    def dias(self) -> dict:
+        with self._lock:
+            self._sincronizar()
+            return dict(self._dias)
+
+    # ---- write-through (chamar DEPOIS do commit) ----
+    def registrar(self, dia: str, motivo: str | None):
+        with self._lock:
+            self._dias[dia] = motivo
+            self.versao += 1
+
+    def remover(self, dia: str):
+        with self._lock:
+            self._dias.pop(dia, None)
+            self.versao += 1
+
+    def invalidar(self):
+        with self._lock:
+            self._sincronizar(forcar=True)
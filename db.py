@@ -0,0 +1,262 @@
+# db.py
+"""
+Pool de conexões SQLite (um por processo/worker).
+
+Cada conexão é aberta uma única vez, já com os PRAGMAs aplicados, e reaproveitada
+entre requests. O pool é limitado: quando todas as conexões estão emprestadas a
+thread espera (até `espera` segundos) por uma devolução.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Aplicados UMA vez, na criação da conexão (não mais a cada request)
+PRAGMAS = (
+    ("foreign_keys", "ON"),
+    ("auto_vacuum", "INCREMENTAL"),            # antes do WAL: só vale em banco novo (ver esquema.migrar)
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),                 # seguro com WAL, evita fsync por commit
+    ("cache_size", "-4000"),                   # ~4 MB de cache por conexão
+    ("mmap_size", str(64 * 1024 * 1024)),      # leituras via mmap (64 MB)
+    ("busy_timeout", "10000"),                 # espera o lock de escrita por até 10 s
+    ("journal_size_limit", str(32 * 1024 * 1024)),  # o -wal volta a <= 32 MB depois de um checkpoint
+    ("analysis_limit", "1000"),                # ANALYZE do PRAGMA optimize por amostragem
+)
+
+# Statements preparados guardados por conexão (sqlite3 reaproveita pelo texto do SQL).
+# Os SQLs montados na hora (filtros da listagem, SET do PATCH) têm muitas variações;
+# com o padrão (128) eles expulsavam os fixos do LRU e o caminho quente re-preparava.
+CACHE_STATEMENTS = 256
+
+# BEGIN IMMEDIATE que demora mais que isso esperou o lock de escrita de outra conexão
+LIMIAR_ESPERA_LOCK = 0.001
+
+_lock_stats = {"transacoes": 0, "esperas": 0, "tempo_espera": 0.0}
+_lock_stats_mutex = threading.Lock()
+_local = threading.local()  # espera de lock acumulada pela thread (ver espera_lock_thread)
+
+
+class PoolEsgotado(RuntimeError):
+    """Nenhuma conexão livre dentro do tempo de espera."""
+
+
+@contextmanager
+def transacao(c: sqlite3.Connection, modo: str = "IMMEDIATE"):
+    """
+    BEGIN IMMEDIATE ... COMMIT (ROLLBACK em caso de erro).
+    O lock de escrita é pego já no BEGIN: sem upgrade de leitura->escrita no meio,
+    que no WAL falha com "database is locked" sem esperar o busy_timeout.
+    Já dentro de uma transação (ex.: lote do escritor) vira um SAVEPOINT.
+    """
+    if c.in_transaction:
+        c.execute("SAVEPOINT transacao")
+        try:
+            yield c
+        except BaseException:
+            c.execute("ROLLBACK TO transacao")
+            c.execute("RELEASE transacao")
+            raise
+        c.execute("RELEASE transacao")
+        return
+    t0 = time.perf_counter()
+    c.execute(f"BEGIN {modo}")
+    espera = time.perf_counter() - t0
+    with _lock_stats_mutex:
+        _lock_stats["transacoes"] += 1
+        if espera > LIMIAR_ESPERA_LOCK:
+            _lock_stats["esperas"] += 1
+            _lock_stats["tempo_espera"] += espera
+    if espera > LIMIAR_ESPERA_LOCK:
+        _local.espera = getattr(_local, "espera", 0.0) + espera
+    try:
+        yield c
+    except BaseException:
+        c.rollback()
+        raise
+    c.commit()
+
+
+def espera_lock_thread(zerar: bool = True) -> float:
+    """Segundos que a thread atual passou esperando o lock de escrita (desde a última leitura)."""
+    espera = getattr(_local, "espera", 0.0)
+    if zerar:
+        _local.espera = 0.0
+    return espera
+
+
+def metricas_lock() -> dict:
+    with _lock_stats_mutex:
+        s = dict(_lock_stats)
+    return {"transacoes": s["transacoes"], "esperas": s["esperas"],
+            "tempo_espera_ms": round(s["tempo_espera"] * 1000, 2)}
+
+
+class PoolConexoes:
+    fabrica = sqlite3.Connection  # classe das conexões (instrumentacao.PoolMedido troca)
+
+    def __init__(self, caminho: str, tamanho: int = 8, espera: float = 10.0,
+                 ociosidade: float = 30.0):
+        self.caminho = caminho
+        self.tamanho = tamanho
+        self.espera = espera
+        # conexão parada há mais que isso passa por health check antes de ser entregue
+        self.ociosidade = ociosidade
+        self._cond = threading.Condition()
+        self._livres = deque()   # (conexao, devolvida_em) — LIFO mantém o cache quente
+        self._abertas = 0
+        self._pid = os.getpid()
+        self._stats = {"checkouts": 0, "esperas": 0, "tempo_espera": 0.0,
+                       "timeouts": 0, "criadas": 0, "descartadas": 0}
+
+    # ---------- internos ----------
+    def _conectar(self) -> sqlite3.Connection:
+        c = sqlite3.connect(self.caminho, timeout=10, check_same_thread=False,
+                            factory=self.fabrica, cached_statements=CACHE_STATEMENTS)
+        c.row_factory = sqlite3.Row
+        for nome, valor in PRAGMAS:
+            c.execute(f"PRAGMA {nome} = {valor}")
+        return c
+
+    @staticmethod
+    def _saudavel(c: sqlite3.Connection) -> bool:
+        try:
+            c.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checar_fork(self):
+        # após fork (ex.: vários workers) as conexões herdadas não podem ser usadas
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._livres.clear()
+            self._abertas = 0
+
+    # ---------- API ----------
+    def dedicada(self) -> sqlite3.Connection:
+        """Conexão FORA do pool (mesma fábrica e PRAGMAs) para uma thread de vida longa."""
+        return self._conectar()
+
+    def obter(self) -> sqlite3.Connection:
+        inicio = None
+        with self._cond:
+            self._checar_fork()
+            while True:
+                if self._livres:
+                    c, devolvida_em = self._livres.pop()
+                    break
+                if self._abertas < self.tamanho:
+                    self._abertas += 1
+                    c, devolvida_em = None, None
+                    break
+                if inicio is None:
+                    inicio = time.monotonic()
+                    self._stats["esperas"] += 1
+                restante = self.espera - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolEsgotado("Nenhuma conexão livre no pool.")
+                self._cond.wait(restante)
+            self._stats["checkouts"] += 1
+            if inicio is not None:
+                self._stats["tempo_espera"] += time.monotonic() - inicio
+
+        # conectar/pingar fora do lock
+        if c is not None and time.monotonic() - devolvida_em > self.ociosidade \
+                and not self._saudavel(c):
+            self._fechar_silencioso(c)
+            with self._cond:
+                self._stats["descartadas"] += 1
+            c = None
+        if c is None:
+            try:
+                c = self._conectar()
+            except Exception:
+                with self._cond:
+                    self._abertas -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["criadas"] += 1
+        return c
+
+    def devolver(self, c: sqlite3.Connection):
+        ok = True
+        try:
+            if c.in_transaction:
+                c.rollback()  # nada de transação pendurada para o próximo request
+        except sqlite3.Error:
+            ok = False
+        with self._cond:
+            if ok and os.getpid() == self._pid:
+                self._livres.append((c, time.monotonic()))
+            else:
+                self._abertas -= 1
+                self._stats["descartadas"] += 1
+                self._fechar_silencioso(c)
+            self._cond.notify()
+
+    @contextmanager
+    def conexao(self):
+        c = self.obter()
+        try:
+            yield c
+        finally:
+            self.devolver(c)
+
+    def otimizar(self) -> int:
+        """
+        PRAGMA optimize em cada conexão livre, uma de cada vez (as outras seguem atendendo).
+        É por conexão: usa as consultas que ELA rodou para decidir o que analisar.
+        """
+        feitas = set()
+        while True:
+            with self._cond:
+                self._checar_fork()
+                item = next((x for x in self._livres if id(x[0]) not in feitas), None)
+                if item is None:
+                    return len(feitas)
+                self._livres.remove(item)
+            feitas.add(id(item[0]))
+            try:
+                item[0].execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            with self._cond:
+                self._livres.appendleft(item)
+                self._cond.notify()
+
+    def fechar(self):
+        with self._cond:
+            while self._livres:
+                c, _ = self._livres.pop()
+                self._abertas -= 1
+                self._fechar_silencioso(c)
+
+    def metricas(self) -> dict:
+        with self._cond:
+            s = dict(self._stats)
+            livres = len(self._livres)
+            abertas = self._abertas
+        return {
+            "tamanho": self.tamanho,
+            "abertas": abertas,
+            "livres": livres,
+            "em_uso": abertas - livres,
+            "checkouts": s["checkouts"],
+            "esperas": s["esperas"],
+            "tempo_espera_ms": round(s["tempo_espera"] * 1000, 2),
+            "timeouts": s["timeouts"],
+            "criadas": s["criadas"],
+            "descartadas": s["descartadas"],
+        }
+
+    @staticmethod
+    def _fechar_silencioso(c):
+        try:
+            c.close()
+        except sqlite3.Error:
+            pass
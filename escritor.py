@@ -0,0 +1,253 @@
+# escritor.py
+"""
+Escritor único com group commit.
+
+As rotas de escrita não abrem mais transação própria: entregam uma função
+`fn(conexao, ...)` para a fila e esperam o resultado. Uma thread só consome a
+fila e aplica o que estiver esperando (até `max_lote` itens) numa ÚNICA
+transação BEGIN IMMEDIATE ... COMMIT:
+
+- cada item roda num SAVEPOINT: erro de um (ex.: SlotOcupado) desfaz só ele;
+- o resultado (ou a exceção) só volta para o request depois do COMMIT;
+- dentro do processo ninguém mais disputa o lock de escrita, e N reservas
+  simultâneas custam um commit (um fsync do WAL) em vez de N.
+
+`janela` > 0 segura o lote alguns ms esperando mais itens (mais vazão, mais
+latência); com 0 o lote é só o que já acumulou enquanto o anterior gravava.
+
+Ninguém espera para sempre: depois de `espera` segundos na fila o item é
+cancelado (não será gravado) e o request recebe EscritorIndisponivel (503);
+se já estava no lote em gravação, espera mais `espera` pelo COMMIT.
+Se a conexão do escritor não abre, os itens na fila falham com o erro e a
+próxima escrita sobe outra thread.
+
+Cada item volta com os seus tempos (fila, lock, sql, commit): a espera pelo
+lock e o COMMIT acontecem na thread do escritor, então quem escreveu lê os
+tempos pelo `tempos_thread()` (Server-Timing, X-DB-Lock-Wait).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturoExpirado
+
+from db import PoolConexoes, espera_lock_thread, transacao
+
+LIMITES_LOTE = (1, 2, 4, 8, 16, 32, 64, 128)  # buckets do histograma de tamanho de lote
+# tempos de cada item: na fila, esperando o lock de escrita, no fn do item e no COMMIT do lote
+FASES = ("fila", "lock", "sql", "commit")
+
+
+class EscritorIndisponivel(RuntimeError):
+    """A escrita não saiu da fila dentro do tempo de espera."""
+
+
+class _SemTransacao:
+    """Item que roda sozinho, fora do BEGIN ... COMMIT (ex.: VACUUM)."""
+    __slots__ = ("fn",)
+
+    def __init__(self, fn):
+        self.fn = fn
+
+
+class Escritor:
+    def __init__(self, pool: PoolConexoes, max_lote: int = 64, janela: float = 0.0,
+                 espera: float = 30.0, ao_esperar=None):
+        self.pool = pool
+        self.max_lote = max_lote
+        self.janela = janela
+        self.espera = espera
+        # chamado na thread de quem escreve antes de bloquear (o app devolve a conexão do request)
+        self.ao_esperar = ao_esperar
+        self._mutex = threading.Lock()
+        self._local = threading.local()  # tempos somados pela thread de quem escreve
+        self._fila = None
+        self._thread = None
+        self._pid = None
+        self._stats = {"lotes": 0, "itens": 0, "falhas_commit": 0, "falhas_conexao": 0,
+                       "expirados": 0, "fila_max": 0, "tempo_fila": 0.0, "tempo_lote": 0.0}
+        self.ultimo_lote = time.monotonic()  # fim do último lote (manutencao.py espera o silêncio)
+        self._lotes = [0] * (len(LIMITES_LOTE) + 1)  # último = maiores que o último limite
+
+    def _garantir_thread(self) -> queue.Queue:
+        # sobe na primeira escrita (e de novo após fork: a thread não é herdada)
+        if self._thread is None or self._pid != os.getpid():
+            with self._mutex:
+                if self._thread is None or self._pid != os.getpid():
+                    self._fila = queue.Queue()
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._laco, args=(self._fila,),
+                                                    name="escritor", daemon=True)
+                    self._thread.start()
+        return self._fila
+
+    def executar(self, fn, *args, **kwargs):
+        """Roda `fn(conexao, *args, **kwargs)` no próximo lote; devolve o resultado depois do COMMIT."""
+        return self._enfileirar(fn, args, kwargs, self.espera)
+
+    def executar_sem_transacao(self, fn, *args, espera: float | None = None, **kwargs):
+        """
+        Como `executar`, mas `fn` roda entre dois lotes, sem transação aberta: para o
+        que o SQLite não aceita numa transação (VACUUM). As escritas esperam na fila.
+        `espera` troca o `self.espera` desta chamada (um VACUUM grande passa dos 30 s).
+        """
+        return self._enfileirar(_SemTransacao(fn), args, kwargs, espera or self.espera)
+
+    def _enfileirar(self, fn, args, kwargs, espera: float):
+        fila = self._garantir_thread()
+        futuro = Future()
+        fila.put((fn, args, kwargs, futuro, time.perf_counter()))
+        profundidade = fila.qsize()
+        with self._mutex:
+            if profundidade > self._stats["fila_max"]:
+                self._stats["fila_max"] = profundidade
+        if self.ao_esperar is not None:
+            self.ao_esperar()
+        try:
+            return self._esperar(futuro, espera)
+        finally:
+            if (tempos := getattr(futuro, "tempos", None)) is not None:
+                somados = self.tempos_thread(zerar=False)
+                self._local.tempos = {f: somados[f] + tempos[f] for f in FASES}
+
+    def _esperar(self, futuro: Future, espera: float):
+        try:
+            return futuro.result(timeout=espera)
+        except FuturoExpirado:
+            pass
+        if not futuro.cancel():
+            # já está no lote que está gravando: o resultado sai com o COMMIT
+            try:
+                return futuro.result(timeout=espera)
+            except FuturoExpirado:
+                pass
+        with self._mutex:
+            self._stats["expirados"] += 1
+        raise EscritorIndisponivel("Escrita não processada a tempo.")
+
+    def tempos_thread(self, zerar: bool = True) -> dict:
+        """{fase: segundos} das escritas feitas pela thread atual (desde a última leitura)."""
+        tempos = getattr(self._local, "tempos", None) or dict.fromkeys(FASES, 0.0)
+        if zerar:
+            self._local.tempos = None
+        return tempos
+
+    # ---------- thread escritora ----------
+    def _coletar(self, fila: queue.Queue) -> list:
+        lote = [fila.get()]
+        limite = time.perf_counter() + self.janela
+        while len(lote) < self.max_lote:
+            try:
+                restante = limite - time.perf_counter()
+                lote.append(fila.get(timeout=restante) if restante > 0 else fila.get_nowait())
+            except queue.Empty:
+                break
+        # itens cancelados por quem desistiu de esperar ficam fora (e os outros não cancelam mais)
+        return [item for item in lote if item[3].set_running_or_notify_cancel()]
+
+    def _laco(self, fila: queue.Queue):
+        # conexão própria, fora do pool: os requests que esperam na fila seguram
+        # conexões do pool, e o escritor não pode depender de uma delas vagar
+        try:
+            c = self.pool.dedicada()
+        except Exception as e:
+            with self._mutex:
+                self._stats["falhas_conexao"] += 1
+                if self._fila is fila:
+                    self._thread = None  # a próxima escrita sobe outra thread (com fila nova)
+            while True:
+                try:
+                    _, _, _, futuro, _ = fila.get_nowait()
+                except queue.Empty:
+                    return
+                if futuro.set_running_or_notify_cancel():
+                    futuro.set_exception(e)
+        while True:
+            lote = self._coletar(fila)
+            for item in [i for i in lote if isinstance(i[0], _SemTransacao)]:
+                lote.remove(item)
+                avulso, args, kwargs, futuro, enfileirado = item
+                inicio = time.perf_counter()
+                try:
+                    valor, erro = avulso.fn(c, *args, **kwargs), None
+                except Exception as e:
+                    valor, erro = None, e
+                futuro.tempos = {"fila": inicio - enfileirado, "lock": espera_lock_thread(),
+                                 "sql": time.perf_counter() - inicio, "commit": 0.0}
+                if erro is None:
+                    futuro.set_result(valor)
+                else:
+                    futuro.set_exception(erro)
+                self.ultimo_lote = time.monotonic()
+            if not lote:
+                continue
+            inicio = time.perf_counter()
+            resultados = []; duracoes = []
+            espera_lock_thread()  # a espera do BEGIN deste lote, e só ela, vai para os itens
+            lock = 0.0; fim_itens = None
+            try:
+                with transacao(c):
+                    lock = espera_lock_thread()
+                    for fn, args, kwargs, _, _ in lote:
+                        t0 = time.perf_counter()
+                        c.execute("SAVEPOINT item")
+                        try:
+                            resultados.append((True, fn(c, *args, **kwargs)))
+                            c.execute("RELEASE item")
+                        except Exception as e:
+                            c.execute("ROLLBACK TO item")
+                            c.execute("RELEASE item")
+                            resultados.append((False, e))
+                        duracoes.append(time.perf_counter() - t0)
+                    fim_itens = time.perf_counter()
+            except Exception as e:  # BEGIN/COMMIT falhou: ninguém do lote foi gravado
+                if c.in_transaction:
+                    c.rollback()
+                resultados = [(False, e)] * len(lote)
+                with self._mutex:
+                    self._stats["falhas_commit"] += 1
+            fim = time.perf_counter()
+            commit = fim - fim_itens if fim_itens is not None else 0.0
+            duracoes += [0.0] * (len(lote) - len(duracoes))
+            self.ultimo_lote = time.monotonic()
+            with self._mutex:
+                self._stats["lotes"] += 1
+                self._stats["itens"] += len(lote)
+                self._stats["tempo_lote"] += fim - inicio
+                self._stats["tempo_fila"] += sum(inicio - enfileirado for *_, enfileirado in lote)
+                i = 0
+                while i < len(LIMITES_LOTE) and len(lote) > LIMITES_LOTE[i]:
+                    i += 1
+                self._lotes[i] += 1
+            for (_, _, _, futuro, enfileirado), (ok, valor), sql in zip(lote, resultados, duracoes):
+                futuro.tempos = {"fila": inicio - enfileirado, "lock": lock, "sql": sql, "commit": commit}
+                if ok:
+                    futuro.set_result(valor)
+                else:
+                    futuro.set_exception(valor)
+
+    def ocioso(self) -> float:
+        """Segundos desde o último lote gravado (0 se há escrita na fila)."""
+        if self._fila is not None and not self._fila.empty():
+            return 0.0
+        return time.monotonic() - self.ultimo_lote
+
+    def metricas(self) -> dict:
+        with self._mutex:
+            s = dict(self._stats)
+            lotes = list(self._lotes)
+        fila = self._fila.qsize() if self._fila is not None else 0
+        return {
+            "fila": fila,
+            "fila_max": s["fila_max"],
+            "lotes": s["lotes"],
+            "itens": s["itens"],
+            "itens_por_lote": round(s["itens"] / s["lotes"], 2) if s["lotes"] else None,
+            "tamanho_lote": {f"<={limite}": n for limite, n in zip(LIMITES_LOTE, lotes)}
+                            | {f">{LIMITES_LOTE[-1]}": lotes[-1]},
+            "falhas_commit": s["falhas_commit"],
+            "falhas_conexao": s["falhas_conexao"],
+            "expirados": s["expirados"],
+            "tempo_fila_ms": round(s["tempo_fila"] * 1000, 2),
+            "tempo_lote_ms": round(s["tempo_lote"] * 1000, 2),
+        }
@@ -0,0 +1,412 @@
+# esquema.py
+"""
+Schema do banco e migrações: a ÚNICA definição, usada pela API (app.py), pelo
+CLI (barbearia.py) e pelo relatorios.py. Cada processo chama `migrar` ao subir;
+tudo é idempotente (CREATE IF NOT EXISTS, ALTER só da coluna que falta, triggers
+sempre recriados), então rodar de novo contra o banco de produção é seguro.
+
+Bases criadas pelo CLI antigo (sem hora/servico, índice único por telefone+dia)
+são trazidas para o schema atual aqui também.
+"""
+import sqlite3
+
+import relatorios
+
+# Catálogo inicial (os serviços do cliente-final); duração em minutos
+SERVICOS_PADRAO = (("Corte", 30), ("Barba", 30), ("Pezinho", 15), ("Sobrancelha", 15),
+                   ("Tintura", 60), ("Luzes", 90))
+
+# Telefone canônico (E.164; sem DDI assume Brasil) a partir dos dígitos: chave de `clientes`
+SQL_E164 = ("CASE WHEN length({d}) IN (10, 11) THEN '+55' || {d} "
+            "WHEN length({d}) IN (12, 13) AND {d} LIKE '55%' THEN '+' || {d} END")
+
+# Colunas geradas comuns a agendamentos e agendamentos_historico
+SQL_STATUS_ORDEM = ("CASE status WHEN 'bloqueado' THEN 0 WHEN 'agendado' THEN 1 "
+                    "WHEN 'finalizado' THEN 2 WHEN 'cancelado' THEN 3 ELSE 4 END")
+SQL_HORA_ORDEM = "coalesce(time(hora), '')"
+SQL_TELEFONE_DIGITOS = ("replace(replace(replace(replace(replace(replace("
+                        "coalesce(telefone, ''), '(', ''), ')', ''), ' ', ''), '-', ''), '+', ''), '.', '')")
+
+# Colunas públicas (reservas.COLUNAS) + as geradas que as leituras usam: view agendamentos_todos
+COLUNAS_TODOS = ("id, nome_cliente, telefone, data, hora, servico, status, criado_em, "
+                 "profissional_id, duracao_min, cliente_id, status_ordem, hora_ordem, telefone_digitos")
+
+
+def migrar(c: sqlite3.Connection):
+    """Cria/atualiza tabelas, índices e triggers na conexão `c` (e faz o backfill de daily_stats)."""
+    cur = c.cursor()
+    # Tabela principal (com coluna 'servico')
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS agendamentos (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      nome_cliente TEXT NOT NULL,
+      telefone TEXT NOT NULL,
+      data TEXT NOT NULL,
+      hora TEXT NOT NULL,
+      servico TEXT,
+      status TEXT DEFAULT 'agendado',
+      criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      profissional_id INTEGER NOT NULL DEFAULT 1,
+      duracao_min INTEGER NOT NULL DEFAULT 30
+    )
+    """)
+    # Profissionais (cada um é uma "cadeira"); o id 1 é a cadeira única de antes
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS profissionais (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      nome TEXT NOT NULL,
+      ativo INTEGER NOT NULL DEFAULT 1,
+      criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cur.execute("INSERT INTO profissionais (id, nome) SELECT 1, 'Barbeiro' "
+                "WHERE NOT EXISTS (SELECT 1 FROM profissionais)")
+    # Clientes: um por telefone canônico; o agendamento guarda o nome/telefone do momento + cliente_id
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS clientes (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      telefone_e164 TEXT NOT NULL UNIQUE,
+      nome TEXT NOT NULL,
+      criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    # Catálogo de serviços (a duração define o intervalo que o agendamento ocupa)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS servicos (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      nome TEXT NOT NULL UNIQUE COLLATE NOCASE,
+      duracao_min INTEGER NOT NULL,
+      ativo INTEGER NOT NULL DEFAULT 1
+    )
+    """)
+    cur.execute("SELECT 1 FROM servicos LIMIT 1")
+    if cur.fetchone() is None:
+        cur.executemany("INSERT INTO servicos (nome, duracao_min) VALUES (?, ?)", SERVICOS_PADRAO)
+    cur.execute("PRAGMA table_xinfo(agendamentos)")
+    cols = {r[1] for r in cur.fetchall()}
+    # Migração: base criada pelo CLI antigo (agendamento por dia, sem hora). Esses itens
+    # ficam com hora NULL: não ocupam intervalo nem colidem no índice único de slot
+    if "hora" not in cols:
+        cur.execute("ALTER TABLE agendamentos ADD COLUMN hora TEXT")
+    # Migração: adiciona 'servico' se faltar
+    if "servico" not in cols:
+        cur.execute("ALTER TABLE agendamentos ADD COLUMN servico TEXT")
+    # Migração: chaves de ordenação da agenda como colunas geradas (indexáveis)
+    if "status_ordem" not in cols:
+        cur.execute(f"ALTER TABLE agendamentos ADD COLUMN status_ordem INTEGER "
+                    f"GENERATED ALWAYS AS ({SQL_STATUS_ORDEM}) VIRTUAL")
+    if "hora_ordem" not in cols:
+        cur.execute(f"ALTER TABLE agendamentos ADD COLUMN hora_ordem TEXT "
+                    f"GENERATED ALWAYS AS ({SQL_HORA_ORDEM}) VIRTUAL")
+    # Migração: agendamentos antigos ficam com o profissional 1 (sem FK: ALTER não permite com default)
+    if "profissional_id" not in cols:
+        cur.execute("ALTER TABLE agendamentos ADD COLUMN profissional_id INTEGER NOT NULL DEFAULT 1")
+    # Migração: duração + intervalo [inicio_min, fim_min) em minutos do dia (conflito por sobreposição)
+    if "duracao_min" not in cols:
+        cur.execute("ALTER TABLE agendamentos ADD COLUMN duracao_min INTEGER NOT NULL DEFAULT 30")
+    if "inicio_min" not in cols:
+        cur.execute("""
+        ALTER TABLE agendamentos ADD COLUMN inicio_min INTEGER GENERATED ALWAYS AS (
+          CAST(strftime('%H', hora) AS INTEGER) * 60 + CAST(strftime('%M', hora) AS INTEGER)) VIRTUAL
+        """)
+    if "fim_min" not in cols:
+        cur.execute("""
+        ALTER TABLE agendamentos ADD COLUMN fim_min INTEGER
+          GENERATED ALWAYS AS (inicio_min + duracao_min) VIRTUAL
+        """)
+    # Migração: telefone só com dígitos (chave de busca; `telefone` segue formatado p/ exibição)
+    if "telefone_digitos" not in cols:
+        cur.execute(f"ALTER TABLE agendamentos ADD COLUMN telefone_digitos TEXT "
+                    f"GENERATED ALWAYS AS ({SQL_TELEFONE_DIGITOS}) VIRTUAL")
+    # Migração: cliente_id + dedupe do histórico (mesmo telefone canônico = mesmo cliente,
+    # com o nome mais recente); daqui para frente os triggers mantêm
+    if "cliente_id" not in cols:
+        cur.execute("ALTER TABLE agendamentos ADD COLUMN cliente_id INTEGER REFERENCES clientes(id)")
+        e164 = SQL_E164.format(d="telefone_digitos")
+        cur.execute(f"""
+        INSERT INTO clientes (telefone_e164, nome)
+        SELECT e, nome_cliente FROM (
+          SELECT {e164} AS e, nome_cliente, max(id) FROM agendamentos
+           WHERE status <> 'bloqueado' AND {e164} IS NOT NULL
+           GROUP BY 1)
+         WHERE true ON CONFLICT(telefone_e164) DO NOTHING
+        """)
+        cur.execute(f"""
+        UPDATE agendamentos SET cliente_id = (SELECT id FROM clientes WHERE telefone_e164 = {e164})
+         WHERE status <> 'bloqueado'
+        """)
+    # histórico do cliente: seek por cliente_id já na ordem de data
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ag_cliente ON agendamentos(cliente_id, data)")
+    # "último intervalo do profissional que começa antes de X" = uma descida no índice
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_ag_intervalo
+      ON agendamentos(profissional_id, data, inicio_min, fim_min)
+      WHERE status IN ('agendado','bloqueado','finalizado')
+    """)
+    # mesma ordem do ORDER BY da listagem: SQLite percorre o índice, sem sort temporário
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ag_ordem ON agendamentos(status_ordem, hora_ordem, id)")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ag_data ON agendamentos(data)")
+    # um único item OCUPANDO cada slot de cada profissional: é o que garante o conflito nas escritas
+    try:
+        cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_ag_slot_profissional
+          ON agendamentos(profissional_id, data, hora) WHERE status IN ('agendado','bloqueado','finalizado')
+        """)
+        # substituídos pelo índice acima (eram de cadeira única)
+        for antigo in ("ux_ag_slot_ocupado", "ux_ag_slot_agendado", "ux_ag_slot_bloqueado"):
+            cur.execute(f"DROP INDEX IF EXISTS {antigo}")
+        # do CLI antigo (um 'agendado' por telefone+dia): a regra agora é por slot, igual à API
+        cur.execute("DROP INDEX IF EXISTS ux_ag_data_fone_agendado")
+    except sqlite3.IntegrityError:
+        # base antiga com slots duplicados: mantém o índice antigo até alguém limpar
+        print("⚠️ Slots ocupados duplicados na base; ux_ag_slot_profissional não foi criado.")
+        cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_ag_slot_agendado
+          ON agendamentos(data, hora) WHERE status='agendado'
+        """)
+
+    # Bloqueios de DIA
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS bloqueios (
+      dia TEXT PRIMARY KEY,
+      motivo TEXT,
+      criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_blk_dia ON bloqueios(dia)")
+
+    # Lista de espera (dia inteiro ou janela hora_inicio..hora_fim)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS lista_espera (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      nome_cliente TEXT NOT NULL,
+      telefone TEXT NOT NULL,
+      data TEXT NOT NULL,
+      hora_inicio TEXT,
+      hora_fim TEXT,
+      servico TEXT,
+      status TEXT NOT NULL DEFAULT 'aguardando',
+      agendamento_id INTEGER,
+      criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      atendido_em TIMESTAMP
+    )
+    """)
+    # só quem ainda espera, na ordem da fila: a busca do candidato é um range scan curto
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_espera_aguardando
+                   ON lista_espera(data, id) WHERE status = 'aguardando'""")
+
+    # Recorrências: uma linha por REGRA (RRULE), expandida em memória; nunca uma por ocorrência
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS recorrencias (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      tipo TEXT NOT NULL CHECK (tipo IN ('agendamento','bloqueio_slot','bloqueio_dia')),
+      regra TEXT NOT NULL,
+      inicio TEXT NOT NULL,
+      hora TEXT,
+      duracao_min INTEGER NOT NULL DEFAULT 30,
+      profissional_id INTEGER REFERENCES profissionais(id),
+      nome_cliente TEXT,
+      telefone TEXT,
+      servico TEXT,
+      motivo TEXT,
+      criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    # datas puladas (ou já materializadas como agendamento real)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS recorrencias_excecoes (
+      recorrencia_id INTEGER NOT NULL REFERENCES recorrencias(id) ON DELETE CASCADE,
+      data TEXT NOT NULL,
+      PRIMARY KEY (recorrencia_id, data)
+    ) WITHOUT ROWID
+    """)
+
+    # Histórico: finalizados/cancelados de datas passadas, movidos pelo arquivo.py em lotes.
+    # Mesmo id (AUTOINCREMENT em agendamentos: nunca reaproveitado) e mesmas colunas públicas
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS agendamentos_historico (
+      id INTEGER PRIMARY KEY,
+      nome_cliente TEXT NOT NULL,
+      telefone TEXT NOT NULL,
+      data TEXT NOT NULL,
+      hora TEXT,
+      servico TEXT,
+      status TEXT,
+      criado_em TIMESTAMP,
+      profissional_id INTEGER NOT NULL,
+      duracao_min INTEGER NOT NULL,
+      cliente_id INTEGER REFERENCES clientes(id),
+      arquivado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      status_ordem INTEGER GENERATED ALWAYS AS ({SQL_STATUS_ORDEM}) VIRTUAL,
+      hora_ordem TEXT GENERATED ALWAYS AS ({SQL_HORA_ORDEM}) VIRTUAL,
+      telefone_digitos TEXT GENERATED ALWAYS AS ({SQL_TELEFONE_DIGITOS}) VIRTUAL
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_hist_data ON agendamentos_historico(data)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_hist_cliente ON agendamentos_historico(cliente_id, data)")
+    # par do idx_ag_ordem: a listagem sem data faz MERGE (UNION ALL) das duas ordens, sem sort
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_hist_ordem ON agendamentos_historico(status_ordem, hora_ordem, id)")
+    # leituras cujo intervalo alcança o histórico (arquivo.fonte); WHERE desce para as duas partes
+    cur.execute("DROP VIEW IF EXISTS agendamentos_todos")
+    cur.execute(f"""
+    CREATE VIEW agendamentos_todos AS
+      SELECT {COLUNAS_TODOS} FROM agendamentos
+      UNION ALL
+      SELECT {COLUNAS_TODOS} FROM agendamentos_historico
+    """)
+
+    # Busca de clientes (FTS5 com conteúdo externo = agendamentos; mantida pelos triggers abaixo,
+    # inclusive para as linhas do histórico, que continuam com o mesmo rowid):
+    # nome sem acento e com índice de prefixo; telefone em trigramas (qualquer pedaço de 3+ dígitos)
+    cur.execute("SELECT count(*) FROM sqlite_master WHERE name IN ('busca_nome', 'busca_telefone')")
+    reindexar_busca = cur.fetchone()[0] < 2
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS busca_nome USING fts5(
+      nome_cliente, content='agendamentos', content_rowid='id',
+      tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+    """)
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS busca_telefone USING fts5(
+      telefone_digitos, content='agendamentos', content_rowid='id', tokenize='trigram')
+    """)
+
+    # Gerações: contador por tabela, incrementado por trigger (invalidação de caches / ETag)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS geracoes (
+      nome TEXT PRIMARY KEY,
+      versao INTEGER NOT NULL DEFAULT 0,
+      alterado_em TEXT
+    )
+    """)
+    cur.execute("PRAGMA table_info(geracoes)")
+    if "alterado_em" not in {r[1] for r in cur.fetchall()}:
+        cur.execute("ALTER TABLE geracoes ADD COLUMN alterado_em TEXT")
+    cur.execute("INSERT OR IGNORE INTO geracoes (nome) VALUES ('bloqueios'), ('agendamentos'), ('recorrencias')")
+
+    # Versão por DIA da agenda (ETag de GET /agendamentos?data=)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS versoes_dia (
+      data TEXT PRIMARY KEY,
+      versao INTEGER NOT NULL DEFAULT 0,
+      alterado_em TEXT
+    ) WITHOUT ROWID
+    """)
+
+    # Resumo diário para relatórios (mantido pelos triggers abaixo)
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_stats'")
+    backfill = cur.fetchone() is None
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS daily_stats (
+      data TEXT NOT NULL,
+      hora TEXT NOT NULL,
+      servico TEXT NOT NULL DEFAULT '',
+      status TEXT NOT NULL,
+      qtd INTEGER NOT NULL DEFAULT 0,
+      vagas INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (data, hora, servico, status)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("PRAGMA table_info(daily_stats)")
+    if "vagas" not in {r[1] for r in cur.fetchall()}:
+        # vagas ocupadas (duração em passos da grade): só uma reconstrução preenche
+        cur.execute("ALTER TABLE daily_stats ADD COLUMN vagas INTEGER NOT NULL DEFAULT 0")
+        backfill = True
+
+    # Triggers são sempre recriados: a definição aqui é a fonte da verdade
+    agora = "strftime('%Y-%m-%d %H:%M:%S','now')"
+    geracao = lambda nome: (f"UPDATE geracoes SET versao = versao + 1, alterado_em = {agora} "
+                            f"WHERE nome = '{nome}';")
+    versao_dia = lambda expr, cond="": (
+        f"INSERT INTO versoes_dia (data, versao, alterado_em) SELECT {expr}, 1, {agora} "
+        f"WHERE {cond or 'true'} "
+        f"ON CONFLICT(data) DO UPDATE SET versao = versao + 1, alterado_em = excluded.alterado_em;")
+    conta = lambda ref, delta: (
+        f"INSERT INTO daily_stats (data, hora, servico, status, qtd, vagas) "
+        f"VALUES ({ref}.data, coalesce({ref}.hora, ''), coalesce({ref}.servico, ''), coalesce({ref}.status, ''), {delta}, "
+        f"{delta} * {relatorios.sql_vagas(ref)}) "
+        f"ON CONFLICT(data, hora, servico, status) DO UPDATE SET qtd = qtd + excluded.qtd, "
+        f"vagas = vagas + excluded.vagas;")
+    # cadeiras (profissionais ativos) de um dia de hoje em diante: linha status='cadeiras' em
+    # daily_stats; depois que o dia passa o valor fica (capacidade histórica dos relatórios)
+    hoje = "date('now', 'localtime')"
+    ativos = "(SELECT count(*) FROM profissionais WHERE ativo = 1)"
+    cadeiras = lambda ref: (
+        f"INSERT INTO daily_stats (data, hora, servico, status, qtd, vagas) "
+        f"SELECT {ref}.data, '', '', '{relatorios.CADEIRAS}', 0, {ativos} WHERE {ref}.data >= {hoje} "
+        f"ON CONFLICT(data, hora, servico, status) DO UPDATE SET vagas = excluded.vagas;")
+    busca = lambda ref, apagar=False: "".join(
+        f"INSERT INTO {tabela} ({tabela}, rowid, {col}) VALUES ('delete', {ref}.id, {ref}.{col});" if apagar
+        else f"INSERT INTO {tabela} (rowid, {col}) VALUES ({ref}.id, {ref}.{col});"
+        for tabela, col in (("busca_nome", "nome_cliente"), ("busca_telefone", "telefone_digitos")))
+    cliente = lambda: (
+        f"INSERT INTO clientes (telefone_e164, nome) VALUES ({SQL_E164.format(d='NEW.telefone_digitos')}, "
+        f"NEW.nome_cliente) ON CONFLICT(telefone_e164) DO UPDATE SET nome = excluded.nome, "
+        f"atualizado_em = {agora};"
+        f"UPDATE agendamentos SET cliente_id = (SELECT id FROM clientes WHERE telefone_e164 = "
+        f"{SQL_E164.format(d='NEW.telefone_digitos')}) WHERE id = NEW.id;")
+    com_cliente = f"WHEN NEW.status <> 'bloqueado' AND {SQL_E164.format(d='NEW.telefone_digitos')} IS NOT NULL"
+    triggers = {
+        "trg_blk_geracao_insert": ("AFTER INSERT ON bloqueios", geracao("bloqueios")),
+        "trg_blk_geracao_update": ("AFTER UPDATE ON bloqueios", geracao("bloqueios")),
+        "trg_blk_geracao_delete": ("AFTER DELETE ON bloqueios", geracao("bloqueios")),
+        "trg_rec_geracao_insert": ("AFTER INSERT ON recorrencias", geracao("recorrencias")),
+        "trg_rec_geracao_update": ("AFTER UPDATE ON recorrencias", geracao("recorrencias")),
+        "trg_rec_geracao_delete": ("AFTER DELETE ON recorrencias", geracao("recorrencias")),
+        "trg_exc_geracao_insert": ("AFTER INSERT ON recorrencias_excecoes", geracao("recorrencias")),
+        "trg_exc_geracao_delete": ("AFTER DELETE ON recorrencias_excecoes", geracao("recorrencias")),
+        "trg_ag_versao_insert": ("AFTER INSERT ON agendamentos",
+                                 geracao("agendamentos") + versao_dia("NEW.data")),
+        # cliente_id fora da lista: o trigger de clientes não conta como mudança da agenda
+        "trg_ag_versao_update": ("AFTER UPDATE OF nome_cliente, telefone, data, hora, servico, status, "
+                                 "profissional_id, duracao_min ON agendamentos",
+                                 geracao("agendamentos") + versao_dia("OLD.data")
+                                 + versao_dia("NEW.data", "NEW.data <> OLD.data")),
+        "trg_ag_versao_delete": ("AFTER DELETE ON agendamentos",
+                                 geracao("agendamentos") + versao_dia("OLD.data")),
+        "trg_ag_stats_insert": ("AFTER INSERT ON agendamentos", conta("NEW", 1) + cadeiras("NEW")),
+        "trg_ag_stats_update": ("AFTER UPDATE OF data, hora, servico, status, duracao_min ON agendamentos",
+                                conta("OLD", -1) + conta("NEW", 1) + cadeiras("NEW")),
+        "trg_prof_cadeiras_insert": ("AFTER INSERT ON profissionais",
+                                     f"UPDATE daily_stats SET vagas = {ativos} "
+                                     f"WHERE status = '{relatorios.CADEIRAS}' AND data >= {hoje};"),
+        "trg_prof_cadeiras_update": ("AFTER UPDATE OF ativo ON profissionais",
+                                     f"UPDATE daily_stats SET vagas = {ativos} "
+                                     f"WHERE status = '{relatorios.CADEIRAS}' AND data >= {hoje};"),
+        "trg_ag_stats_delete": ("AFTER DELETE ON agendamentos", conta("OLD", -1)),
+        "trg_ag_cliente_insert": (f"AFTER INSERT ON agendamentos {com_cliente}", cliente()),
+        "trg_ag_cliente_update": (f"AFTER UPDATE OF nome_cliente, telefone ON agendamentos {com_cliente}",
+                                  cliente()),
+        "trg_ag_busca_insert": ("AFTER INSERT ON agendamentos", busca("NEW")),
+        "trg_ag_busca_update": ("AFTER UPDATE OF nome_cliente, telefone ON agendamentos",
+                                busca("OLD", apagar=True) + busca("NEW")),
+        "trg_ag_busca_delete": ("AFTER DELETE ON agendamentos", busca("OLD", apagar=True)),
+        # arquivar = DELETE em agendamentos + INSERT aqui: contagem e busca voltam ao que eram
+        "trg_hist_stats_insert": ("AFTER INSERT ON agendamentos_historico", conta("NEW", 1)),
+        "trg_hist_stats_delete": ("AFTER DELETE ON agendamentos_historico", conta("OLD", -1)),
+        "trg_hist_busca_insert": ("AFTER INSERT ON agendamentos_historico", busca("NEW")),
+        "trg_hist_busca_delete": ("AFTER DELETE ON agendamentos_historico", busca("OLD", apagar=True)),
+        "trg_hist_versao_delete": ("AFTER DELETE ON agendamentos_historico",
+                                   geracao("agendamentos") + versao_dia("OLD.data")),
+    }
+    for nome, (quando, corpo) in triggers.items():
+        cur.execute(f"DROP TRIGGER IF EXISTS {nome}")
+        cur.execute(f"CREATE TRIGGER {nome} {quando} BEGIN {corpo} END")
+    if reindexar_busca:
+        cur.execute("INSERT INTO busca_nome (busca_nome) VALUES ('rebuild')")
+        cur.execute("INSERT INTO busca_telefone (busca_telefone) VALUES ('rebuild')")
+        # o rebuild só lê a tabela de conteúdo (agendamentos)
+        cur.execute("INSERT INTO busca_nome (rowid, nome_cliente) "
+                    "SELECT id, nome_cliente FROM agendamentos_historico")
+        cur.execute("INSERT INTO busca_telefone (rowid, telefone_digitos) "
+                    "SELECT id, telefone_digitos FROM agendamentos_historico")
+    c.commit()
+    if backfill:
+        relatorios.reconstruir(c)
+    c.commit()
+    # banco criado antes do auto_vacuum=INCREMENTAL (db.PRAGMAS): só muda com um VACUUM completo,
+    # que reescreve o arquivo. Não roda aqui (no boot, contra o banco de produção): é ação explícita
+    if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        print("⚠️ auto_vacuum não é INCREMENTAL: incremental_vacuum sem efeito até rodar "
+              "`python manutencao.py --converter` (ou POST /admin/manutencao/converter).")
@@ -0,0 +1,186 @@
+# eventos.py
+"""
+Pub/sub em memória para empurrar mudanças da agenda via Server-Sent Events.
+
+- As rotas de escrita publicam (depois do commit) um delta pequeno.
+- Cada assinante tem uma fila limitada; se ela encher (cliente lento), o
+  assinante é derrubado com um evento `resync` e o painel recarrega a agenda.
+- Os últimos N eventos ficam num buffer circular para retomar a partir do
+  `Last-Event-ID` após uma reconexão.
+- No modo ASGI (asgi.py) o assinante é uma `AssinaturaAsync`: a fila continua
+  thread-safe para quem publica, mas quem lê espera num asyncio.Event em vez de
+  bloquear uma thread por conexão.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+RESYNC = object()  # sentinela: assinante perdeu eventos e deve recarregar
+
+
+class Assinatura:
+    def __init__(self, dia: str | None, tamanho_fila: int):
+        self.dia = dia
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+
+    def quer(self, evento: dict) -> bool:
+        if self.dia is None:
+            return True
+        dias = evento["dias"]
+        return not dias or self.dia in dias  # evento sem dia (ex.: limpeza em massa) vai p/ todos
+
+
+class FilaAvisada(queue.Queue):
+    """queue.Queue que acorda o event loop do leitor a cada item (chamado sob o mutex da fila)."""
+
+    def __init__(self, maxsize: int, loop: asyncio.AbstractEventLoop, aviso: asyncio.Event):
+        super().__init__(maxsize)
+        self._loop = loop
+        self._aviso = aviso
+
+    def _put(self, item):
+        super()._put(item)
+        self._loop.call_soon_threadsafe(self._aviso.set)
+
+
+class AssinaturaAsync(Assinatura):
+    """Criar de dentro do event loop (usa o loop corrente)."""
+
+    def __init__(self, dia: str | None, tamanho_fila: int):
+        self.dia = dia
+        self.aviso = asyncio.Event()
+        self.fila = FilaAvisada(tamanho_fila, asyncio.get_running_loop(), self.aviso)
+
+
+class Barramento:
+    def __init__(self, historico: int = 500, tamanho_fila: int = 100, max_assinantes: int = 64):
+        self.tamanho_fila = tamanho_fila
+        self.max_assinantes = max_assinantes
+        # ids só valem dentro desta execução do processo
+        self.boot = format(int(time.time()), "x")
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._recentes = deque(maxlen=historico)
+        self._assinantes = set()
+        self._stats = {"publicados": 0, "descartados": 0}
+
+    def publicar(self, tipo: str, dados: dict, dias=()) -> str:
+        """Publica um evento; `dias` = datas ISO afetadas (filtro do ?data=)."""
+        with self._lock:
+            self._seq += 1
+            evento = {"id": f"{self.boot}:{self._seq}", "seq": self._seq, "tipo": tipo,
+                      "dados": dados, "dias": frozenset(d for d in dias if d)}
+            self._recentes.append(evento)
+            self._stats["publicados"] += 1
+            for a in list(self._assinantes):
+                if not a.quer(evento):
+                    continue
+                try:
+                    a.fila.put_nowait(evento)
+                except queue.Full:
+                    # cliente lento: derruba e pede resync, sem bloquear quem publica
+                    self._assinantes.discard(a)
+                    self._stats["descartados"] += 1
+                    self._forcar_resync(a)
+        return evento["id"]
+
+    @staticmethod
+    def _forcar_resync(a: Assinatura):
+        while True:
+            try:
+                a.fila.get_nowait()
+            except queue.Empty:
+                break
+        a.fila.put_nowait(RESYNC)
+
+    def assinar(self, dia: str | None = None, ultimo_id: str | None = None, classe=Assinatura):
+        """
+        Retorna (assinatura, pendentes). `pendentes` são os eventos perdidos desde
+        `ultimo_id`, ou [RESYNC] se não der para reconstruir a sequência.
+        None se o limite de assinantes foi atingido.
+        """
+        a = classe(dia, self.tamanho_fila)
+        with self._lock:
+            if len(self._assinantes) >= self.max_assinantes:
+                return None, []
+            pendentes = []
+            if ultimo_id:
+                boot, _, seq = ultimo_id.partition(":")
+                if boot != self.boot or not seq.isdigit():
+                    pendentes = [RESYNC]
+                else:
+                    seq = int(seq)
+                    if seq < self._seq and (not self._recentes or self._recentes[0]["seq"] > seq + 1):
+                        pendentes = [RESYNC]  # caiu para fora do buffer circular
+                    else:
+                        pendentes = [e for e in self._recentes if e["seq"] > seq and a.quer(e)]
+            self._assinantes.add(a)
+        return a, pendentes
+
+    def cancelar(self, a: Assinatura):
+        with self._lock:
+            self._assinantes.discard(a)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {"assinantes": len(self._assinantes), "ultimo_id": f"{self.boot}:{self._seq}",
+                    "buffer": len(self._recentes), **self._stats}
+
+
+def formatar_sse(evento) -> str:
+    if evento is RESYNC:
+        return "event: resync\ndata: {}\n\n"
+    dados = json.dumps(evento["dados"], ensure_ascii=False, separators=(",", ":"))
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {dados}\n\n"
+
+
+def fluxo(barramento: Barramento, a: Assinatura, pendentes: list, heartbeat: float = 15.0):
+    """Gerador do corpo text/event-stream; sempre libera a assinatura ao terminar."""
+    try:
+        yield "retry: 3000\n\n"
+        for e in pendentes:
+            yield formatar_sse(e)
+            if e is RESYNC:
+                return
+        while True:
+            try:
+                e = a.fila.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": ping\n\n"  # mantém proxies/LB com a conexão aberta
+                continue
+            yield formatar_sse(e)
+            if e is RESYNC:
+                return
+    finally:
+        barramento.cancelar(a)
+
+
+async def fluxo_async(barramento: Barramento, a: AssinaturaAsync, pendentes: list,
+                      heartbeat: float = 15.0):
+    """Mesmo corpo de `fluxo`, sem thread parada por conexão."""
+    try:
+        yield "retry: 3000\n\n"
+        for e in pendentes:
+            yield formatar_sse(e)
+            if e is RESYNC:
+                return
+        while True:
+            try:
+                e = a.fila.get_nowait()
+            except queue.Empty:
+                a.aviso.clear()
+                if not a.fila.empty():  # item chegou entre o get e o clear
+                    continue
+                try:
+                    await asyncio.wait_for(a.aviso.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                continue
+            yield formatar_sse(e)
+            if e is RESYNC:
+                return
+    finally:
+        barramento.cancelar(a)
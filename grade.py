@@ -0,0 +1,46 @@
+# grade.py
+"""
+Grade semanal de horários de atendimento.
+
+Antes ficava duplicada em barbeiro-final/script.js e cliente-final/script.js;
+agora a API é a fonte da verdade. Pode ser sobrescrita por um JSON no formato
+{"terca": ["09:00", ...], "sabado": [...]} (dias ausentes = fechado).
+"""
+import json
+
+# Na ordem de date.weekday() (segunda = 0)
+DIAS_SEMANA = ("segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo")
+
+HORARIOS_NORMAIS = ("09:00", "09:30", "10:00", "10:30", "11:00", "13:30", "14:00",
+                    "14:30", "15:00", "15:30", "16:00", "16:30", "17:00", "17:30")
+HORARIOS_EXTENDIDOS = HORARIOS_NORMAIS + ("18:00", "18:30", "19:00", "19:30", "20:00")
+
+GRADE_PADRAO = {
+    "terca": HORARIOS_NORMAIS,
+    "quarta": HORARIOS_NORMAIS,
+    "quinta": HORARIOS_NORMAIS,
+    "sexta": HORARIOS_EXTENDIDOS,
+    "sabado": HORARIOS_EXTENDIDOS,
+}
+
+def normalizar_hora(txt: str) -> str:
+    """"9:5" -> "09:05"; ValueError se não for um horário válido."""
+    h, m = str(txt).strip().split(":")
+    h, m = int(h), int(m)
+    if not (0 <= h < 24 and 0 <= m < 60):
+        raise ValueError(f"Horário inválido na grade: {txt!r}")
+    return f"{h:02d}:{m:02d}"
+
+def carregar_grade(caminho: str | None = None) -> tuple[tuple[str, ...], ...]:
+    """
+    Retorna a grade pré-calculada: tupla de 7 posições (índice = date.weekday())
+    com os horários ordenados de cada dia.
+    """
+    cfg = GRADE_PADRAO
+    if caminho:
+        with open(caminho, encoding="utf-8") as f:
+            cfg = json.load(f)
+        desconhecidos = set(cfg) - set(DIAS_SEMANA)
+        if desconhecidos:
+            raise ValueError(f"Dias desconhecidos na grade: {', '.join(sorted(desconhecidos))}")
+    return tuple(tuple(sorted({normalizar_hora(h) for h in cfg.get(dia, ())})) for dia in DIAS_SEMANA)
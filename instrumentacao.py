@@ -0,0 +1,292 @@
+# instrumentacao.py
+"""
+Instrumentação opcional (METRICAS=1) de tempo por request e por statement SQL.
+
+Desligada, nada daqui entra no caminho do request: o app usa o pool e a
+conexão sqlite3 normais. Ligada:
+
+- `PoolMedido` entrega conexões `ConexaoMedida`, que cronometram cada
+  execute/executemany/commit e, via `set_trace_callback`, contam os
+  statements que o SQLite realmente rodou (inclui BEGIN/COMMIT e triggers);
+- cada request ganha um header `Server-Timing` com as fases
+  conn (checkout do pool), fila (espera na fila do escritor), lock (espera do
+  BEGIN IMMEDIATE), sql, commit, json (serialização) e total. Nas escritas,
+  fila/lock/sql/commit do item vêm da thread do escritor (Escritor.tempos_thread);
+- histogramas por rota e por statement ficam em `/metrics` (formato Prometheus).
+
+O tempo de `sql` cobre o execute (até a primeira linha); o fetch das demais
+linhas entra no total do request.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+import db
+
+# limites dos buckets em segundos (estilo Prometheus)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+FASES = ("conn", "fila", "lock", "sql", "commit", "json")
+
+_local = threading.local()  # fases do request em andamento nesta thread
+
+
+class Histograma:
+    __slots__ = ("contagens", "soma", "n")
+
+    def __init__(self):
+        self.contagens = [0] * (len(BUCKETS) + 1)  # último = +Inf
+        self.soma = 0.0
+        self.n = 0
+
+    def observar(self, segundos: float):
+        i = 0
+        while i < len(BUCKETS) and segundos > BUCKETS[i]:
+            i += 1
+        self.contagens[i] += 1
+        self.soma += segundos
+        self.n += 1
+
+
+class Registro:
+    """Histogramas e contadores do processo (um lock para tudo: escrita é O(1))."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rotas = defaultdict(Histograma)
+        self.statements = defaultdict(Histograma)
+        self.respostas = defaultdict(int)      # (rota, status) -> n
+        self.contadores = defaultdict(int)     # commits, rollbacks, sqlite_statements, ...
+
+    def rota(self, chave: str, status: int, segundos: float):
+        with self._lock:
+            self.rotas[chave].observar(segundos)
+            self.respostas[(chave, status)] += 1
+
+    def statement(self, chave: str, segundos: float):
+        with self._lock:
+            self.statements[chave].observar(segundos)
+
+    def contar(self, nome: str, n: int = 1):
+        with self._lock:
+            self.contadores[nome] += n
+
+    def copia(self):
+        with self._lock:
+            copiar = lambda hs: {k: (list(h.contagens), h.soma, h.n) for k, h in hs.items()}
+            return (copiar(self.rotas), copiar(self.statements),
+                    dict(self.respostas), dict(self.contadores))
+
+
+registro = Registro()
+
+_ESPACOS = re.compile(r"\s+")
+_LISTA = re.compile(r"\?(\s*,\s*\?)+")
+
+
+def chave_sql(sql: str) -> str:
+    """Statement normalizado para rótulo: espaços colapsados e listas IN (?, ?, ...) unificadas."""
+    sql = _LISTA.sub("?, ...", _ESPACOS.sub(" ", sql).strip())
+    return sql if len(sql) <= 160 else sql[:157] + "..."
+
+
+def _fase(nome: str, segundos: float):
+    fases = getattr(_local, "fases", None)
+    if fases is not None:
+        fases[nome] += segundos
+
+
+def _medir_sql(sql: str, segundos: float):
+    registro.statement(chave_sql(sql), segundos)
+    _fase("sql", segundos)
+    fases = getattr(_local, "fases", None)
+    if fases is not None:
+        _local.n_sql += 1
+
+
+class CursorMedido(sqlite3.Cursor):
+    def execute(self, sql, parametros=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            _medir_sql(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, parametros):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            _medir_sql(sql, time.perf_counter() - t0)
+
+
+class ConexaoMedida(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(self._rastrear)
+
+    @staticmethod
+    def _rastrear(sql: str):
+        registro.contar("sqlite_statements")
+        if sql == "COMMIT":
+            registro.contar("commits")
+        elif sql.startswith("ROLLBACK") and " TO " not in sql:
+            registro.contar("rollbacks")
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            _medir_sql(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, parametros):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            _medir_sql(sql, time.perf_counter() - t0)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _fase("commit", time.perf_counter() - t0)
+
+
+class PoolMedido(db.PoolConexoes):
+    fabrica = ConexaoMedida
+
+    def obter(self) -> sqlite3.Connection:
+        t0 = time.perf_counter()
+        try:
+            return super().obter()
+        finally:
+            _fase("conn", time.perf_counter() - t0)
+
+
+class JSONMedido(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            _fase("json", time.perf_counter() - t0)
+
+
+# ---------- integração com o Flask ----------
+def _inicio():
+    _local.inicio = time.perf_counter()
+    _local.fases = dict.fromkeys(FASES, 0.0)
+    _local.n_sql = 0
+
+
+def _fim(resp, escritor=None):
+    fases = getattr(_local, "fases", None)
+    if fases is None:
+        return resp
+    total = time.perf_counter() - _local.inicio
+    fases["lock"] = db.espera_lock_thread(zerar=False)
+    if escritor is not None:
+        # o que as escritas do request gastaram na thread do escritor
+        for nome, segundos in escritor.tempos_thread(zerar=False).items():
+            fases[nome] += segundos
+    regra = request.url_rule.rule if request.url_rule else "<sem rota>"
+    registro.rota(f"{request.method} {regra}", resp.status_code, total)
+    partes = [f"{nome};dur={fases[nome] * 1000:.2f}" for nome in FASES]
+    partes[FASES.index("sql")] += f';desc="{_local.n_sql} stmts"'
+    partes.append(f"total;dur={total * 1000:.2f}")
+    resp.headers["Server-Timing"] = ", ".join(partes)
+    _local.fases = None
+    return resp
+
+
+def instalar(app, escritor=None):
+    """Liga os hooks de request e o provider de JSON medido."""
+    app.json = JSONMedido(app)
+    app.before_request(_inicio)
+    app.after_request(lambda resp: _fim(resp, escritor))
+
+
+# ---------- exposição (Prometheus text format) ----------
+def _rotulo(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _histogramas(nome: str, ajuda: str, rotulo: str, dados: dict) -> list[str]:
+    linhas = [f"# HELP {nome} {ajuda}", f"# TYPE {nome} histogram"]
+    for chave, (contagens, soma, n) in sorted(dados.items()):
+        lbl = f'{rotulo}="{_rotulo(chave)}"'
+        acumulado = 0
+        for limite, qtd in zip(BUCKETS + ("+Inf",), contagens):
+            acumulado += qtd
+            linhas.append(f'{nome}_bucket{{{lbl},le="{limite}"}} {acumulado}')
+        linhas.append(f"{nome}_sum{{{lbl}}} {soma:.6f}")
+        linhas.append(f"{nome}_count{{{lbl}}} {n}")
+    return linhas
+
+
+def _metrica(nome: str, tipo: str, ajuda: str, valor) -> list[str]:
+    return [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}", f"{nome} {valor}"]
+
+
+def exportar(pool: db.PoolConexoes, ativo: bool, escritor=None) -> str:
+    """Texto para /metrics. Pool, lock e escritor sempre; histogramas só com a instrumentação ligada."""
+    p, lk = pool.metricas(), db.metricas_lock()
+    linhas = []
+    linhas += _metrica("barbearia_db_conexoes_criadas_total", "counter",
+                       "Conexões SQLite abertas pelo pool.", p["criadas"])
+    linhas += _metrica("barbearia_db_checkouts_total", "counter",
+                       "Conexões emprestadas pelo pool.", p["checkouts"])
+    linhas += _metrica("barbearia_db_pool_esperas_total", "counter",
+                       "Checkouts que esperaram conexão livre.", p["esperas"])
+    linhas += _metrica("barbearia_db_pool_em_uso", "gauge", "Conexões emprestadas agora.", p["em_uso"])
+    linhas += _metrica("barbearia_db_transacoes_total", "counter",
+                       "Transações abertas com BEGIN IMMEDIATE.", lk["transacoes"])
+    linhas += _metrica("barbearia_db_lock_esperas_total", "counter",
+                       "BEGIN IMMEDIATE que esperou o lock de escrita.", lk["esperas"])
+    linhas += _metrica("barbearia_db_lock_espera_seconds_total", "counter",
+                       "Tempo total esperando o lock de escrita.", lk["tempo_espera_ms"] / 1000)
+    if escritor is not None:
+        e = escritor.metricas()
+        linhas += _metrica("barbearia_escritor_fila", "gauge", "Escritas esperando o escritor.", e["fila"])
+        linhas += _metrica("barbearia_escritor_fila_max", "gauge", "Maior fila já vista.", e["fila_max"])
+        linhas += _metrica("barbearia_escritor_falhas_commit_total", "counter",
+                           "Lotes perdidos por falha no BEGIN/COMMIT.", e["falhas_commit"])
+        linhas += _metrica("barbearia_escritor_fila_seconds_total", "counter",
+                           "Tempo somado dos itens na fila.", e["tempo_fila_ms"] / 1000)
+        linhas += ["# HELP barbearia_escritor_lote_itens Itens por lote (um COMMIT cada).",
+                   "# TYPE barbearia_escritor_lote_itens histogram"]
+        acumulado = 0
+        for faixa, n in e["tamanho_lote"].items():
+            acumulado += n
+            limite = faixa[2:] if faixa.startswith("<=") else "+Inf"
+            linhas.append(f'barbearia_escritor_lote_itens_bucket{{le="{limite}"}} {acumulado}')
+        linhas.append(f"barbearia_escritor_lote_itens_sum {e['itens']}")
+        linhas.append(f"barbearia_escritor_lote_itens_count {e['lotes']}")
+    if ativo:
+        rotas, statements, respostas, contadores = registro.copia()
+        linhas += _metrica("barbearia_sqlite_commits_total", "counter",
+                           "COMMITs executados.", contadores.get("commits", 0))
+        linhas += _metrica("barbearia_sqlite_rollbacks_total", "counter",
+                           "ROLLBACKs executados.", contadores.get("rollbacks", 0))
+        linhas += _metrica("barbearia_sqlite_statements_total", "counter",
+                           "Statements vistos pelo trace do SQLite (inclui triggers).",
+                           contadores.get("sqlite_statements", 0))
+        linhas += ["# HELP barbearia_http_respostas_total Respostas por rota e status.",
+                   "# TYPE barbearia_http_respostas_total counter"]
+        for (rota, status), n in sorted(respostas.items()):
+            linhas.append(f'barbearia_http_respostas_total{{rota="{_rotulo(rota)}",status="{status}"}} {n}')
+        linhas += _histogramas("barbearia_http_request_duration_seconds",
+                               "Duração do request por rota (até montar a resposta).", "rota", rotas)
+        linhas += _histogramas("barbearia_sql_duration_seconds",
+                               "Duração do execute por statement.", "sql", statements)
+    return "\n".join(linhas) + "\n"
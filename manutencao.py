@@ -0,0 +1,310 @@
+# manutencao.py
+"""
+Manutenção do SQLite em fundo: uma thread que só age quando o escritor está
+quieto (nenhum lote há `quieto` segundos).
+
+- checkpoint PASSIVE do WAL depois de cada rajada de escritas: copia o que der
+  sem esperar leitor nem escritor, e o -wal não cresce até o autocheckpoint
+  disparar no meio de um COMMIT de request;
+- `PRAGMA incremental_vacuum` a cada `intervalo_vacuo`: devolve as páginas
+  livres (DELETE em massa, arquivamento) em passos de `paginas_vacuo`, cada
+  passo um item do escritor (as rotas passam entre um e outro);
+- `PRAGMA optimize` a cada `intervalo_otimizar` nas conexões do pool;
+- snapshot consistente pela API de backup do sqlite3 a cada `intervalo_backup`,
+  `paginas_backup` páginas por passo com `pausa_backup` entre eles. Se uma
+  escrita de outra conexão reinicia a cópia, o passo dobra (no limite, uma cópia
+  numa transação de leitura só — no WAL, sem travar escritor nenhum). O arquivo
+  sai em modo DELETE (autocontido), passa por quick_check e só então ganha o
+  nome final; ficam os `manter_backups` mais recentes.
+
+Banco criado antes do auto_vacuum=INCREMENTAL precisa de uma conversão (VACUUM
+completo, reescreve o arquivo), só sob demanda: POST /admin/manutencao/converter
+ou `python manutencao.py --converter`. Pela API ela roda numa thread própria
+(o POST responde 202; o andamento sai em GET /admin/manutencao) e no escritor,
+entre dois lotes, com a espera de `espera_converter` em vez da das escritas.
+
+Os snapshots vão para `pasta_backup` (padrão: `backups/` ao lado do banco,
+ignorada pelo git).
+
+Uso avulso (ex.: cron):  python manutencao.py [destino.db]
+"""
+import glob
+import os
+import sqlite3
+import threading
+import time
+
+TAREFAS = ("checkpoint", "vacuo", "otimizar", "backup", "converter")
+TAREFAS_LONGAS = ("converter",)  # pela API rodam em fundo (ver Manutencao.iniciar)
+MAX_REINICIOS_BACKUP = 4   # depois disso: cópia num passo só
+
+
+class BackupReiniciado(Exception):
+    """A origem mudou no meio da cópia (o sqlite3 recomeçaria do zero)."""
+
+
+def checkpoint(c: sqlite3.Connection) -> dict:
+    """wal_checkpoint(PASSIVE): não espera ninguém; copia até onde os leitores deixam."""
+    ocupado, wal, copiadas = c.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    return {"ocupado": bool(ocupado), "wal_paginas": wal, "copiadas": copiadas}
+
+
+def vacuo_incremental(c: sqlite3.Connection, paginas: int) -> int:
+    """Devolve até `paginas` páginas livres (sem transação própria: roda no escritor)."""
+    livres = c.execute("PRAGMA freelist_count").fetchone()[0]
+    # o módulo sqlite3 dá um step por execute, e cada step do pragma solta UMA página
+    cur = c.cursor()
+    try:
+        for _ in range(min(paginas, livres)):
+            cur.execute("PRAGMA incremental_vacuum")
+    finally:
+        cur.close()
+    return livres - c.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def converter_auto_vacuum(c: sqlite3.Connection) -> bool:
+    """Liga auto_vacuum=INCREMENTAL (VACUUM completo, fora de transação); False se já estava."""
+    if c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    c.execute("VACUUM")
+    return True
+
+
+def snapshot(origem: sqlite3.Connection, destino: str, paginas: int = 256,
+             pausa: float = 0.005) -> dict:
+    """Copia `origem` para o arquivo `destino` (gravado em destino.tmp e renomeado no fim)."""
+    temporario = destino + ".tmp"
+    reinicios = 0
+    inicio = time.perf_counter()
+    while True:
+        passo = -1 if reinicios >= MAX_REINICIOS_BACKUP else paginas << reinicios
+        restantes = []
+
+        def progresso(status, faltam, total):
+            if restantes and faltam > restantes[-1]:
+                raise BackupReiniciado()
+            restantes.append(faltam)
+            if faltam:
+                time.sleep(pausa)  # o `sleep` do backup() só vale para SQLITE_BUSY; a pausa é aqui
+
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        alvo = sqlite3.connect(temporario)
+        try:
+            origem.backup(alvo, pages=passo, progress=progresso)
+            alvo.execute("PRAGMA journal_mode = DELETE")  # a origem é WAL: o snapshot não
+            ok = alvo.execute("PRAGMA quick_check").fetchone()[0]
+            total = alvo.execute("PRAGMA page_count").fetchone()[0]
+        except BackupReiniciado:
+            reinicios += 1
+            continue
+        finally:
+            alvo.close()
+        break
+    if ok != "ok":
+        os.remove(temporario)
+        raise sqlite3.DatabaseError(f"snapshot inconsistente: {ok}")
+    os.replace(temporario, destino)
+    return {"arquivo": destino, "bytes": os.path.getsize(destino), "paginas": total,
+            "passo": passo, "reinicios": reinicios,
+            "tempo_ms": round((time.perf_counter() - inicio) * 1000, 2)}
+
+
+class Manutencao:
+    """Thread de fundo (tique de `tique` s; 0 = desligada) que roda as tarefas quando o banco está quieto."""
+
+    def __init__(self, pool, escritor, tique: float = 1.0, quieto: float = 2.0,
+                 intervalo_vacuo: float = 3600.0, paginas_vacuo: int = 256,
+                 intervalo_otimizar: float = 3600.0, pasta_backup: str | None = None,
+                 intervalo_backup: float = 86400.0, paginas_backup: int = 256,
+                 pausa_backup: float = 0.005, manter_backups: int = 7,
+                 espera_converter: float = 3600.0):
+        self.pool = pool
+        self.escritor = escritor
+        self.tique = tique
+        self.quieto = quieto
+        self.intervalo_vacuo = intervalo_vacuo
+        self.paginas_vacuo = paginas_vacuo
+        self.intervalo_otimizar = intervalo_otimizar
+        self.pasta_backup = pasta_backup or os.path.join(os.path.dirname(pool.caminho), "backups")
+        self.intervalo_backup = intervalo_backup
+        self.paginas_backup = paginas_backup
+        self.pausa_backup = pausa_backup
+        self.manter_backups = manter_backups
+        self.espera_converter = espera_converter
+        self._mutex = threading.Lock()
+        self._tarefa = threading.Lock()  # uma tarefa por vez (thread ou POST /admin/manutencao)
+        self._thread = None
+        self._pid = None
+        self._avulsa = None              # (tarefa, thread) disparada por iniciar()
+        self._conexao = None             # (pid, conexão) própria, fora do pool
+        self._checkpoint_em = 0.0        # monotonic do último checkpoint
+        # primeira rodada de vacuo/optimize/backup um intervalo depois de subir
+        agora = time.monotonic()
+        self._proxima = {"vacuo": agora + intervalo_vacuo, "otimizar": agora + intervalo_otimizar,
+                         "backup": agora + intervalo_backup}
+        self._stats = {t: {"execucoes": 0, "falhas": 0, "ultima": None, "ultimo_erro": None,
+                           "tempo": 0.0, "resultado": None} for t in TAREFAS}
+
+    # ---------- thread ----------
+    def garantir(self):
+        # sobe no primeiro request (e de novo após fork: a thread não é herdada)
+        if self.tique <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._mutex:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._laco, name="manutencao", daemon=True)
+                self._thread.start()
+
+    def _laco(self):
+        while True:
+            time.sleep(self.tique)
+            try:
+                self._rodada()
+            except Exception:
+                pass  # já contado em executar(); tenta de novo no próximo tique
+
+    def _rodada(self):
+        if self.escritor.ocioso() < self.quieto:
+            return
+        agora = time.monotonic()
+        # checkpoint só se houve lote desde o último (as escritas do CLI pegam o autocheckpoint)
+        if self.escritor.ultimo_lote > self._checkpoint_em:
+            self.executar("checkpoint")
+        for tarefa in ("vacuo", "otimizar", "backup"):
+            intervalo = getattr(self, f"intervalo_{tarefa}")
+            if intervalo > 0 and agora >= self._proxima[tarefa]:
+                self._proxima[tarefa] = agora + intervalo
+                self.executar(tarefa)
+                if self.escritor.ocioso() < self.quieto:
+                    return  # voltou movimento: o resto fica para o próximo silêncio
+
+    # ---------- tarefas ----------
+    def conexao(self) -> sqlite3.Connection:
+        """Conexão dedicada da manutenção (reaberta após fork)."""
+        if self._conexao is None or self._conexao[0] != os.getpid():
+            self._conexao = (os.getpid(), self.pool.dedicada())
+        return self._conexao[1]
+
+    def executar(self, tarefa: str):
+        """Roda uma tarefa agora; devolve o resultado dela (também guardado nas métricas)."""
+        inicio = time.perf_counter()
+        with self._tarefa:
+            try:
+                resultado = getattr(self, f"_{tarefa}")()
+            except Exception as e:
+                with self._mutex:
+                    self._stats[tarefa]["falhas"] += 1
+                    self._stats[tarefa]["ultimo_erro"] = repr(e)
+                raise
+            finally:
+                with self._mutex:
+                    s = self._stats[tarefa]
+                    s["execucoes"] += 1
+                    s["ultima"] = time.strftime("%Y-%m-%d %H:%M:%S")
+                    s["tempo"] += time.perf_counter() - inicio
+        with self._mutex:
+            self._stats[tarefa]["resultado"] = resultado
+        return resultado
+
+    def iniciar(self, tarefa: str) -> bool:
+        """Roda `tarefa` numa thread própria e volta na hora; False se outra dessas ainda roda."""
+        with self._mutex:
+            if self._avulsa is not None and self._avulsa[1].is_alive():
+                return False
+            thread = threading.Thread(target=self._rodar_avulsa, args=(tarefa,),
+                                      name=f"manutencao-{tarefa}", daemon=True)
+            self._avulsa = (tarefa, thread)
+        thread.start()
+        return True
+
+    def _rodar_avulsa(self, tarefa: str):
+        try:
+            self.executar(tarefa)
+        except Exception:
+            pass  # já contado em executar(): aparece em ultimo_erro
+
+    def _checkpoint(self) -> dict:
+        self._checkpoint_em = time.monotonic()
+        return checkpoint(self.conexao())
+
+    def _vacuo(self) -> dict:
+        liberadas = passos = 0
+        while True:
+            n = self.escritor.executar(vacuo_incremental, self.paginas_vacuo)
+            liberadas += n; passos += 1
+            if n < self.paginas_vacuo:
+                break
+        return {"paginas_liberadas": liberadas, "passos": passos}
+
+    def _converter(self) -> dict:
+        return {"convertido": self.escritor.executar_sem_transacao(converter_auto_vacuum,
+                                                                   espera=self.espera_converter)}
+
+    def _otimizar(self) -> dict:
+        return {"conexoes": self.pool.otimizar()}
+
+    def _backup(self) -> dict:
+        os.makedirs(self.pasta_backup, exist_ok=True)
+        nome = os.path.splitext(os.path.basename(self.pool.caminho))[0]
+        carimbo = time.strftime("%Y%m%d-%H%M%S")
+        destino = os.path.join(self.pasta_backup, f"{nome}-{carimbo}.db")
+        n = 1
+        while os.path.exists(destino):  # dois POSTs no mesmo segundo
+            destino = os.path.join(self.pasta_backup, f"{nome}-{carimbo}-{n}.db"); n += 1
+        resultado = snapshot(self.conexao(), destino, self.paginas_backup, self.pausa_backup)
+        for velho in self.backups()[self.manter_backups:]:
+            os.remove(velho)
+        return resultado
+
+    def backups(self) -> list[str]:
+        """Snapshots na pasta, do mais novo para o mais velho."""
+        nome = os.path.splitext(os.path.basename(self.pool.caminho))[0]
+        return sorted(glob.glob(os.path.join(self.pasta_backup, f"{nome}-*.db")),
+                      key=os.path.getmtime, reverse=True)
+
+    def metricas(self) -> dict:
+        with self._mutex:
+            stats = {t: dict(s) for t, s in self._stats.items()}
+            avulsa = self._avulsa[0] if self._avulsa is not None and self._avulsa[1].is_alive() else None
+        ativo = self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+        agora = time.monotonic()
+        tarefas = {}
+        for t, s in stats.items():
+            intervalo = getattr(self, f"intervalo_{t}", None)
+            tarefas[t] = {"execucoes": s["execucoes"], "falhas": s["falhas"], "ultima": s["ultima"],
+                          "ultimo_erro": s["ultimo_erro"], "tempo_ms": round(s["tempo"] * 1000, 2),
+                          "resultado": s["resultado"]}
+            if t in TAREFAS_LONGAS:
+                tarefas[t]["em_andamento"] = t == avulsa
+            if intervalo:
+                tarefas[t]["intervalo_s"] = intervalo
+                tarefas[t]["proxima_em_s"] = round(max(self._proxima[t] - agora, 0.0), 1)
+        return {"ativo": ativo, "tique_s": self.tique, "quieto_s": self.quieto,
+                "ocioso_s": round(self.escritor.ocioso(), 1), "pasta_backup": self.pasta_backup,
+                "tarefas": tarefas}
+
+
+if __name__ == "__main__":
+    import sys
+    import nucleo
+    caminho = nucleo.caminho_banco()
+    origem = nucleo.abrir_pool(caminho, tamanho=1).dedicada()
+    if sys.argv[1:] == ["--converter"]:
+        if converter_auto_vacuum(origem):
+            print("auto_vacuum = INCREMENTAL (banco reescrito).")
+        else:
+            print("auto_vacuum já era INCREMENTAL.")
+        sys.exit(0)
+    if len(sys.argv) > 1:
+        destino = sys.argv[1]
+    else:
+        pasta = os.path.join(os.path.dirname(caminho), "backups")
+        os.makedirs(pasta, exist_ok=True)
+        nome = os.path.splitext(os.path.basename(caminho))[0]
+        destino = os.path.join(pasta, f"{nome}-{time.strftime('%Y%m%d-%H%M%S')}.db")
+    r = snapshot(origem, destino)
+    print(f"snapshot em {r['arquivo']}: {r['paginas']} páginas, {r['bytes']} bytes, "
+          f"{r['reinicios']} reinício(s), {r['tempo_ms']} ms.")
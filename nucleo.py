@@ -0,0 +1,178 @@
+# nucleo.py
+"""
+Núcleo compartilhado pela API (app.py) e pelo CLI (barbearia.py).
+
+- um caminho de banco (BARBEARIA_DB ou o barbearia.db ao lado do código, sempre
+  absoluto) e uma estratégia de conexão: `db.PoolConexoes`, com os PRAGMAs
+  (WAL, busy_timeout...) e o cache de statements preparados de cada conexão;
+- normalização de entrada (telefone, datas);
+- `Calendario`: dias e horários fechados (bloqueios avulsos + recorrências), com
+  os mesmos caches e a mesma invalidação cross-process nos dois processos.
+
+O schema/migrações ficam em esquema.py; as escritas da agenda em reservas.py.
+"""
+import os
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import db
+import recorrencias
+import reservas
+from cache_bloqueios import CacheBloqueios
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def caminho_banco() -> str:
+    # caminho ABSOLUTO: API e CLI abrem o mesmo arquivo, de qualquer diretório
+    return os.environ.get("BARBEARIA_DB") or os.path.join(BASE_DIR, "barbearia.db")
+
+
+def abrir_pool(caminho: str | None = None, tamanho: int | None = None,
+               classe=db.PoolConexoes) -> db.PoolConexoes:
+    if tamanho is None:
+        tamanho = int(os.environ.get("DB_POOL_SIZE", "8"))
+    return classe(caminho or caminho_banco(), tamanho=tamanho)
+
+
+# ---------- Utils ----------
+def formatar_telefone(numero: str) -> str:
+    numero = ''.join(filter(str.isdigit, numero))
+    if len(numero) == 11:
+        return f"({numero[:2]}) {numero[2:7]}-{numero[7:]}"
+    if len(numero) == 10:
+        return f"({numero[:2]}) {numero[2:6]}-{numero[6:]}"
+    return numero or ""
+
+# Formatos aceitos, no formato canônico (2 dígitos p/ dia e mês, 4 p/ ano): casados
+# direto, sem strptime. O resto (ex.: "5/8/2025", ano < 1000) cai na implementação original.
+_AMD = re.compile(r"([0-9]{4})([-/.])([0-9]{2})\2([0-9]{2})")
+_DMA = re.compile(r"([0-9]{2})([-/.])([0-9]{2})\2([0-9]{4})")
+_DIAS_MES = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_RELATIVAS = {"hoje": 0, "amanha": 1, "amanhã": 1}
+_relativas_do_dia = (None, {})  # (dia em que foi calculado, {"hoje": iso, ...})
+
+def _valida(a: int, m: int, d: int) -> bool:
+    return (1 <= m <= 12 and 1 <= d <= _DIAS_MES[m]
+            and (m != 2 or d < 29 or (a % 4 == 0 and (a % 100 != 0 or a % 400 == 0))))
+
+def _iso(a: int, m: int, d: int) -> str | None:
+    return f"{a:04d}-{m:02d}-{d:02d}" if _valida(a, m, d) else None
+
+@lru_cache(maxsize=4096)
+def _normalizar_literal(raw: str) -> str | None:
+    if len(raw) == 8 and raw.isdigit() and raw.isascii():
+        a = int(raw[4:])
+        if a >= 1000:
+            iso = _iso(a, int(raw[2:4]), int(raw[:2]))          # DDMMYYYY primeiro (como antes)
+            if iso:
+                return iso
+            a = int(raw[:4])
+            if a >= 1000:
+                return _iso(a, int(raw[4:6]), int(raw[6:]))     # depois YYYYMMDD
+    elif len(raw) == 10:
+        achou = _AMD.fullmatch(raw)
+        if achou and raw[0] != "0":
+            a, sep, m, d = achou.groups()
+            if not _valida(int(a), int(m), int(d)):
+                return None
+            return raw if sep == "-" else f"{a}-{m}-{d}"  # já canônico: devolve a própria string
+        achou = _DMA.fullmatch(raw)
+        if achou and raw[6] != "0":
+            d, _, m, a = achou.groups()
+            return f"{a}-{m}-{d}" if _valida(int(a), int(m), int(d)) else None
+    return normalizar_data_referencia(raw)
+
+def normalizar_data(txt: str) -> str | None:
+    """
+    Converte várias entradas para ISO (AAAA-MM-DD).
+    Aceita:
+      - YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY, YYYY/MM/DD, YYYY.MM.DD
+      - 'hoje', 'amanha'/'amanhã'
+      - 8 dígitos: DDMMYYYY ou YYYYMMDD
+    Mesmo resultado de `normalizar_data_referencia` (conferido por `bench.py datas`),
+    com cache LRU das entradas literais e de 'hoje'/'amanhã' por dia.
+    """
+    global _relativas_do_dia
+    if not txt:
+        return None
+    raw = txt.strip().lower()
+    if raw in _RELATIVAS:
+        hoje = date.today()
+        dia, valores = _relativas_do_dia
+        if dia != hoje:
+            valores = {nome: (hoje + timedelta(days=n)).isoformat() for nome, n in _RELATIVAS.items()}
+            _relativas_do_dia = (hoje, valores)
+        return valores[raw]
+    return _normalizar_literal(raw)
+
+def normalizar_data_referencia(txt: str) -> str | None:
+    """Implementação original (só strptime): fallback do caminho rápido e referência do bench."""
+    if not txt:
+        return None
+    raw = txt.strip().lower()
+    if raw == "hoje":
+        return datetime.today().strftime("%Y-%m-%d")
+    if raw in ("amanha", "amanhã"):
+        return (datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+    if raw.isdigit() and len(raw) == 8:
+        for fmt in ("%d%m%Y", "%Y%m%d"):
+            try:
+                return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+        return None
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%Y.%m.%d"):
+        try:
+            return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return None
+
+def data_eh_passada(data_iso: str) -> bool:
+    """True se data for anterior a hoje."""
+    try:
+        d = datetime.strptime(data_iso, "%Y-%m-%d").date()
+        return d < datetime.today().date()
+    except Exception:
+        return True
+
+
+class Calendario:
+    """Dias/horários fechados: tabela `bloqueios` + recorrências, ambos em cache por processo."""
+
+    def __init__(self, caminho: str, intervalo: float = 0.5):
+        # invalidação cross-process via PRAGMA data_version + geracoes (ver os dois caches)
+        self.bloqueios = CacheBloqueios(caminho, intervalo=intervalo)
+        self.recorrencias = recorrencias.CacheOcorrencias(caminho, intervalo=intervalo)
+
+    def data_bloqueada(self, data_iso: str) -> tuple[bool, str | None]:
+        bloqueada, motivo = self.bloqueios.consultar(data_iso)
+        if bloqueada:
+            return bloqueada, motivo
+        return self.recorrencias.dia_bloqueado(data_iso)
+
+    def dias_bloqueados(self, inicio: str, fim: str) -> dict:
+        """{dia: motivo} no intervalo: tabela bloqueios + bloqueios de dia recorrentes."""
+        dias = {d: m for d, m in self.bloqueios.dias().items() if inicio <= d <= fim}
+        for d, ocs in self.recorrencias.intervalo_datas(inicio, fim).items():
+            for o in ocs:
+                if o.tipo == "bloqueio_dia":
+                    dias.setdefault(d, o.motivo)
+        return dias
+
+    def ocupados_recorrentes(self, data_iso: str, hora: str, duracao: int, c=None) -> set[int]:
+        """
+        Profissionais com ocorrência virtual (agendamento/bloqueio de horário) cruzando [hora, hora+duracao).
+        Com `c`, lê as regras como `c` as enxerga (chamada de dentro da transação do escritor).
+        """
+        ini = reservas.minutos(hora)
+        return {o.profissional_id for o in self.recorrencias.do_dia(data_iso, c)
+                if o.tipo != "bloqueio_dia"
+                and reservas.minutos(o.hora) < ini + duracao and ini < reservas.minutos(o.hora) + o.duracao_min}
+
+    def livre_de_recorrencias(self, final: dict, c=None) -> bool:
+        """Checagem extra de reservas.atualizar: o intervalo final não cruza ocorrência virtual."""
+        return final["profissional_id"] not in self.ocupados_recorrentes(
+            final["data"], final["hora"], final["duracao_min"], c)
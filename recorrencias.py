@@ -0,0 +1,223 @@
+# recorrencias.py
+"""
+Recorrências (cliente fixo a cada 15 dias, barbearia fechada toda segunda...):
+a regra é gravada UMA vez em `recorrencias` e expandida só para as datas
+consultadas — nada de uma linha por ocorrência em `agendamentos`.
+
+Regra no estilo RRULE, subconjunto:
+    FREQ=DAILY|WEEKLY|MONTHLY;INTERVAL=n;BYDAY=MO,WE,...;COUNT=n;UNTIL=AAAA-MM-DD
+O DTSTART é a coluna `inicio`. Datas avulsas podem ser puladas em
+`recorrencias_excecoes` (também usado ao materializar uma ocorrência).
+
+`CacheOcorrencias` guarda as ocorrências já expandidas por mês; a invalidação
+segue o mesmo esquema do cache de bloqueios (PRAGMA data_version + a linha
+`geracoes('recorrencias')`, incrementada por trigger).
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import date, timedelta
+
+TIPOS = ("agendamento", "bloqueio_slot", "bloqueio_dia")
+DIAS_RRULE = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")  # índice = date.weekday()
+MAX_COUNT = 1000
+
+Ocorrencia = namedtuple("Ocorrencia", "recorrencia_id tipo data hora duracao_min profissional_id "
+                                      "nome_cliente telefone servico motivo")
+
+
+class RegraInvalida(ValueError):
+    pass
+
+
+class Regra:
+    __slots__ = ("freq", "intervalo", "dias", "count", "ate", "dtstart")
+
+    def __init__(self, texto: str, dtstart: date):
+        partes = {}
+        for item in filter(None, (texto or "").upper().replace(" ", "").split(";")):
+            chave, _, valor = item.partition("=")
+            partes[chave] = valor
+        self.freq = partes.get("FREQ")
+        if self.freq not in ("DAILY", "WEEKLY", "MONTHLY"):
+            raise RegraInvalida("FREQ deve ser DAILY, WEEKLY ou MONTHLY.")
+        try:
+            self.intervalo = int(partes.get("INTERVAL", "1"))
+            self.count = int(partes["COUNT"]) if "COUNT" in partes else None
+            self.ate = date.fromisoformat(_iso(partes["UNTIL"])) if "UNTIL" in partes else None
+        except ValueError:
+            raise RegraInvalida("INTERVAL/COUNT/UNTIL inválidos.") from None
+        if self.intervalo < 1 or (self.count is not None and not 1 <= self.count <= MAX_COUNT):
+            raise RegraInvalida(f"INTERVAL >= 1 e COUNT entre 1 e {MAX_COUNT}.")
+        if "BYDAY" in partes:
+            if self.freq != "WEEKLY" or any(d not in DIAS_RRULE for d in partes["BYDAY"].split(",")):
+                raise RegraInvalida("BYDAY só com FREQ=WEEKLY (MO,TU,WE,TH,FR,SA,SU).")
+            self.dias = frozenset(DIAS_RRULE.index(d) for d in partes["BYDAY"].split(","))
+        else:
+            self.dias = frozenset((dtstart.weekday(),))
+        self.dtstart = dtstart
+
+    def _casa(self, d: date) -> bool:
+        delta = (d - self.dtstart).days
+        if self.freq == "DAILY":
+            return delta % self.intervalo == 0
+        if self.freq == "WEEKLY":
+            semanas = (delta + self.dtstart.weekday()) // 7  # semanas de segunda a segunda
+            return d.weekday() in self.dias and semanas % self.intervalo == 0
+        meses = (d.year - self.dtstart.year) * 12 + d.month - self.dtstart.month
+        return d.day == self.dtstart.day and meses % self.intervalo == 0
+
+    def expandir(self, inicio: date, fim: date):
+        """Ocorrências em [inicio, fim], sem olhar nada fora desse intervalo (salvo COUNT)."""
+        ultimo = min(fim, self.ate) if self.ate else fim
+        if self.count is not None:
+            # COUNT depende da contagem desde o DTSTART: enumera até a última ocorrência
+            n, d = 0, self.dtstart
+            while n < self.count and d <= ultimo:
+                if self._casa(d):
+                    n += 1
+                    if d >= inicio:
+                        yield d
+                d += timedelta(days=1)
+            return
+        d = max(inicio, self.dtstart)
+        while d <= ultimo:
+            if self._casa(d):
+                yield d
+            d += timedelta(days=1)
+
+
+def _iso(txt: str) -> str:
+    txt = txt[:10] if "-" in txt else txt[:8]
+    return txt if "-" in txt else f"{txt[:4]}-{txt[4:6]}-{txt[6:8]}"
+
+
+def _ler_regras(c: sqlite3.Connection) -> list:
+    """[(Regra, linha, excecoes)] de todas as regras, como `c` enxerga o banco."""
+    excecoes = {}
+    for rid, dia in c.execute("SELECT recorrencia_id, data FROM recorrencias_excecoes"):
+        excecoes.setdefault(rid, set()).add(dia)
+    regras = []
+    for r in c.execute("SELECT * FROM recorrencias"):
+        try:
+            regras.append((Regra(r["regra"], date.fromisoformat(r["inicio"])), dict(r),
+                           excecoes.get(r["id"], set())))
+        except (RegraInvalida, ValueError):
+            continue  # regra corrompida não derruba a agenda
+    return regras
+
+
+def _expandir(regras: list, inicio: date, fim: date) -> dict:
+    """{data_iso: [Ocorrencia]} das `regras` de inicio a fim (inclusive), sem as exceções."""
+    dias = {}
+    for regra, r, excecoes in regras:
+        for d in regra.expandir(inicio, fim):
+            iso = d.isoformat()
+            if iso in excecoes:
+                continue
+            dias.setdefault(iso, []).append(Ocorrencia(
+                r["id"], r["tipo"], iso, r["hora"], r["duracao_min"], r["profissional_id"],
+                r["nome_cliente"], r["telefone"], r["servico"], r["motivo"]))
+    return dias
+
+
+def _geracao(c: sqlite3.Connection):
+    row = c.execute("SELECT versao FROM geracoes WHERE nome = 'recorrencias'").fetchone()
+    return row[0] if row else None
+
+
+class CacheOcorrencias:
+    """Ocorrências por dia, expandidas sob demanda um mês por vez (LRU de `max_meses`)."""
+
+    def __init__(self, caminho: str, intervalo: float = 0.5, max_meses: int = 36):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.max_meses = max_meses
+        self._lock = threading.Lock()
+        self._regras = []                 # (Regra, linha, excecoes)
+        self._meses = OrderedDict()       # (ano, mes) -> {data_iso: [Ocorrencia]}
+        self._geracao = None
+        self._data_version = None
+        self._checado_em = 0.0
+        self._sentinela = None
+        self._pid = None
+
+    def _conexao(self) -> sqlite3.Connection:
+        if self._sentinela is None or self._pid != os.getpid():
+            self._sentinela = sqlite3.connect(self.caminho, timeout=10, check_same_thread=False)
+            self._sentinela.row_factory = sqlite3.Row
+            self._pid = os.getpid()
+            self._data_version = None
+        return self._sentinela
+
+    def _sincronizar(self, forcar: bool = False):
+        agora = time.monotonic()
+        if not forcar and agora - self._checado_em < self.intervalo:
+            return
+        self._checado_em = agora
+        c = self._conexao()
+        dv = c.execute("PRAGMA data_version").fetchone()[0]
+        if dv == self._data_version and not forcar:
+            return
+        self._data_version = dv
+        geracao = _geracao(c)
+        if geracao == self._geracao and not forcar:
+            return
+        self._regras = _ler_regras(c)
+        self._meses.clear()
+        self._geracao = geracao
+
+    def _mes(self, ano: int, mes: int) -> dict:
+        chave = (ano, mes)
+        if chave in self._meses:
+            self._meses.move_to_end(chave)
+            return self._meses[chave]
+        inicio = date(ano, mes, 1)
+        fim = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        dias = _expandir(self._regras, inicio, fim)
+        self._meses[chave] = dias
+        if len(self._meses) > self.max_meses:
+            self._meses.popitem(last=False)
+        return dias
+
+    def do_dia(self, data_iso: str, c: sqlite3.Connection | None = None) -> list:
+        """
+        Ocorrências de `data_iso`. Com `c` (ex.: a conexão do escritor, dentro da transação),
+        o resultado é o que `c` enxerga: se a geração de `c` não é a do cache (regra recém-gravada,
+        mesmo sem commit), o dia é expandido direto de `c`.
+        """
+        d = date.fromisoformat(data_iso)
+        geracao = _geracao(c) if c is not None else None
+        with self._lock:
+            if c is not None and geracao != self._geracao:
+                self._checado_em = 0.0  # talvez só o intervalo de checagem não venceu
+            self._sincronizar()
+            if c is None or geracao == self._geracao:
+                return list(self._mes(d.year, d.month).get(data_iso, ()))
+        return _expandir(_ler_regras(c), d, d).get(data_iso, [])
+
+    def intervalo_datas(self, inicio: str, fim: str) -> dict:
+        """{data_iso: [Ocorrencia]} de inicio a fim (inclusive)."""
+        d0, d1 = date.fromisoformat(inicio), date.fromisoformat(fim)
+        saida = {}
+        with self._lock:
+            self._sincronizar()
+            ano, mes = d0.year, d0.month
+            while (ano, mes) <= (d1.year, d1.month):
+                for iso, ocs in self._mes(ano, mes).items():
+                    if inicio <= iso <= fim:
+                        saida[iso] = list(ocs)
+                ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+        return saida
+
+    def dia_bloqueado(self, data_iso: str) -> tuple[bool, str | None]:
+        for o in self.do_dia(data_iso):
+            if o.tipo == "bloqueio_dia":
+                return True, o.motivo
+        return False, None
+
+    def invalidar(self):
+        with self._lock:
+            self._sincronizar(forcar=True)
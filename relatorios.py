@@ -0,0 +1,123 @@
+# relatorios.py
+"""
+Relatórios a partir de `daily_stats`: contagem por (data, hora, servico, status),
+mais as vagas da grade que esses itens ocupam (duração em passos da grade) e as
+cadeiras ativas de cada dia, mantida por triggers em `agendamentos`. Um intervalo
+custa O(dias); só a ocupação por hora lê os itens do intervalo (pelos índices de data).
+
+Reconstrução (backfill) a partir da tabela principal + histórico (agendamentos_todos):
+    python relatorios.py [caminho/para/barbearia.db]
+"""
+import sqlite3
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+
+from db import transacao
+from grade import DIAS_SEMANA
+from reservas import DURACAO_PADRAO, minutos
+
+AGRUPAMENTOS = ("dia", "dia_semana", "hora", "servico")
+STATUS = ("agendado", "finalizado", "cancelado", "bloqueado")
+OCUPANTES = ("agendado", "finalizado", "bloqueado")
+CADEIRAS = "cadeiras"  # status da linha de daily_stats com as cadeiras do dia (em `vagas`)
+PASSO_GRADE = DURACAO_PADRAO  # minutos entre dois horários da grade
+
+
+def sql_vagas(ref: str) -> str:
+    """Vagas da grade que um item ocupa: ceil(duracao_min / passo) (Luzes, 90 min = 3)."""
+    return f"((coalesce({ref}.duracao_min, {PASSO_GRADE}) + {PASSO_GRADE - 1}) / {PASSO_GRADE})"
+
+
+def reconstruir(c: sqlite3.Connection) -> int:
+    """Recalcula `daily_stats` inteira; devolve quantas linhas de resumo gerou."""
+    with transacao(c):
+        c.execute("DELETE FROM daily_stats WHERE status <> ?", (CADEIRAS,))  # cadeiras não se recalculam
+        cur = c.execute(f"""
+            INSERT INTO daily_stats (data, hora, servico, status, qtd, vagas)
+            SELECT data, coalesce(hora, ''), coalesce(servico, ''), coalesce(status, ''), count(*),
+                   sum({sql_vagas('agendamentos_todos')})
+              FROM agendamentos_todos
+             GROUP BY 1, 2, 3, 4""")
+        return cur.rowcount
+
+
+def agregar(c: sqlite3.Connection, inicio: str, fim: str, agrupar: str,
+            grade: tuple, dias_bloqueados, cadeiras: int = 1) -> list[dict]:
+    """
+    Contagens por status + ocupação (vagas ocupadas / slots da grade × cadeiras)
+    no intervalo, agrupadas por dia, dia da semana, hora ou serviço. Um item ocupa
+    ceil(duração / passo) vagas; por hora, cada horário da grade que o item cruza.
+    As cadeiras de cada dia são as registradas para ele (`cadeiras` só vale para dia
+    sem registro). Dias bloqueados têm capacidade zero; serviço não tem capacidade.
+    """
+    def chave(data_iso, hora, servico):
+        if agrupar == "dia":
+            return data_iso
+        if agrupar == "dia_semana":
+            return DIAS_SEMANA[date.fromisoformat(data_iso).weekday()]
+        if agrupar == "hora":
+            return hora
+        return servico or None
+
+    contagens = defaultdict(lambda: dict.fromkeys(STATUS, 0))
+    ocupadas = defaultdict(int)
+    for data_iso, hora, servico, status, qtd, vagas in c.execute("""
+            SELECT data, hora, servico, status, qtd, vagas FROM daily_stats
+             WHERE data BETWEEN ? AND ? AND qtd > 0""", (inicio, fim)):
+        k = chave(data_iso, hora, servico)
+        grupo = contagens[k]
+        grupo[status] = grupo.get(status, 0) + qtd
+        if status in OCUPANTES and agrupar != "hora":
+            ocupadas[k] += vagas
+
+    if agrupar == "hora":
+        # por item: [início, início + duração) contra cada horário da grade do dia
+        for data_iso, hora, duracao in c.execute("""
+                SELECT data, hora, duracao_min FROM agendamentos_todos
+                 WHERE data BETWEEN ? AND ? AND status IN ('agendado','finalizado','bloqueado')
+                   AND hora <> ''""", (inicio, fim)):
+            ini = minutos(hora); fim_min = ini + (duracao or PASSO_GRADE)
+            for h in grade[date.fromisoformat(data_iso).weekday()]:
+                m = minutos(h)
+                if m < fim_min and ini < m + PASSO_GRADE:
+                    ocupadas[h] += 1
+
+    # capacidade da grade no intervalo (só para agrupamentos de tempo)
+    capacidade = defaultdict(int)
+    if agrupar != "servico":
+        registradas = dict(c.execute("SELECT data, vagas FROM daily_stats "
+                                     "WHERE status = ? AND data BETWEEN ? AND ?", (CADEIRAS, inicio, fim)))
+        d, d1 = date.fromisoformat(inicio), date.fromisoformat(fim)
+        while d <= d1:
+            iso = d.isoformat()
+            horarios = () if iso in dias_bloqueados else grade[d.weekday()]
+            n = registradas.get(iso, cadeiras)
+            if agrupar == "hora":
+                for h in horarios:
+                    capacidade[h] += n
+            else:
+                capacidade[chave(iso, None, None)] += len(horarios) * n
+            d += timedelta(days=1)
+
+    saida = []
+    for k in sorted(set(contagens) | set(capacidade) | set(ocupadas), key=lambda k: (k is None, k or "")):
+        grupo = contagens.get(k) or dict.fromkeys(STATUS, 0)
+        item = {"chave": k, **grupo, "total": sum(grupo.values())}
+        if agrupar != "servico":
+            cap = capacidade.get(k, 0)
+            item["capacidade"] = cap
+            item["ocupacao"] = round(ocupadas.get(k, 0) / cap, 4) if cap else None
+        saida.append(item)
+    return saida
+
+
+if __name__ == "__main__":
+    import os
+    if len(sys.argv) > 1:
+        os.environ["BARBEARIA_DB"] = sys.argv[1]
+    import esquema
+    import nucleo
+    with nucleo.abrir_pool(tamanho=1).conexao() as conexao:
+        esquema.migrar(conexao)  # garante o schema (tabelas/triggers) no banco alvo
+        print(f"daily_stats reconstruída: {reconstruir(conexao)} linhas de resumo.")
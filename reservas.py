@@ -0,0 +1,324 @@
+# reservas.py
+"""
+Motor de reservas: cada escrita na agenda é UM statement dentro de BEGIN IMMEDIATE.
+
+- dia bloqueado: condição `NOT EXISTS (bloqueios)` no próprio INSERT/UPDATE;
+- conflito de horário: cada item ocupa o intervalo [inicio_min, fim_min) do seu
+  profissional (colunas geradas a partir de hora + duracao_min). Os intervalos
+  gravados nunca se sobrepõem, então basta olhar o ÚLTIMO que começa antes do
+  fim do novo: uma descida em `idx_ag_intervalo`, O(log n) por dia. O índice
+  único `ux_ag_slot_profissional` continua como rede de segurança.
+
+Sem check-then-insert: não há janela entre a checagem e a escrita, e um conflito
+custa uma única ida ao SQLite (IntegrityError).
+"""
+import json
+import sqlite3
+
+from db import transacao
+
+OCUPANTES = ("agendado", "bloqueado", "finalizado")  # status que seguram o slot
+STATUS_VALIDOS = ("agendado", "finalizado", "cancelado", "bloqueado")
+PROFISSIONAL_PADRAO = 1  # a cadeira que existia antes de haver profissionais
+DURACAO_PADRAO = 30      # minutos: passo da grade; itens sem serviço do catálogo e bloqueios
+
+# Colunas públicas de `agendamentos` (sem as colunas geradas de ordenação)
+COLUNAS = ("id", "nome_cliente", "telefone", "data", "hora", "servico", "status", "criado_em",
+           "profissional_id", "duracao_min", "cliente_id")
+SQL_COLUNAS = ", ".join(COLUNAS)
+
+
+class SlotOcupado(Exception):
+    """Já existe item ocupando data+hora (do profissional, ou de todos se nenhum foi escolhido)."""
+
+
+class ReservadoPorRecorrencia(SlotOcupado):
+    """O profissional pedido tem uma ocorrência recorrente (virtual) cruzando o intervalo."""
+
+
+class DiaBloqueado(Exception):
+    """O dia inteiro está bloqueado (tabela bloqueios)."""
+
+
+class NaoEncontrado(Exception):
+    """Agendamento inexistente."""
+
+
+# fim do último intervalo do profissional que começa antes de :fim (NULL se nenhum);
+# se passar de :ini, o intervalo novo [:ini, :fim) se sobrepõe a ele
+SQL_ULTIMO_FIM = """
+    (SELECT a.fim_min FROM agendamentos a
+      WHERE a.profissional_id = {prof} AND a.data = :data AND a.id IS NOT :id
+        AND a.status IN ('agendado','bloqueado','finalizado') AND a.inicio_min < :fim
+      ORDER BY a.inicio_min DESC LIMIT 1)"""
+
+# O próprio INSERT escolhe o profissional: o pedido (:prof) ou, sem ele, o primeiro
+# ativo com o intervalo livre e fora de :excluir (JSON; ocupados por recorrências).
+# Se não houver, o NOT NULL falha (IntegrityError), igual a um conflito.
+SQL_RESERVAR = f"""
+    INSERT INTO agendamentos (nome_cliente, telefone, data, hora, servico, profissional_id, duracao_min)
+    SELECT :nome, :telefone, :data, :hora, :servico, (
+             SELECT p.id FROM profissionais p
+              WHERE (p.id = :prof OR (:prof IS NULL AND p.ativo = 1))
+                AND p.id NOT IN (SELECT value FROM json_each(:excluir))
+                AND coalesce({SQL_ULTIMO_FIM.format(prof="p.id")}, 0) <= :ini
+              ORDER BY p.id LIMIT 1), :duracao
+     WHERE NOT EXISTS (SELECT 1 FROM bloqueios WHERE dia = :data)
+    RETURNING id, profissional_id"""
+
+SQL_BLOQUEAR_SLOT = f"""
+    INSERT INTO agendamentos (nome_cliente, telefone, data, hora, status, profissional_id, duracao_min)
+    SELECT 'Bloqueado', '', :data, :hora, 'bloqueado', :prof, :duracao
+     WHERE NOT EXISTS (SELECT 1 FROM agendamentos
+                        WHERE data = :data AND hora = :hora AND profissional_id = :prof
+                          AND status = 'cancelado')
+       AND coalesce({SQL_ULTIMO_FIM.format(prof=":prof")}, 0) <= :ini"""
+
+SQL_SOBREPOSTO = f"SELECT coalesce({SQL_ULTIMO_FIM.format(prof=':prof')}, 0) > :ini"
+
+
+def minutos(hora: str) -> int:
+    """"09:30" -> 570 (mesma conta das colunas geradas inicio_min/fim_min)."""
+    h, m = hora.split(":")[:2]
+    return int(h) * 60 + int(m)
+
+
+def servico_do_catalogo(c, nome: str | None) -> tuple[str | None, int] | None:
+    """(nome canônico, duração) de um serviço ativo; (None, padrão) sem serviço; None se desconhecido."""
+    if not nome:
+        return None, DURACAO_PADRAO
+    row = c.execute("SELECT nome, duracao_min FROM servicos WHERE nome = ? AND ativo = 1",
+                    (nome,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def _parametros(data, hora, duracao, prof=None, ag_id=None) -> dict:
+    ini = minutos(hora)
+    return {"data": data, "hora": hora, "duracao": duracao, "prof": prof,
+            "ini": ini, "fim": ini + duracao, "id": ag_id}
+
+
+# ---- operações sem transação própria (o chamador abre: 1 item ou lote) ----
+def _reservar(c, nome, telefone, data, hora, servico=None, profissional_id=None,
+              duracao_min=DURACAO_PADRAO, excluir=(), recorrentes=None) -> tuple[int, int]:
+    if recorrentes is not None:
+        # lido aqui, na transação: nenhuma regra nova entra entre a checagem e o INSERT
+        ocupados = recorrentes(data, hora, duracao_min, c)
+        if profissional_id in ocupados:
+            raise ReservadoPorRecorrencia(data, hora)
+        excluir = sorted(set(excluir) | ocupados)
+    try:
+        row = c.execute(SQL_RESERVAR, dict(_parametros(data, hora, duracao_min, profissional_id),
+                                           nome=nome, telefone=telefone, servico=servico,
+                                           excluir=json.dumps(list(excluir)))).fetchone()
+    except sqlite3.IntegrityError:
+        raise SlotOcupado(data, hora) from None
+    if row is None:
+        raise DiaBloqueado(data)
+    return row[0], row[1]
+
+
+def _bloquear_slot(c, data, hora, profissional_id=PROFISSIONAL_PADRAO) -> int:
+    try:
+        cur = c.execute(SQL_BLOQUEAR_SLOT, _parametros(data, hora, DURACAO_PADRAO, profissional_id))
+    except sqlite3.IntegrityError:
+        raise SlotOcupado(data, hora) from None
+    if cur.rowcount == 0:
+        raise SlotOcupado(data, hora)
+    return cur.lastrowid
+
+
+def _atualizar(c, ag_id, campos, nova_data=None, livre=None) -> tuple[dict, dict]:
+    antes = c.execute(f"SELECT {SQL_COLUNAS} FROM agendamentos WHERE id = ?", (ag_id,)).fetchone()
+    if antes is None:
+        raise NaoEncontrado(ag_id)
+    final = {**dict(antes), **campos}
+    # item sem hora (legado do CLI antigo) não ocupa intervalo
+    if final["status"] in OCUPANTES and final["hora"] and campos.keys() & {"data", "hora", "profissional_id",
+                                                         "duracao_min", "status"}:
+        if livre is not None and not livre(final, c):
+            raise SlotOcupado(ag_id)  # ocupado por algo fora da tabela (ex.: recorrência)
+        # dentro do BEGIN IMMEDIATE: ninguém escreve entre a checagem e o UPDATE
+        if c.execute(SQL_SOBREPOSTO, _parametros(final["data"], final["hora"], final["duracao_min"],
+                                                 final["profissional_id"], ag_id)).fetchone()[0]:
+            raise SlotOcupado(ag_id)
+    sets = ", ".join(f"{col} = ?" for col in campos)
+    try:
+        depois = c.execute(f"""
+            UPDATE agendamentos SET {sets}
+             WHERE id = ? AND NOT EXISTS (SELECT 1 FROM bloqueios WHERE dia = ?)
+            RETURNING {SQL_COLUNAS}""", (*campos.values(), ag_id, nova_data)).fetchone()
+    except sqlite3.IntegrityError:
+        raise SlotOcupado(ag_id) from None
+    if depois is None:
+        raise DiaBloqueado(nova_data)
+    return dict(antes), dict(depois)
+
+
+# ---- API de 1 item ----
+def reservar(c: sqlite3.Connection, nome: str, telefone: str, data: str, hora: str,
+             servico: str | None = None, profissional_id: int | None = None,
+             duracao_min: int = DURACAO_PADRAO, excluir=(), recorrentes=None) -> tuple[int, int]:
+    """
+    Cria um agendamento 'agendado' ocupando [hora, hora + duracao_min) e devolve
+    (id, profissional_id). Sem `profissional_id`, fica com o primeiro profissional
+    ativo com o intervalo livre que não esteja em `excluir`.
+    `recorrentes(data, hora, duracao_min, c)` -> set: profissionais ocupados fora da tabela
+    (recorrências), somados a `excluir`; se incluir o pedido, ReservadoPorRecorrencia.
+    """
+    with transacao(c):
+        return _reservar(c, nome, telefone, data, hora, servico, profissional_id, duracao_min, excluir,
+                         recorrentes)
+
+
+def bloquear_slot(c: sqlite3.Connection, data: str, hora: str,
+                  profissional_id: int = PROFISSIONAL_PADRAO) -> int:
+    """Bloqueia um horário. Um cancelado no slot também impede o bloqueio (regra do painel)."""
+    with transacao(c):
+        return _bloquear_slot(c, data, hora, profissional_id)
+
+
+def atualizar(c: sqlite3.Connection, ag_id: int, campos: dict,
+              nova_data: str | None = None, livre=None) -> tuple[dict, dict]:
+    """
+    Atualiza `campos` (coluna -> valor) e devolve (antes, depois).
+    Se `nova_data` vier, o UPDATE só acontece se esse dia não estiver bloqueado.
+    `livre(final, c)` -> bool: checagem extra do intervalo final (falso = SlotOcupado).
+    """
+    with transacao(c):
+        return _atualizar(c, ag_id, campos, nova_data, livre)
+
+
+# ---- Lotes: uma transação, um commit (um fsync) para N itens ----
+ERROS_DE_ITEM = (SlotOcupado, DiaBloqueado, NaoEncontrado)
+
+
+def _item_a_item(c, itens, executar) -> list:
+    """Cada item num SAVEPOINT: a falha de um não desfaz os outros."""
+    resultados = []
+    for item in itens:
+        c.execute("SAVEPOINT item")
+        try:
+            resultados.append(executar(c, item))
+        except ERROS_DE_ITEM as e:
+            c.execute("ROLLBACK TO item")
+            resultados.append(e)
+        c.execute("RELEASE item")
+    return resultados
+
+
+def _executemany(c, sql, linhas) -> bool:
+    """Caminho rápido: tudo num executemany. False se algum item falhou (nada aplicado)."""
+    c.execute("SAVEPOINT lote")
+    try:
+        cur = c.executemany(sql, linhas)
+        ok = cur.rowcount == len(linhas)
+    except sqlite3.IntegrityError:
+        ok = False
+    if not ok:
+        c.execute("ROLLBACK TO lote")
+    c.execute("RELEASE lote")
+    return ok
+
+
+def executar_lote(c: sqlite3.Connection, operacoes: list) -> list:
+    """
+    `operacoes`: ("reservar", kwargs) | ("atualizar", kwargs). Devolve, por item,
+    o resultado da operação ((id, profissional_id) ou (antes, depois)) ou a exceção de negócio.
+    Lotes só de troca de status (sem reocupar slot) vão por executemany.
+    """
+    with transacao(c):
+        so_status = operacoes and all(op == "atualizar" and set(kw["campos"]) == {"status"}
+                                      for op, kw in operacoes)
+        if so_status:
+            ids = [kw["ag_id"] for _, kw in operacoes]
+            marcas = ",".join("?" * len(ids))
+            antes = {r["id"]: dict(r) for r in
+                     c.execute(f"SELECT {SQL_COLUNAS} FROM agendamentos WHERE id IN ({marcas})", ids)}
+            # cancelado -> agendado volta a ocupar um intervalo: precisa da checagem de sobreposição
+            reocupa = any(antes.get(kw["ag_id"], {}).get("status") not in OCUPANTES
+                          and kw["campos"]["status"] in OCUPANTES for _, kw in operacoes)
+            if not reocupa and len(antes) == len(set(ids)) and len(ids) == len(set(ids)) and _executemany(
+                    c, "UPDATE agendamentos SET status = ? WHERE id = ?",
+                    [(kw["campos"]["status"], kw["ag_id"]) for _, kw in operacoes]):
+                return [(antes[i], dict(antes[i], status=kw["campos"]["status"]))
+                        for i, (_, kw) in zip(ids, operacoes)]
+
+        def executar(c, op):
+            nome, kw = op
+            return _reservar(c, **kw) if nome == "reservar" else _atualizar(c, **kw)
+        return _item_a_item(c, operacoes, executar)
+
+
+# ---- Lista de espera ----
+# quem aceita o horário, em ordem de inscrição; percorre idx_espera_aguardando.
+# A janela é gravada como "HH:MM" (grade.normalizar_hora) e a hora tem de vir no mesmo formato:
+# time(?) daria "HH:MM:SS" e uma janela terminando exatamente no slot nunca casaria.
+SQL_CANDIDATOS = """
+    SELECT id, nome_cliente, telefone, servico FROM lista_espera
+     WHERE status = 'aguardando' AND data = ?
+       AND (hora_inicio IS NULL OR hora_inicio <= ?)
+       AND (hora_fim IS NULL OR hora_fim >= ?)
+     ORDER BY id"""
+SQL_CANDIDATO = SQL_CANDIDATOS + " LIMIT 1"
+
+
+def encaixar(c: sqlite3.Connection, data: str, hora: str,
+             profissional_id: int = PROFISSIONAL_PADRAO, livre=None) -> tuple[int, dict] | None:
+    """
+    O slot (data, hora) do profissional acabou de vagar: reserva para o primeiro da lista de espera
+    que aceita esse horário E cabe nele (a duração do serviço não cruza outro item nem, via
+    `livre(final, c)`, uma recorrência). Reserva e baixa da fila na mesma transação.
+    `hora` já normalizada ("HH:MM"). Devolve (id da entrada, agendamento criado) ou None.
+    """
+    if c.execute(SQL_CANDIDATO, (data, hora, hora)).fetchone() is None:
+        return None  # fila vazia: nem pega o lock de escrita
+    with transacao(c):
+        for cand in c.execute(SQL_CANDIDATOS, (data, hora, hora)).fetchall():
+            servico = servico_do_catalogo(c, cand["servico"]) or (cand["servico"], DURACAO_PADRAO)
+            if livre is not None and not livre(dict(data=data, hora=hora, duracao_min=servico[1],
+                                                    profissional_id=profissional_id), c):
+                continue
+            try:
+                ag_id, _ = _reservar(c, cand["nome_cliente"], cand["telefone"], data, hora,
+                                     servico[0], profissional_id, servico[1])
+            except SlotOcupado:
+                continue  # não cabe (ex.: Luzes num buraco de 30 min): tenta o próximo da fila
+            except DiaBloqueado:
+                return None
+            c.execute("""UPDATE lista_espera SET status = 'atendido', agendamento_id = ?,
+                                atendido_em = CURRENT_TIMESTAMP
+                          WHERE id = ?""", (ag_id, cand["id"]))
+            return cand["id"], dict(id=ag_id, nome=cand["nome_cliente"], telefone=cand["telefone"],
+                                    data=data, hora=hora, servico=servico[0], status="agendado",
+                                    profissional_id=profissional_id, duracao_min=servico[1])
+    return None
+
+
+def bloquear_slots(c: sqlite3.Connection, slots: list[tuple[str, str, int]]) -> list:
+    """Bloqueia vários (data, hora, profissional_id); devolve por item o id ou a exceção."""
+    with transacao(c):
+        if slots and len(set(slots)) == len(slots) and _executemany(
+                c, SQL_BLOQUEAR_SLOT, [_parametros(d, h, DURACAO_PADRAO, p) for d, h, p in slots]):
+            datas = sorted({d for d, _, _ in slots})
+            marcas = ",".join("?" * len(datas))
+            ids = {(r["data"], r["hora"], r["profissional_id"]): r["id"] for r in c.execute(
+                f"""SELECT id, data, hora, profissional_id FROM agendamentos
+                     WHERE status = 'bloqueado' AND data IN ({marcas})""", datas)}
+            return [ids[s] for s in slots]
+        return _item_a_item(c, slots, lambda c, s: _bloquear_slot(c, *s))
+
+
+# ---- Recorrências ----
+def materializar(c: sqlite3.Connection, recorrencia_id: int, data: str, **dados) -> tuple[int, int]:
+    """
+    Troca a ocorrência virtual de `data` por um agendamento real: a exceção na regra
+    e a reserva (`dados` como em `reservar`) na mesma transação.
+    """
+    with transacao(c):
+        try:
+            c.execute("INSERT INTO recorrencias_excecoes (recorrencia_id, data) VALUES (?, ?)",
+                      (recorrencia_id, data))
+        except sqlite3.IntegrityError:
+            raise NaoEncontrado(recorrencia_id, data) from None  # já pulada/materializada
+        return _reservar(c, data=data, **dados)
@@ -0,0 +1,46 @@
+"""
+Fixtures da suíte: o app sobe uma vez por sessão num banco temporário
+(BARBEARIA_DB precisa estar definido antes do `import app`) e cada teste
+usa uma terça-feira própria, então os testes não enxergam os dados uns dos outros.
+"""
+import itertools
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_mod(tmp_path_factory):
+    os.environ["BARBEARIA_DB"] = str(tmp_path_factory.mktemp("db") / "barbearia.db")
+    os.environ["MANUTENCAO_TIQUE"] = "0"   # sem thread de manutenção
+    os.environ["ARQUIVO_INTERVALO"] = "0"  # sem arquivamento automático
+    import app
+    return app
+
+
+@pytest.fixture
+def cliente(app_mod):
+    return app_mod.app.test_client()
+
+
+_TERCAS = (date(2030, 1, 8) + timedelta(weeks=i) for i in itertools.count())
+
+@pytest.fixture
+def dia():
+    """Uma terça-feira futura (dia com grade) ainda não usada por outro teste."""
+    return next(_TERCAS).isoformat()
+
+
+@pytest.fixture
+def agendar(cliente, dia):
+    """agendar(hora, **campos) -> resposta do POST /agendamentos em `dia`."""
+    telefones = itertools.count(11999990000)
+
+    def _agendar(hora, **campos):
+        corpo = {"nome": "Cliente", "telefone": str(next(telefones)), "data": dia, "hora": hora}
+        return cliente.post("/agendamentos", json={**corpo, **campos})
+    return _agendar
@@ -0,0 +1,47 @@
+def test_cria_agendamento(agendar, dia):
+    resp = agendar("09:00", servico="Corte")
+    assert resp.status_code == 201
+    assert resp.get_json()["data"] == dia and resp.get_json()["status"] == "agendado"
+
+
+def test_conflito_mesmo_horario(agendar):
+    assert agendar("09:00").status_code == 201
+    resp = agendar("09:00")
+    assert resp.status_code == 409
+    assert "horário" in resp.get_json()["error"]
+
+
+def test_conflito_pela_duracao(cliente, agendar):
+    cliente.post("/servicos", json={"nome": "Luzes", "duracao_min": 90})
+    assert agendar("10:00", servico="Luzes").status_code == 201
+    assert agendar("11:00").status_code == 409  # 10:00 + 90 min cobre 11:00
+    assert agendar("11:30").status_code == 201
+
+
+def test_cancelado_libera_o_horario(cliente, agendar):
+    ag = agendar("09:00").get_json()
+    assert cliente.patch(f"/agendamentos/{ag['id']}", json={"status": "cancelado"}).status_code == 200
+    assert agendar("09:00").status_code == 201
+
+
+def test_data_bloqueada(cliente, agendar, dia):
+    assert cliente.post("/bloqueios", json={"dia": dia, "motivo": "Feriado"}).status_code == 201
+    resp = agendar("09:00")
+    assert resp.status_code == 409
+    assert "bloqueada" in resp.get_json()["error"]
+
+
+def test_recorrencia_recem_gravada_bloqueia_o_horario(app_mod, cliente, agendar, dia):
+    cliente.get("/agendamentos", query_string={"data": dia})  # aquece o cache de recorrências
+    c = app_mod.pool.dedicada()
+    try:  # grava por fora da API: o cache ainda não sabe da regra
+        c.execute("""INSERT INTO recorrencias (tipo, regra, inicio, hora, profissional_id, nome_cliente, telefone)
+                     VALUES ('agendamento', 'FREQ=WEEKLY;COUNT=1', ?, '09:00', 1, 'Fixo', '11977770000')""", (dia,))
+        c.commit()
+    finally:
+        c.close()
+
+    resp = agendar("09:00", profissional_id=1)
+    assert resp.status_code == 409
+    assert "recorrente" in resp.get_json()["error"]
+    assert agendar("09:30", profissional_id=1).status_code == 201
@@ -0,0 +1,56 @@
+def inscrever(cliente, dia, nome, telefone, **janela):
+    resp = cliente.post("/lista-espera", json={"nome": nome, "telefone": telefone, "data": dia, **janela})
+    assert resp.status_code == 201
+    return resp.get_json()
+
+
+def cancelar(cliente, ag_id):
+    assert cliente.patch(f"/agendamentos/{ag_id}", json={"status": "cancelado"}).status_code == 200
+
+
+def ocupantes(cliente, dia):
+    itens = cliente.get("/agendamentos", query_string={"data": dia, "status": "agendado"}).get_json()["items"]
+    return {item["hora"]: item["nome_cliente"] for item in itens}
+
+
+def test_vaga_liberada_vai_para_o_primeiro_da_fila(cliente, agendar, dia):
+    ag = agendar("09:00").get_json()
+    inscrever(cliente, dia, "Primeiro", "11988880001")
+    inscrever(cliente, dia, "Segundo", "11988880002")
+    cancelar(cliente, ag["id"])
+
+    assert ocupantes(cliente, dia) == {"09:00": "Primeiro"}
+    restantes = cliente.get("/lista-espera", query_string={"data": dia}).get_json()["items"]
+    assert [e["nome_cliente"] for e in restantes] == ["Segundo"]
+
+
+def test_janela_fora_do_horario_nao_e_atendida(cliente, agendar, dia):
+    ag = agendar("09:00").get_json()
+    inscrever(cliente, dia, "Tarde", "11988880003", hora_inicio="14:00", hora_fim="18:00")
+    cancelar(cliente, ag["id"])
+
+    assert ocupantes(cliente, dia) == {}
+
+
+def test_janela_terminando_no_slot_e_atendida(cliente, agendar, dia):
+    ag = agendar("09:00").get_json()
+    inscrever(cliente, dia, "Até as nove", "11988880004", hora_inicio="08:00", hora_fim="09:00")
+    cancelar(cliente, ag["id"])
+
+    assert ocupantes(cliente, dia) == {"09:00": "Até as nove"}
+
+
+def test_janela_de_um_so_horario_e_atendida(cliente, agendar, dia):
+    ag = agendar("09:00").get_json()
+    inscrever(cliente, dia, "Só as nove", "11988880005", hora_inicio="09:00", hora_fim="09:00")
+    cancelar(cliente, ag["id"])
+
+    assert ocupantes(cliente, dia) == {"09:00": "Só as nove"}
+
+
+def test_janela_terminando_antes_do_slot_nao_e_atendida(cliente, agendar, dia):
+    ag = agendar("09:30").get_json()
+    inscrever(cliente, dia, "Até as nove", "11988880006", hora_inicio="08:00", hora_fim="09:00")
+    cancelar(cliente, ag["id"])
+
+    assert ocupantes(cliente, dia) == {}
@@ -0,0 +1,41 @@
+def test_paginacao_por_cursor(cliente, agendar, dia):
+    horas = ["09:00", "09:30", "10:00", "10:30", "11:00"]
+    for hora in horas:
+        assert agendar(hora).status_code == 201
+
+    vistos, cursor = [], None
+    while True:
+        args = {"data": dia, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        corpo = cliente.get("/agendamentos", query_string=args).get_json()
+        assert len(corpo["items"]) <= 2
+        vistos += [item["hora"] for item in corpo["items"]]
+        cursor = corpo["proximo"]
+        if cursor is None:
+            break
+    assert vistos == horas
+
+
+def test_cursor_invalido(cliente, dia):
+    resp = cliente.get("/agendamentos", query_string={"data": dia, "cursor": "nao-e-cursor"})
+    assert resp.status_code == 400
+
+
+def test_limit_fora_da_faixa(cliente, dia):
+    assert cliente.get("/agendamentos", query_string={"data": dia, "limit": 0}).status_code == 400
+
+
+def test_etag_304_ate_mudar_o_dia(cliente, agendar, dia):
+    agendar("09:00")
+    primeira = cliente.get("/agendamentos", query_string={"data": dia})
+    etag = primeira.headers["ETag"]
+    assert primeira.status_code == 200 and etag
+
+    repetida = cliente.get("/agendamentos", query_string={"data": dia}, headers={"If-None-Match": etag})
+    assert repetida.status_code == 304
+    assert repetida.get_data() == b""
+
+    agendar("09:30")
+    depois = cliente.get("/agendamentos", query_string={"data": dia}, headers={"If-None-Match": etag})
+    assert depois.status_code == 200
+    assert depois.headers["ETag"] != etag
+    assert len(depois.get_json()["items"]) == 2